@@ -0,0 +1,149 @@
+"""
+Run recorded conversations through the graph without a user at the terminal.
+
+    python batch.py conversations.jsonl --output results.jsonl --workers 8
+
+Every input line is one conversation: the first message and the answers to
+give, in order, whenever the graph stops in human_node for the user:
+
+    {"id": "booking-1", "message": "Book 2 tickets for the Field Museum",
+     "answers": ["Jo Doe, jo@example.com, 2031-06-01", "yes"]}
+
+Conversations run concurrently, at most --workers at a time, each on a new
+thread. The results file gets one line per conversation, in input order, with
+the assistant messages, the nodes that ran, the latency and the number of
+LLM calls. A conversation that still waits for an answer when its answers
+run out is recorded as "unanswered".
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+
+def read_conversations(path):
+    conversations = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            conversation = json.loads(line)
+            if not isinstance(conversation.get("message"), str):
+                raise ValueError(f"{path}:{number}: a conversation needs a \"message\"")
+            conversation.setdefault("id", str(number))
+            conversation.setdefault("answers", [])
+            conversations.append(conversation)
+    return conversations
+
+
+async def run_conversation(app, conversation):
+    from conversation import new_thread_config, astream_turn
+    from helpers.recorder import RunRecorder
+
+    recorder = RunRecorder()
+    config = {**new_thread_config(), "callbacks": [recorder]}
+    answers = list(conversation["answers"])
+    turns = []
+    status = "completed"
+    error = None
+    start = time.perf_counter()
+
+    user_input = conversation["message"]
+    try:
+        while user_input is not None:
+            turn = {"input": user_input, "messages": [], "interrupt": None}
+            turn_start = time.perf_counter()
+            user_input = None
+
+            async for event in astream_turn(app, config, turn["input"]):
+                if event["type"] == "message":
+                    turn["messages"].append(event["content"])
+                elif event["type"] == "interrupt":
+                    turn["interrupt"] = event["message"]
+                    if answers:
+                        user_input = answers.pop(0)
+                    else:
+                        status = "unanswered"
+
+            turn["seconds"] = round(time.perf_counter() - turn_start, 4)
+            turns.append(turn)
+
+    except Exception as exc:
+        status = "error"
+        error = f"{type(exc).__name__}: {exc}"
+
+    return {
+        "id": conversation["id"],
+        "status": status,
+        "error": error,
+        "seconds": round(time.perf_counter() - start, 4),
+        "llm_calls": recorder.llm_calls,
+        "path": recorder.path,
+        "turns": turns,
+        "unused_answers": len(answers),
+    }
+
+
+async def run_batch(conversations, workers):
+    '''Results in the order of the conversations, at most workers running at a time'''
+    from graph import aget_app, aclose_app
+
+    app = await aget_app()
+    limit = asyncio.Semaphore(workers)
+
+    async def run_one(conversation):
+        async with limit:
+            return await run_conversation(app, conversation)
+
+    try:
+        return await asyncio.gather(*(run_one(conversation) for conversation in conversations))
+    finally:
+        await aclose_app()
+
+
+def summary(results, seconds):
+    latencies = sorted(result["seconds"] for result in results)
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+
+    lines = [f"{len(results)} conversations in {seconds:.2f} s"]
+    lines.append("  " + ", ".join(f"{status} {count}" for status, count in sorted(statuses.items())))
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        lines.append(f"  latency median {statistics.median(latencies):.2f} s, p95 {p95:.2f} s, max {latencies[-1]:.2f} s")
+        lines.append(f"  llm calls {sum(result['llm_calls'] for result in results)}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of conversations through the graph")
+    parser.add_argument("input", help="JSONL file, one conversation per line")
+    parser.add_argument("--output", default="-", help="results file, - for stdout")
+    parser.add_argument("--workers", type=int, default=4, help="conversations running at the same time")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    conversations = read_conversations(args.input)
+
+    start = time.perf_counter()
+    results = asyncio.run(run_batch(conversations, args.workers))
+    seconds = time.perf_counter() - start
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(summary(results, seconds), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import datetime
+import sqlite3
+
+from sqlalchemy import create_engine
+
+from helpers.schema import migrate
+
+MUSEUMS = [
+    ("Field Museum of Natural History", "1400 S Lake Shore Dr", "Chicago", "Illinois", "Dinosaurs, gems and ancient Egypt"),
+    ("Art Institute of Chicago", "111 S Michigan Ave", "Chicago", "Illinois", "Impressionist and modern art"),
+    ("Metropolitan Museum of Art", "1000 5th Ave", "New York", "New York", "Art from every continent and era"),
+    ("American Museum of Natural History", "200 Central Park West", "New York", "New York", "Fossils, planetarium and dioramas"),
+    ("Museum of Fine Arts", "465 Huntington Ave", "Boston", "Massachusetts", "Art of the Americas and Europe"),
+    ("Smithsonian National Air and Space Museum", "600 Independence Ave SW", "Washington", "District of Columbia", "Aircraft and spacecraft"),
+    ("Getty Center", "1200 Getty Center Dr", "Los Angeles", "California", "European paintings and gardens"),
+    ("Exploratorium", "Pier 15", "San Francisco", "California", "Hands-on science"),
+    ("Museum of Science and Industry", "5700 S DuSable Lake Shore Dr", "Chicago", "Illinois", "Trains, submarines and coal mines"),
+    ("Philadelphia Museum of Art", "2600 Benjamin Franklin Pkwy", "Philadelphia", "Pennsylvania", "Art and the Rocky steps"),
+]
+
+# Tickets every fixture museum sells per day
+MUSEUM_CAPACITY = 500
+
+# Extra generated museums so lookups scan a realistic number of rows
+GENERATED_CITIES = [
+    ("Austin", "Texas"), ("Denver", "Colorado"), ("Seattle", "Washington"), ("Miami", "Florida"),
+    ("Portland", "Oregon"), ("Atlanta", "Georgia"), ("Phoenix", "Arizona"), ("Nashville", "Tennessee"),
+]
+GENERATED_KINDS = ["History Museum", "Art Gallery", "Science Center", "Children's Museum", "Maritime Museum"]
+
+
+def museum_rows():
+    rows = list(MUSEUMS)
+    for city, state in GENERATED_CITIES:
+        for kind in GENERATED_KINDS:
+            rows.append((f"{city} {kind}", f"1 {kind} Plaza", city, state, f"The {kind.lower()} of {city}"))
+
+    return [
+        (museum_id, name, location, city, state, description,
+         f"info{museum_id}@museums.example", f"555-01{museum_id:02d}", "09:00:00", "17:00:00", MUSEUM_CAPACITY)
+        for museum_id, (name, location, city, state, description) in enumerate(rows, start=1)
+    ]
+
+
+def ticket_rows(museums, per_museum=3):
+    visit_date = datetime.date.today() + datetime.timedelta(days=30)
+    return [
+        (museum_id, f"Visitor {museum_id}-{index}", f"visitor{museum_id}.{index}@example.com",
+         index + 1, visit_date.isoformat())
+        for museum_id, *_ in museums
+        for index in range(per_museum)
+    ]
+
+
+def seed(path):
+    '''Create the schema in a fresh SQLite file with the migrations and load the fixtures'''
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        migrate(engine)
+    finally:
+        engine.dispose()
+
+    museums = museum_rows()
+    connection = sqlite3.connect(path)
+    try:
+        connection.executemany(
+            "INSERT INTO museums (museum_id, name, location, city, state, description, contact_email, "
+            "contact_number, opening_time, closing_time, capacity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            museums,
+        )
+        connection.executemany(
+            "INSERT INTO tickets (museum_id, visitor_name, visitor_email, num_tickets, visit_date) VALUES (?, ?, ?, ?, ?)",
+            ticket_rows(museums),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    return len(museums)
@@ -0,0 +1,117 @@
+"""
+Evaluate the local intent classifier.
+
+    python -m benchmarks.intent_eval                 # cross validated against the corpus labels
+    python -m benchmarks.intent_eval --llm           # agreement with Gemini and latency saved
+    python -m benchmarks.intent_eval --input queries.jsonl --threshold 0.9
+
+Input files hold one {"text": ..., "label": ...} object per line, label is
+only needed without --llm.
+"""
+import argparse
+import random
+import time
+
+from helpers.intent_classifier import (
+    IntentClassifier,
+    load_corpus,
+    get_classifier,
+    CORPUS_PATH,
+    TICKET,
+    MUSEUM,
+    OTHER,
+)
+from config.config import intent_confidence_threshold
+
+
+def _is_fast(prediction, threshold):
+    return prediction.label != OTHER and prediction.confidence >= threshold
+
+
+def _summary(title, rows, threshold):
+    fast = [row for row in rows if _is_fast(row["prediction"], threshold)]
+    agreed = [row for row in fast if row["prediction"].label == row["expected"]]
+    print(f"\n{title}")
+    print(f"  queries          {len(rows)}")
+    print(f"  fast path        {len(fast)} ({len(fast) / len(rows):.0%})")
+    print(f"  agreement        {len(agreed) / len(fast):.1%}" if fast else "  agreement        n/a")
+    for row in fast:
+        if row["prediction"].label != row["expected"]:
+            print(f"  disagrees: {row['text']!r} -> {row['prediction'].label}, expected {row['expected']}")
+    return fast
+
+
+def cross_validate(examples, threshold, folds):
+    '''Each example is classified by a model trained on the other folds'''
+    examples = examples[:]
+    random.Random(0).shuffle(examples)
+    rows = []
+    for fold in range(folds):
+        held_out = examples[fold::folds]
+        training = [example for index, example in enumerate(examples) if index % folds != fold]
+        classifier = IntentClassifier(training)
+        rows.extend(
+            {"text": text, "expected": label, "prediction": classifier.predict(text)}
+            for text, label in held_out
+        )
+    _summary(f"{folds}-fold cross validation, threshold {threshold}", rows, threshold)
+
+
+def _llm_label(text):
+    from langchain.messages import SystemMessage, HumanMessage
+    from helpers.detect_intent import DetectIntent, sys_prompt_detect_intent
+    from config.config import get_chat_model
+
+    response = get_chat_model().with_structured_output(DetectIntent).invoke([
+        SystemMessage(content=sys_prompt_detect_intent),
+        HumanMessage(content=text)
+    ])
+    if response.is_ticket:
+        return TICKET
+    if response.is_museum:
+        return MUSEUM
+    return OTHER
+
+
+def compare_with_llm(texts, threshold):
+    '''Classify every text locally and with the model, report agreement and the time saved'''
+    classifier = get_classifier()
+    rows = []
+    local_time = llm_time = 0.0
+
+    for text in texts:
+        start = time.perf_counter()
+        prediction = classifier.predict(text)
+        local_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = _llm_label(text)
+        elapsed = time.perf_counter() - start
+        llm_time += elapsed
+        rows.append({"text": text, "expected": expected, "prediction": prediction, "llm_seconds": elapsed})
+
+    fast = _summary(f"Local classifier vs LLM, threshold {threshold}", rows, threshold)
+    saved = sum(row["llm_seconds"] for row in fast)
+    print(f"  llm latency      {llm_time / len(rows) * 1000:.0f} ms per query")
+    print(f"  local latency    {local_time / len(rows) * 1000:.3f} ms per query")
+    print(f"  latency saved    {saved:.1f} s of {llm_time:.1f} s ({saved / llm_time:.0%})" if llm_time else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the fast-path intent classifier")
+    parser.add_argument("--input", default=str(CORPUS_PATH), help="JSONL file with text and label")
+    parser.add_argument("--threshold", type=float, default=intent_confidence_threshold)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--llm", action="store_true", help="compare with the LLM instead of the labels")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N queries")
+    args = parser.parse_args()
+
+    examples = load_corpus(args.input)[:args.limit]
+    if args.llm:
+        compare_with_llm([text for text, _ in examples], args.threshold)
+    else:
+        cross_validate(examples, args.threshold, args.folds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Latency of the lookups the model runs most, before and after the lookup
+index migration, on a large seeded dataset.
+
+    python -m benchmarks.lookups                                  # temporary SQLite file
+    python -m benchmarks.lookups --uri postgresql+psycopg://localhost/speaksql_bench
+    python -m benchmarks.lookups --museums 50000 --tickets 2000000 --repeat 50
+
+The database is migrated to version 1 (tables only), seeded and timed, then
+migrated to the latest version and timed again. It has to be empty: the
+benchmark refuses to seed a database that already has the tables. On
+SQLite only the tickets index applies, the trigram indexes need Postgres.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, inspect, text
+
+from helpers.schema import APP_TABLES, museums, tickets, migrate
+
+CITIES = [
+    ("Chicago", "Illinois"), ("New York", "New York"), ("Boston", "Massachusetts"), ("Austin", "Texas"),
+    ("Denver", "Colorado"), ("Seattle", "Washington"), ("Miami", "Florida"), ("Portland", "Oregon"),
+]
+KINDS = ["History Museum", "Art Gallery", "Science Center", "Children's Museum", "Maritime Museum"]
+
+_CHUNK = 10_000
+
+
+def _museum_rows(count):
+    for museum_id in range(1, count + 1):
+        city, state = CITIES[museum_id % len(CITIES)]
+        district = museum_id % 500
+        yield {
+            "museum_id": museum_id,
+            "name": f"{city} {KINDS[museum_id % len(KINDS)]} No. {museum_id}",
+            "location": f"{museum_id} Museum Row",
+            "city": f"{city} District {district}",
+            "state": state,
+        }
+
+
+def _ticket_rows(count, museum_count, days, rng):
+    start = datetime.date.today()
+    for index in range(count):
+        yield {
+            "museum_id": rng.randint(1, museum_count),
+            "visitor_name": f"Visitor {index}",
+            "visitor_email": f"visitor{index}@example.com",
+            "num_tickets": rng.randint(1, 6),
+            "visit_date": start + datetime.timedelta(days=rng.randrange(days)),
+        }
+
+
+def _insert_chunks(connection, table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == _CHUNK:
+            connection.execute(insert(table), chunk)
+            chunk = []
+    if chunk:
+        connection.execute(insert(table), chunk)
+
+
+def seed(engine, museum_count, ticket_count, days, rng):
+    with engine.begin() as connection:
+        _insert_chunks(connection, museums, _museum_rows(museum_count))
+        _insert_chunks(connection, tickets, _ticket_rows(ticket_count, museum_count, days, rng))
+
+
+def _analyze(engine):
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+
+def lookups(dialect, museum_count, days, rng):
+    '''(name, SQL, parameters) of the lookups to time, with new parameters on every call'''
+    like = "ILIKE" if dialect == "postgresql" else "LIKE"
+    museum_id = rng.randint(1, museum_count)
+    city, _ = CITIES[museum_id % len(CITIES)]
+    visit_date = datetime.date.today() + datetime.timedelta(days=rng.randrange(days))
+    return [
+        ("museum by name",
+         f"SELECT museum_id, name FROM museums WHERE name {like} :pattern LIMIT 5",
+         {"pattern": f"%no. {museum_id}%"}),
+        ("museums by city",
+         f"SELECT museum_id, name FROM museums WHERE city {like} :pattern LIMIT 10",
+         {"pattern": f"%{city.lower()} district {museum_id % 500}%"}),
+        ("tickets of a museum on a day",
+         "SELECT COALESCE(SUM(num_tickets), 0) FROM tickets WHERE museum_id = :museum_id AND visit_date = :visit_date",
+         {"museum_id": museum_id, "visit_date": visit_date}),
+    ]
+
+
+def time_lookups(engine, museum_count, days, repeat, rng):
+    '''Median milliseconds per lookup'''
+    timings = {}
+    with engine.connect() as connection:
+        for _ in range(repeat):
+            for name, sql, parameters in lookups(engine.dialect.name, museum_count, days, rng):
+                start = time.perf_counter()
+                connection.execute(text(sql), parameters).fetchall()
+                timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+    return {name: statistics.median(values) for name, values in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time museum and ticket lookups before and after the lookup indexes")
+    parser.add_argument("--uri", help="empty database to seed, a temporary SQLite file by default")
+    parser.add_argument("--museums", type=int, default=20_000, help="museums to seed")
+    parser.add_argument("--tickets", type=int, default=500_000, help="tickets to seed")
+    parser.add_argument("--days", type=int, default=365, help="visit dates the tickets are spread over")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of every lookup")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = None
+    uri = args.uri
+    if uri is None:
+        workdir = tempfile.TemporaryDirectory()
+        uri = f"sqlite:///{os.path.join(workdir.name, 'lookups.sqlite')}"
+
+    engine = create_engine(uri)
+    existing = set(inspect(engine).get_table_names()) & {table.name for table in APP_TABLES}
+    if existing:
+        parser.error(f"the database already has {', '.join(sorted(existing))}, give an empty one")
+
+    rng = random.Random(42)
+    migrate(engine, target=1)
+    start = time.perf_counter()
+    seed(engine, args.museums, args.tickets, args.days, rng)
+    print(f"seeded {args.museums} museums and {args.tickets} tickets in {time.perf_counter() - start:.1f} s ({engine.dialect.name})")
+
+    _analyze(engine)
+    before = time_lookups(engine, args.museums, args.days, args.repeat, random.Random(7))
+    migrate(engine)
+    _analyze(engine)
+    after = time_lookups(engine, args.museums, args.days, args.repeat, random.Random(7))
+
+    print(f"\n{'lookup':30s} {'before':>10s} {'after':>10s} {'speedup':>8s}")
+    for name in before:
+        print(f"{name:30s} {before[name]:8.2f} ms {after[name]:8.2f} ms {before[name] / after[name]:7.1f}x")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"dialect": engine.dialect.name, "before_ms": before, "after_ms": after}, file, indent=2)
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Offline benchmark of whole conversations. The graph runs against a seeded
+SQLite database and a scripted chat model, so no API key or Postgres is
+needed and every run takes the same path.
+
+    python -m benchmarks.run                      # every conversation once
+    python -m benchmarks.run --repeat 5 --latency 0.2
+    python -m benchmarks.run --only booking --json results.json
+
+Per conversation it reports wall time, per node latency and LLM calls, SQL
+round trips and the peak traced memory, averaged over the runs. The LLM
+response cache is off unless --llm-cache is given, so repeats reach the model.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.fixtures import seed
+
+# The canned conversations, one user input per round, later inputs answer the booking interrupts
+CONVERSATIONS = {
+    "details": ["What museums are in Chicago?"],
+    "booking": ["Book 2 tickets for the Field Museum", "Jo Doe, jo@example.com, 2031-06-01", "yes"],
+    "out_of_scope": ["What's the weather tomorrow?"],
+}
+
+
+def _offline_environment(database):
+    # must run before anything imports config.config
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    os.environ.setdefault("DATABASE_URI", f"sqlite:///{database}")
+    os.environ.setdefault("LLM_CACHE_PATH", "")
+    os.environ.setdefault("CHECKPOINT_BACKEND", "memory")
+    os.environ.setdefault("CHECKPOINT_COMPACTION_INTERVAL", "0")
+
+
+def _node_stats():
+    return {"calls": 0, "seconds": 0.0, "llm_calls": 0}
+
+
+class RoundTrips:
+    '''Counts statements sent to any database engine'''
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def run_conversation(app, inputs):
+    from conversation import new_thread_config, stream_turn
+    from helpers.recorder import RunRecorder
+
+    recorder = RunRecorder()
+    config = {**new_thread_config(), "callbacks": [recorder]}
+    rounds = 0
+    ended = False
+
+    for user_input in inputs:
+        rounds += 1
+        for event in stream_turn(app, config, user_input):
+            if event["type"] == "end":
+                ended = True
+        if ended:
+            break
+
+    return {
+        "rounds": rounds,
+        "ended": ended,
+        "llm_calls": recorder.llm_calls,
+        "nodes": recorder.nodes,
+    }
+
+
+def benchmark(name, inputs, app, round_trips, repeat):
+    runs = []
+    for _ in range(repeat):
+        tracemalloc.start()
+        round_trips.count = 0
+        start = time.perf_counter()
+        result = run_conversation(app, inputs)
+        result["seconds"] = time.perf_counter() - start
+        result["db_round_trips"] = round_trips.count
+        result["peak_memory_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+        runs.append(result)
+
+    nodes = defaultdict(_node_stats)
+    for run in runs:
+        for node, stats in run["nodes"].items():
+            for field, value in stats.items():
+                nodes[node][field] += value / repeat
+
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "conversation": name,
+        "runs": repeat,
+        "ended": all(run["ended"] for run in runs),
+        "seconds_median": statistics.median(seconds),
+        "seconds_max": max(seconds),
+        "llm_calls": statistics.mean(run["llm_calls"] for run in runs),
+        "db_round_trips": statistics.mean(run["db_round_trips"] for run in runs),
+        "peak_memory_kb": max(run["peak_memory_kb"] for run in runs),
+        "nodes": {node: dict(stats) for node, stats in nodes.items()},
+    }
+
+
+def _print(result):
+    print(f"\n{result['conversation']} ({result['runs']} runs{'' if result['ended'] else ', did not finish'})")
+    print(f"  wall time        {result['seconds_median'] * 1000:.1f} ms median, {result['seconds_max'] * 1000:.1f} ms max")
+    print(f"  llm calls        {result['llm_calls']:.1f}")
+    print(f"  db round trips   {result['db_round_trips']:.1f}")
+    print(f"  peak memory      {result['peak_memory_kb']:.0f} KiB")
+    for node, stats in sorted(result["nodes"].items(), key=lambda item: -item[1]["seconds"]):
+        print(f"  {node:<22} {stats['seconds'] * 1000:8.1f} ms  {stats['calls']:5.1f} calls  {stats['llm_calls']:5.1f} llm")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark canned conversations offline")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per conversation")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the scripted model waits per call")
+    parser.add_argument("--only", choices=sorted(CONVERSATIONS), action="append", help="conversation to run, repeatable")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM response cache of LLM_CACHE_NODES on")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if not args.llm_cache:
+        os.environ.setdefault("LLM_CACHE_NODES", "")
+
+    workdir = tempfile.TemporaryDirectory()
+    database = os.path.join(workdir.name, "museums.sqlite")
+    museums = seed(database)
+    _offline_environment(database)
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from benchmarks.scripted_model import ScriptedChatModel
+    from helpers.llm_cache import set_chat_model
+
+    model = ScriptedChatModel(latency=args.latency)
+    set_chat_model(model)
+
+    round_trips = RoundTrips()
+    event.listen(Engine, "before_cursor_execute", round_trips)
+
+    from graph import app
+
+    print(f"seeded {museums} museums into {database}")
+    results = [
+        benchmark(name, CONVERSATIONS[name], app, round_trips, args.repeat)
+        for name in args.only or CONVERSATIONS
+    ]
+    for result in results:
+        _print(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    event.remove(Engine, "before_cursor_execute", round_trips)
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import json
+import re
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_TICKETS = re.compile(r"(\d+)\s+tickets?")
+_MUSEUM_ID = re.compile(r"museum_id=(\d+)")
+_MUSEUM_NAME = re.compile(r"(?:for|at|about|in)\s+(?:the\s+)?([A-Z][\w ]+?)(?:[?.!,]|$)")
+
+
+def _text(message):
+    return str(message.content) if message is not None else ""
+
+
+def _last(messages, kind):
+    return next((message for message in reversed(messages) if isinstance(message, kind)), None)
+
+
+def _human_text(messages):
+    return " ".join(_text(message) for message in messages if isinstance(message, HumanMessage))
+
+
+def _tool_call(name, args):
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{name}_{time.monotonic_ns()}"}])
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for Gemini. It answers from the bound tools and
+    the messages so every node takes its usual path: structured outputs for
+    Safety, DetectIntent and Booking, lookups then answers for museum
+    questions, and the lookup, summary, confirm, create_booking script for
+    bookings. latency adds a fixed delay per call.
+    """
+
+    latency: float = 0.0
+    calls: int = 0
+    input_chars: int = 0
+    output_chars: int = 0
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _reply(self, messages, tools):
+        system = _text(messages[0]) if messages else ""
+
+        if "Safety" in tools:
+            return _tool_call("Safety", {"safe": True})
+        if "DetectIntent" in tools:
+            return self._intent(_text(messages[1]) if len(messages) > 1 else "")
+        if "Booking" in tools:
+            created = "Booking created" in _text(_last(messages, ToolMessage))
+            return _tool_call("Booking", {"booked": created, "answer": _text(_last(messages, AIMessage)) or "Noted."})
+        if "running summary" in system:
+            return AIMessage(content="The user asked about museums and bookings.")
+        if "create_booking" in tools:
+            return self._booking(messages)
+        if "lookup_museum" in tools:
+            return self._details(messages)
+        return AIMessage(content="I can help with museums and tickets.")
+
+    def _intent(self, text):
+        lowered = text.lower()
+        if any(word in lowered for word in ("book", "ticket", "reserve")):
+            return _tool_call("DetectIntent", {"is_ticket": True, "is_museum": False, "irrevelant": ""})
+        if any(word in lowered for word in ("museum", "exhibit", "gallery", "open")):
+            return _tool_call("DetectIntent", {"is_ticket": False, "is_museum": True, "irrevelant": ""})
+        return _tool_call("DetectIntent", {
+            "is_ticket": False,
+            "is_museum": False,
+            "irrevelant": "I can only help with museums and museum tickets. Ask me about a museum or book a visit!",
+        })
+
+    def _details(self, messages):
+        result = _last(messages, ToolMessage)
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage(content=f"Here is what I found:\n{_text(result)}")
+
+        match = _MUSEUM_NAME.search(_text(_last(messages, HumanMessage)))
+        return _tool_call("lookup_museum", {"query": match.group(1) if match else "museum", "limit": 3})
+
+    def _booking(self, messages):
+        last = messages[-1]
+        human = _human_text(messages)
+
+        if isinstance(last, ToolMessage) and "Booking" in _text(last):
+            return AIMessage(content=f"All done! {_text(last)}")
+
+        museum = _MUSEUM_ID.search(_text(_last(messages, ToolMessage)))
+        if museum is None:
+            match = _MUSEUM_NAME.search(human)
+            return _tool_call("lookup_museum", {"query": match.group(1) if match else "museum", "limit": 1})
+
+        email, date = _EMAIL.search(human), _DATE.search(human)
+        if not (email and date):
+            return AIMessage(content="Happy to help! Please share your full name, email address and visit date (YYYY-MM-DD).")
+
+        if _text(_last(messages, HumanMessage)).strip().lower() not in ("yes", "confirm", "y"):
+            return AIMessage(content=f"Please confirm: museum_id {museum.group(1)}, {email.group()} on {date.group()}. Shall I book it?")
+
+        details = next(
+            _text(message) for message in messages
+            if isinstance(message, HumanMessage) and _EMAIL.search(_text(message))
+        )
+        tickets = _TICKETS.search(human)
+        return _tool_call("create_booking", {
+            "museum_id": int(museum.group(1)),
+            "visitor_name": details.split(",")[0].strip(),
+            "visitor_email": email.group(),
+            "num_tickets": int(tickets.group(1)) if tickets else 1,
+            "visit_date": date.group(),
+        })
+
+    def _respond(self, messages, kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        tools = {tool["function"]["name"] for tool in kwargs.get("tools", [])}
+        reply = self._reply(messages, tools)
+        self.calls += 1
+        self.input_chars += sum(len(_text(message)) for message in messages)
+        self.output_chars += len(_text(reply)) + len(json.dumps(reply.tool_calls))
+        return reply
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, kwargs))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        reply = self._respond(messages, kwargs)
+        if reply.tool_calls:
+            chunks = [AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(reply.tool_calls)
+            ])]
+        else:
+            chunks = [AIMessageChunk(content=word) for word in re.findall(r"\S+\s*", _text(reply))]
+
+        for chunk in chunks:
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(_text(chunk), chunk=generation)
+            yield generation
@@ -0,0 +1,116 @@
+"""
+Import time of the entry points, measured with python -X importtime in a
+fresh interpreter per run.
+
+    python -m benchmarks.startup                       # every target, 3 runs each
+    python -m benchmarks.startup --target graph --top 15
+    python -m benchmarks.startup --budget graph=1500 --budget main=300
+
+Each target reports the median cumulative import time and its slowest
+direct and indirect imports. With --budget the exit status is 1 when a
+target takes longer than its budget in milliseconds, so CI can keep
+startup from creeping back up.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# What each entry point imports before it does any work
+TARGETS = {
+    "config": "import config.config",
+    "graph": "import graph",
+    "main": "import main",
+    "server": "import server",
+}
+
+# Budgets in milliseconds used by --budget default
+DEFAULT_BUDGETS = {"config": 150, "graph": 2000, "main": 150, "server": 1500}
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure(statement):
+    '''One interpreter start: [(module, self us, cumulative us, depth)] in import order'''
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    # importing must not need the real settings
+    env.pop("GOOGLE_API_KEY", None)
+    env.pop("DATABASE_URI", None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{statement!r} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def total_ms(rows):
+    return sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000
+
+
+def slowest(rows, top):
+    '''The top-level packages (one level under the target) that cost the most'''
+    packages = {}
+    for module, _, cumulative, depth in rows:
+        if depth <= 1:
+            packages[module] = max(packages.get(module, 0), cumulative)
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def _budgets(values):
+    budgets = {}
+    for value in values or ():
+        if value == "default":
+            budgets.update(DEFAULT_BUDGETS)
+            continue
+        target, _, milliseconds = value.partition("=")
+        budgets[target] = float(milliseconds)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the entry points")
+    parser.add_argument("--target", choices=sorted(TARGETS), action="append", help="entry point to measure, repeatable")
+    parser.add_argument("--repeat", type=int, default=3, help="interpreter starts per target")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list per target")
+    parser.add_argument("--budget", action="append", help='"target=ms", or "default" for the built-in budgets')
+    args = parser.parse_args()
+
+    budgets = _budgets(args.budget)
+    over_budget = []
+
+    for target in args.target or TARGETS:
+        runs = [measure(TARGETS[target]) for _ in range(args.repeat)]
+        median = statistics.median(total_ms(rows) for rows in runs)
+
+        budget = budgets.get(target)
+        verdict = ""
+        if budget is not None:
+            verdict = f"  budget {budget:.0f} ms, {'ok' if median <= budget else 'OVER'}"
+            if median > budget:
+                over_budget.append(target)
+
+        print(f"\n{target}: {median:.0f} ms median of {args.repeat}{verdict}")
+        for module, cumulative in slowest(runs[-1], args.top):
+            print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    if over_budget:
+        print(f"\nover budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,208 @@
 import os
+import threading
 from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
 
 load_dotenv()
 
-if "GOOGLE_API_KEY" not in os.environ:
-    raise RuntimeError("GOOGLE_API_KEY environment variable is required")
 
-if "DATABASE_URI" not in os.environ:
-    raise RuntimeError("DATABASE_URI environment variable is required")
+def _required(name):
+    if name not in os.environ:
+        raise RuntimeError(f"{name} environment variable is required")
+    return os.environ[name]
 
 
-google_model = init_chat_model(
-    temperature=0.3,
-    model_provider="google_genai",
-    model="gemini-2.5-flash",
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_mapping(name, default, cast=float):
+    '''Parse "key=value,key=value" settings'''
+    mapping = {}
+    for item in os.getenv(name, default).split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            mapping[key.strip()] = cast(value.strip())
+    return mapping
+
+
+# The model client and the database settings are resolved on first use, so
+# importing config (and with it any helper) needs neither the environment
+# variables nor the provider packages
+_chat_model = None
+_chat_model_lock = threading.Lock()
+
+
+def get_chat_model():
+    '''The Gemini chat model, built on the first call'''
+    global _chat_model
+    if _chat_model is None:
+        with _chat_model_lock:
+            if _chat_model is None:
+                _required("GOOGLE_API_KEY")
+                # importing the provider stack takes most of a second
+                from langchain.chat_models import init_chat_model
+
+                _chat_model = init_chat_model(
+                    temperature=0.3,
+                    model_provider="google_genai",
+                    model="gemini-2.5-flash",
+                    # the scheduler retries transient errors itself, client retries would multiply its attempts
+                    **({"max_retries": 0} if llm_scheduler_enabled and llm_max_retries else {}),
+                )
+    return _chat_model
+
+
+def get_db_uri():
+    return _required("DATABASE_URI")
+
+
+def _async_uri(uri):
+    '''Same database through an async driver: psycopg3 for Postgres, aiosqlite for SQLite'''
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if uri.startswith(prefix):
+            return "postgresql+psycopg://" + uri[len(prefix):]
+    if uri.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + uri[len("sqlite://"):]
+    return uri
+
+
+def get_async_db_uri():
+    return os.getenv("ASYNC_DATABASE_URI") or _async_uri(get_db_uri())
+
+
+def _libpq_uri(uri):
+    '''Postgres uri without the SQLAlchemy driver suffix, as psycopg expects it'''
+    scheme, sep, rest = uri.partition("://")
+    return scheme.split("+")[0] + sep + rest
+
+
+def get_checkpoint_postgres_uri():
+    return os.getenv("CHECKPOINT_DATABASE_URI") or _libpq_uri(get_db_uri())
+
+
+# Connection pool shared by every database tool call
+db_pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+db_pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+db_pool_pre_ping = _env_bool("DB_POOL_PRE_PING", True)
+
+# How SQL from the model is checked before running: local, llm or hybrid
+query_check_mode = os.getenv("QUERY_CHECK_MODE", "hybrid").strip().lower()
+if query_check_mode not in ("local", "llm", "hybrid"):
+    raise RuntimeError("QUERY_CHECK_MODE must be one of local, llm or hybrid")
+
+# Safety verdicts cached per query fingerprint, VERDICT_CACHE_PATH keeps them across restarts
+verdict_cache_size = int(os.getenv("VERDICT_CACHE_SIZE", "1024"))
+verdict_cache_ttl = float(os.getenv("VERDICT_CACHE_TTL", "3600"))
+verdict_cache_path = os.getenv("VERDICT_CACHE_PATH") or None
+
+# Results of read_db cached per normalized query, TTL in seconds per table
+result_cache_size = int(os.getenv("RESULT_CACHE_SIZE", "512"))
+result_cache_max_bytes = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+result_cache_default_ttl = float(os.getenv("RESULT_CACHE_DEFAULT_TTL", "60"))
+result_cache_table_ttls = _env_mapping(
+    "RESULT_CACHE_TABLE_TTLS", "museums=600,tickets=30,museum_daily_bookings=30"
+)
+
+# How query results are written into tool messages: tsv, jsonl or repr, capped in rows and bytes per tool
+tool_result_formats = _env_mapping("TOOL_RESULT_FORMATS", "read_db=tsv,write_and_update_db=tsv", cast=str)
+tool_result_max_rows = _env_mapping("TOOL_RESULT_MAX_ROWS", "read_db=50,write_and_update_db=20", cast=int)
+tool_result_max_bytes = _env_mapping("TOOL_RESULT_MAX_BYTES", "read_db=8000,write_and_update_db=4000", cast=int)
+tool_result_value_chars = int(os.getenv("TOOL_RESULT_VALUE_CHARS", "300"))
+tool_result_count_limit = int(os.getenv("TOOL_RESULT_COUNT_LIMIT", "10000"))
+tool_result_fetch_size = int(os.getenv("TOOL_RESULT_FETCH_SIZE", "100"))
+
+# Guard in front of read_db: a LIMIT is added to unbounded SELECTs, queries the planner estimates
+# above the cost or row limits are not run (Postgres EXPLAIN, cached per fingerprint for the TTL),
+# and every query runs under statement_timeout
+query_guard_enabled = _env_bool("QUERY_GUARD", True)
+query_guard_limit = int(os.getenv("QUERY_GUARD_LIMIT", "1000"))
+query_guard_max_cost = float(os.getenv("QUERY_GUARD_MAX_COST", "100000"))
+query_guard_max_rows = float(os.getenv("QUERY_GUARD_MAX_ROWS", "100000"))
+query_guard_timeout_ms = int(os.getenv("QUERY_GUARD_TIMEOUT_MS", "5000"))
+query_guard_cache_size = int(os.getenv("QUERY_GUARD_CACHE_SIZE", "1024"))
+query_guard_cache_ttl = float(os.getenv("QUERY_GUARD_CACHE_TTL", "600"))
+
+# Read-only tool calls from one model turn that may run at the same time
+tool_call_concurrency = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))
+
+# HTTP/WebSocket server (server.py)
+server_max_active_turns = int(os.getenv("SERVER_MAX_ACTIVE_TURNS", "64"))
+server_session_concurrency = int(os.getenv("SERVER_SESSION_CONCURRENCY", "1"))
+server_session_ttl = float(os.getenv("SERVER_SESSION_TTL", "1800"))
+server_turn_queue_timeout = float(os.getenv("SERVER_TURN_QUEUE_TIMEOUT", "30"))
+
+# Conversation checkpoints: memory, sqlite or postgres
+checkpoint_backend = os.getenv("CHECKPOINT_BACKEND", "memory").strip().lower()
+if checkpoint_backend not in ("memory", "sqlite", "postgres"):
+    raise RuntimeError("CHECKPOINT_BACKEND must be one of memory, sqlite or postgres")
+checkpoint_sqlite_path = os.getenv("CHECKPOINT_SQLITE_PATH", "checkpoints.sqlite")
+checkpoint_keep_last = int(os.getenv("CHECKPOINT_KEEP_LAST", "5"))
+checkpoint_thread_ttl = float(os.getenv("CHECKPOINT_THREAD_TTL", str(7 * 24 * 3600)))
+checkpoint_compaction_interval = float(os.getenv("CHECKPOINT_COMPACTION_INTERVAL", "300"))
+
+# Conversation history sent to the model: the last turns verbatim, older turns folded into a summary
+history_keep_turns = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+history_summary_enabled = _env_bool("HISTORY_SUMMARY", True)
+history_summary_every = max(int(os.getenv("HISTORY_SUMMARY_EVERY", "2")), 1)
+history_tool_result_chars = int(os.getenv("HISTORY_TOOL_RESULT_CHARS", "500"))
+history_default_budget = int(os.getenv("HISTORY_DEFAULT_BUDGET", "6000"))
+history_token_budgets = _env_mapping(
+    "HISTORY_TOKEN_BUDGETS", "detect_intent=2500,get_museum_details=6000,book_ticket=8000", cast=int
 )
 
-db_uri = os.environ["DATABASE_URI"]
\ No newline at end of file
+# Local intent classifier tried before the model, below the threshold the model decides
+intent_fast_path = _env_bool("INTENT_FAST_PATH", True)
+intent_confidence_threshold = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.95"))
+
+# In-memory museums catalogue behind the lookup_museum tool
+museum_catalog_ttl = float(os.getenv("MUSEUM_CATALOG_TTL", "600"))
+museum_catalog_min_score = float(os.getenv("MUSEUM_CATALOG_MIN_SCORE", "0.3"))
+
+# true runs the extra structured output call after the booking tool loop, as before
+booking_structured_output = _env_bool("BOOKING_STRUCTURED_OUTPUT", False)
+
+# Exact-match cache of model responses, only for the nodes listed in LLM_CACHE_NODES
+llm_cache_nodes = {
+    node.strip()
+    for node in os.getenv("LLM_CACHE_NODES", "query_check,detect_intent,history_summary").split(",")
+    if node.strip()
+}
+# unset keeps the cached responses in memory only, the SQLite file is created on first use
+llm_cache_path = os.getenv("LLM_CACHE_PATH") or None
+llm_cache_size = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+llm_cache_max_bytes = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+llm_cache_ttl = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+
+# Scheduling of the model calls: concurrency caps (0 for none), a rate limit in calls per second
+# (0 for none), retries of transient errors and coalescing of identical calls in flight
+llm_scheduler_enabled = _env_bool("LLM_SCHEDULER", True)
+llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+llm_node_concurrency = _env_mapping("LLM_NODE_CONCURRENCY", "history_summary=2", cast=int)
+llm_rate_limit = float(os.getenv("LLM_RATE_LIMIT", "0"))
+llm_rate_burst = int(os.getenv("LLM_RATE_BURST", "10"))
+llm_max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+llm_retry_base = float(os.getenv("LLM_RETRY_BASE", "0.5"))
+llm_retry_max = float(os.getenv("LLM_RETRY_MAX", "20"))
+llm_coalesce = _env_bool("LLM_COALESCE", True)
+
+# Prometheus-style metrics per node, tool, model call and SQL statement, spans need opentelemetry installed
+metrics_enabled = _env_bool("METRICS_ENABLED", True)
+metrics_max_sql_fingerprints = int(os.getenv("METRICS_MAX_SQL_FINGERPRINTS", "200"))
+otel_enabled = _env_bool("OTEL_ENABLED", False)
+
+
+_LAZY_SETTINGS = {
+    "google_model": get_chat_model,
+    "db_uri": get_db_uri,
+    "async_db_uri": get_async_db_uri,
+    "checkpoint_postgres_uri": get_checkpoint_postgres_uri,
+}
+
+
+def __getattr__(name):
+    # the settings that used to be module globals still work as attributes
+    if name in _LAZY_SETTINGS:
+        return _LAZY_SETTINGS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,130 @@
+import uuid
+
+from langchain.messages import HumanMessage, AIMessage
+from langgraph.types import Command
+
+default_question = "Enter the details asked by ai: "
+
+
+def initial_state(user_input):
+    return {
+        "messages": [
+            HumanMessage(
+                content=user_input
+            )
+        ],
+        "user_message": user_input,
+        "to_book_or_detail": False,
+        "irrevelant_question": "",
+        "user_details": [],
+        "awaiting_user_input": False
+    }
+
+
+def new_thread_config(thread_id=None):
+    '''Config for a conversation, every conversation needs its own thread_id'''
+    return {"configurable": {
+        "thread_id": thread_id or str(uuid.uuid4())
+    }}
+
+
+def interrupt_question(interrupt):
+    '''Text to show the user for a human_node interrupt'''
+    payload = getattr(interrupt, "value", interrupt)
+    if isinstance(payload, dict):
+        return payload.get("message", default_question)
+    if payload is None:
+        return default_question
+    return str(payload)
+
+
+def resume_command(interrupt, user_feedback):
+    interrupt_id = getattr(interrupt, "id", None)
+    resume_payload = {interrupt_id: user_feedback} if interrupt_id else user_feedback
+    return Command(resume=resume_payload)
+
+
+# Nodes whose model output is the answer shown to the user
+ANSWER_NODES = {"detect_intent", "get_museum_details", "book_ticket"}
+
+STREAM_MODES = ["messages", "updates"]
+
+
+def pending_interrupt(app, config):
+    '''The interrupt the thread is waiting on, None when it is not waiting'''
+    snapshot = app.get_state(config)
+    interrupts = getattr(snapshot, "interrupts", ())
+    return interrupts[0] if interrupts else None
+
+
+async def apending_interrupt(app, config):
+    snapshot = await app.aget_state(config)
+    interrupts = getattr(snapshot, "interrupts", ())
+    return interrupts[0] if interrupts else None
+
+
+def _turn_input(interrupt, user_input):
+    return resume_command(interrupt, user_input) if interrupt else initial_state(user_input)
+
+
+def _events(mode, chunk):
+    '''Turn events for one item of the stream, an interrupt or end event finishes the turn'''
+    if mode == "messages":
+        message, metadata = chunk
+        text = str(message.text) if isinstance(message, AIMessage) else ""
+        if text and metadata.get("langgraph_node") in ANSWER_NODES:
+            yield {"type": "token", "node": metadata["langgraph_node"], "content": text}
+        return
+
+    for node_id, value in chunk.items():
+        if node_id == "__interrupt__":
+            interrupt = value[0] if isinstance(value, (list, tuple)) and value else value
+            yield {"type": "interrupt", "message": interrupt_question(interrupt)}
+            return
+
+        if node_id == "end_node":
+            yield {"type": "end"}
+            return
+
+        if isinstance(value, dict) and "messages" in value:
+            messages = value["messages"]
+            if isinstance(messages, list) and messages:
+                last_message = messages[-1]
+                if last_message.__class__.__name__ == "AIMessage":
+                    yield {"type": "message", "node": node_id, "content": last_message.content}
+
+
+def stream_turn(app, config, user_input):
+    """
+    Run one user turn on the thread and yield events as they happen:
+
+        {"type": "token", "node": ..., "content": ...}    a piece of the answer while it is generated
+        {"type": "message", "node": ..., "content": ...}  the complete assistant message
+        {"type": "interrupt", "message": ...}              the graph waits for the user
+        {"type": "end"}                                    the turn is complete
+
+    When the thread is waiting on an interrupt the input resumes it,
+    otherwise it starts a new question on the same thread.
+    """
+    payload = _turn_input(pending_interrupt(app, config), user_input)
+
+    for mode, chunk in app.stream(payload, config=config, stream_mode=STREAM_MODES):
+        for event in _events(mode, chunk):
+            yield event
+            if event["type"] in ("interrupt", "end"):
+                return
+
+    yield {"type": "end"}
+
+
+async def astream_turn(app, config, user_input):
+    '''Async stream_turn, used by the server'''
+    payload = _turn_input(await apending_interrupt(app, config), user_input)
+
+    async for mode, chunk in app.astream(payload, config=config, stream_mode=STREAM_MODES):
+        for event in _events(mode, chunk):
+            yield event
+            if event["type"] in ("interrupt", "end"):
+                return
+
+    yield {"type": "end"}
@@ -0,0 +1,73 @@
+"""
+Database maintenance for the application tables.
+
+    python db.py migrate             # apply the pending migrations
+    python db.py migrate --target 1  # apply them up to version 1
+    python db.py status              # applied and pending migrations
+    python db.py schema              # the schema text given to the model
+    python db.py rebuild-daily-bookings
+
+rebuild-daily-bookings recounts museum_daily_bookings from the tickets, for
+a backfill or after tickets were written with the triggers disabled. Every
+command but schema works on DATABASE_URI.
+"""
+import argparse
+
+
+def _engine():
+    from config.config import get_db_uri
+    from helpers.get_db import get_engine
+
+    return get_engine(get_db_uri())
+
+
+def migrate_command(args):
+    from helpers.schema import migrate
+
+    applied = migrate(_engine(), args.target)
+    print(f"applied {', '.join(map(str, applied))}" if applied else "nothing to apply")
+
+
+def status_command(args):
+    from helpers.schema import MIGRATIONS, current_version
+
+    version = current_version(_engine())
+    for migration in MIGRATIONS:
+        state = "applied" if migration.version <= version else "pending"
+        print(f"{migration.version:4d}  {state:8s} {migration.name}")
+
+
+def rebuild_command(args):
+    from helpers.schema import rebuild_daily_bookings
+
+    with _engine().begin() as connection:
+        days = rebuild_daily_bookings(connection)
+    print(f"recounted {days} museum days")
+
+
+def schema_command(args):
+    from helpers.schema import prompt_schema
+
+    print(prompt_schema())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the museums and tickets tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="apply the pending migrations")
+    migrate_parser.add_argument("--target", type=int, help="last version to apply, the latest by default")
+    migrate_parser.set_defaults(run=migrate_command)
+
+    commands.add_parser("status", help="list the migrations and whether they are applied").set_defaults(run=status_command)
+    commands.add_parser("schema", help="print the schema text of the system prompts").set_defaults(run=schema_command)
+    commands.add_parser(
+        "rebuild-daily-bookings", help="recount the booked tickets per museum and day"
+    ).set_defaults(run=rebuild_command)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,35 @@
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.runnables import RunnableLambda
+import asyncio
 import uuid
 
 from state import MessagesState
-from helpers.detect_intent import detect_intent
+from helpers.detect_intent import detect_intent, adetect_intent
 from helpers.route_query import routeQuery
-from helpers.get_museum_details import get_museum_details
-from helpers.book_ticket import book_ticket
+from helpers.get_museum_details import get_museum_details, aget_museum_details
+from helpers.book_ticket import book_ticket, abook_ticket
 from helpers.user_details import human_node
 from helpers.end_message import end_node
+from helpers.checkpointer import build_checkpointer, abuild_checkpointer, aclose_checkpointer, start_compaction
+from helpers.metrics import instrument_node
 
 # Build the workflow
 agent_builder = StateGraph(MessagesState)
 
-# Add nodes
-agent_builder.add_node("detect_intent", detect_intent)
-agent_builder.add_node("get_museum_details", get_museum_details)
-agent_builder.add_node("book_ticket", book_ticket)
-agent_builder.add_node("human_node", human_node)
-agent_builder.add_node("end_node", end_node)
+def node(name, func, afunc=None):
+    '''Node runnable that records its wall time under name'''
+    if afunc is None:
+        return instrument_node(name, func)
+    return RunnableLambda(instrument_node(name, func), afunc=instrument_node(name, afunc), name=name)
+
+# Add nodes, the ones calling the model or the db have an async version
+# so the compiled app works with both stream and astream
+agent_builder.add_node("detect_intent", node("detect_intent", detect_intent, adetect_intent))
+agent_builder.add_node("get_museum_details", node("get_museum_details", get_museum_details, aget_museum_details))
+agent_builder.add_node("book_ticket", node("book_ticket", book_ticket, abook_ticket))
+agent_builder.add_node("human_node", node("human_node", human_node))
+agent_builder.add_node("end_node", node("end_node", end_node))
 
 agent_builder.set_entry_point("detect_intent")
 
@@ -38,9 +49,36 @@ agent_builder.add_edge("end_node", END)
 
 agent_builder.set_finish_point("end_node")
 
-# Enable Interrupt mechanism
-checkpointer = MemorySaver()
+# Enable Interrupt mechanism, the backend comes from CHECKPOINT_BACKEND
+checkpointer = build_checkpointer()
 app = agent_builder.compile(checkpointer=checkpointer)
+compaction = start_compaction(checkpointer)
+
+_async_app = None
+_async_app_lock = asyncio.Lock()
+
+async def aget_app():
+    """
+    Compiled app for astream callers. The SQLite and Postgres savers have
+    separate async implementations that must be created inside the running
+    event loop, the in-memory saver serves both.
+    """
+    global _async_app
+    async with _async_app_lock:
+        if _async_app is None:
+            if isinstance(checkpointer, MemorySaver):
+                _async_app = app
+            else:
+                _async_app = agent_builder.compile(checkpointer=await abuild_checkpointer())
+    return _async_app
+
+async def aclose_app():
+    '''Release the async checkpointer connections, called on server shutdown'''
+    global _async_app
+    async with _async_app_lock:
+        if _async_app is not None and _async_app is not app:
+            await aclose_checkpointer(_async_app.checkpointer)
+        _async_app = None
 
 thread_config = {"configurable": {
     "thread_id": uuid.uuid4()
@@ -1,46 +1,37 @@
-from langchain.messages import AIMessage
+from langchain.messages import AIMessage, ToolMessage
 from pydantic import BaseModel, Field
 from langgraph.types import Command
-from langchain.messages import SystemMessage, ToolMessage
+from langgraph.constants import TAG_NOSTREAM
 
 from state import MessagesState
 from tools.read_db import read_db
 from tools.write_db import write_and_update_db
-from config.config import google_model
+from tools.lookup_museum import lookup_museum
+from tools.check_availability import check_availability
+from tools.create_booking import create_booking
+from tools.create_bookings import create_bookings
+from helpers.bookings import BOOKING_CREATED, BOOKINGS_CREATED
+from helpers.tool_runner import run_tool_calls, arun_tool_calls
+from helpers.history import build_messages, abuild_messages, trim_tool_results
+from helpers.llm_cache import model_for
+from helpers.metrics import record_tool_loop
+from helpers.schema import prompt_schema
+from config.config import booking_structured_output
 
 sys_prompt_book_ticket = '''
 You are a friendly and efficient museum ticket booking assistant. Your role is to help users book museum tickets smoothly while ensuring all necessary information is collected accurately.
 
 **Database Schema:**
 
-CREATE TABLE museums (
-    museum_id SERIAL PRIMARY KEY,
-    name VARCHAR(100) NOT NULL,
-    location VARCHAR(150) NOT NULL,
-    city VARCHAR(100),
-    state VARCHAR(100),
-    description TEXT,
-    contact_email VARCHAR(100),
-    contact_number VARCHAR(20),
-    opening_time TIME,
-    closing_time TIME
-);
-
-CREATE TABLE tickets (
-    ticket_id SERIAL PRIMARY KEY,
-    museum_id INT REFERENCES museums(museum_id) ON DELETE CASCADE,
-    visitor_name VARCHAR(100) NOT NULL,
-    visitor_email VARCHAR(100),
-    num_tickets INT CHECK (num_tickets > 0),
-    total_price DECIMAL(10,2),
-    booking_date DATE DEFAULT CURRENT_DATE,
-    visit_date DATE NOT NULL,
-    status VARCHAR(20) DEFAULT 'BOOKED'
-);
+''' + prompt_schema() + '''
 
 **Available Tools:**
-1. **read_db**: Query database for museum information, availability, pricing, and existing bookings
-2. **write_and_update_db**: Create or modify ticket reservations (use with caution - only after explicit user confirmation)
+1. **lookup_museum**: Find a museum by name, city or state (tolerates typos) and get its museum_id, hours and contact details
+2. **check_availability**: Get the tickets booked and still available for a museum on a visit date
+3. **read_db**: Query database for pricing, existing bookings and anything the other tools do not cover
+4. **create_booking**: Create a confirmed booking from its fields (only after explicit user confirmation)
+5. **create_bookings**: Create several confirmed bookings at once for a group or school visit, all in one call (only after explicit user confirmation)
+6. **write_and_update_db**: Modify existing ticket reservations (use with caution - only after explicit user confirmation). It does not create bookings, new tickets only come from create_booking and create_bookings
 
 **Booking Workflow - Follow These Steps:**
 
@@ -63,10 +54,11 @@ If ANY required field is missing:
 
 **Step 2: Verify Museum and Availability**
 Before proceeding:
-1. Use read_db to verify the museum exists and get its museum_id
+1. Use lookup_museum to verify the museum exists and get its museum_id
 2. Check if the museum is open on the requested visit date
 3. Validate the visit date is in the future (not in the past)
-4. If the user provides a museum name, use: `SELECT museum_id, name, opening_time, closing_time FROM museums WHERE name ILIKE '%{museum_name}%' LIMIT 3;`
+4. Call check_availability for the museum and date, if fewer tickets are left than requested tell the user and suggest another date
+5. If the user provides a museum name, call lookup_museum with it instead of querying the museums table
 
 **Step 3: Present Booking Summary**
 Once you have all required information and verified availability:
@@ -84,18 +76,16 @@ Once you have all required information and verified availability:
   Would you like to confirm this booking?"
 
 **Step 4: Confirmation Required**
-- CRITICAL: Do NOT call write_and_update_db until the user explicitly confirms
+- CRITICAL: Do NOT call create_booking or write_and_update_db until the user explicitly confirms
 - Wait for clear confirmation (e.g., "yes", "confirm", "proceed", "book it")
 - If user declines or wants to modify, acknowledge and ask what they'd like to change
 
 **Step 5: Execute Booking**
 After confirmation:
-1. Call write_and_update_db with an INSERT query:
-   ```sql
-   INSERT INTO tickets (museum_id, visitor_name, visitor_email, num_tickets, visit_date, total_price, status)
-   VALUES ({museum_id}, '{name}', '{email}', {num_tickets}, '{visit_date}', {price}, 'BOOKED')
-   RETURNING ticket_id;
-   ```
+1. Call create_booking with museum_id, visitor_name, visitor_email, num_tickets and visit_date.
+   Do not write an INSERT yourself. If it answers "Booking not created", explain the problem and ask the user to correct it
+   For a group that needs one booking per visitor or sub-group, call create_bookings once with the whole list
+   instead of create_booking per booking. Nothing is written if any booking is invalid
 2. Capture the returned ticket_id
 3. Provide a complete confirmation message with:
    - Booking confirmation with ticket_id
@@ -103,40 +93,30 @@ After confirmation:
    - Next steps (e.g., "You'll receive a confirmation email at [email]")
    - Any relevant instructions
 
-**Response Object Guidelines:**
-- Set `booked=True` ONLY when write_and_update_db successfully executes
-- Set `booked=False` for:
-  - Requesting missing information
-  - Presenting booking summary and asking for confirmation
-  - User declining the booking
-  - Any error or validation failure
-- The `answer` field should always contain a helpful, conversational message
-
 **Example Interaction Flows:**
 
 *Flow 1 - Complete Information Provided:*
 User: "Book 2 tickets for Museum of Art on 2025-11-15, John Doe, john@email.com"
-→ Verify museum exists (read_db)
+→ Verify museum exists (lookup_museum)
+→ Check tickets are left on 2025-11-15 (check_availability)
 → Present summary and ask for confirmation
 → User confirms
-→ Execute booking (write_and_update_db)
-→ Return {booked: true, answer: "Booking confirmed! Your ticket ID is #12345..."}
+→ Execute booking (create_booking)
+→ Reply: "Booking confirmed! Your ticket ID is #12345..."
 
 *Flow 2 - Missing Information:*
 User: "I want to visit the science museum"
-→ Return {booked: false, answer: "I'd love to help book your tickets! Could you provide: your full name, email address, number of tickets, and preferred visit date?"}
+→ Reply: "I'd love to help book your tickets! Could you provide: your full name, email address, number of tickets, and preferred visit date?"
 
 *Flow 3 - User Declines:*
 User provides info → Summary presented → User: "Actually, cancel that"
-→ Return {booked: false, answer: "No problem! Your booking has not been completed. Let me know if you'd like to make a different reservation or if you have any questions."}
+→ Reply: "No problem! Your booking has not been completed. Let me know if you'd like to make a different reservation or if you have any questions."
 
 **Important Safety Rules:**
 - Always use parameterized queries or proper escaping to prevent SQL injection
-- Validate email format before inserting
-- Validate date format (YYYY-MM-DD) and ensure it's not in the past
-- Ensure num_tickets is a positive integer
+- create_booking validates the email, the date (YYYY-MM-DD, not in the past) and num_tickets, relay its errors to the user
 - Never modify or delete existing bookings without explicit user request
-- If write_and_update_db fails, explain the error clearly and offer solutions
+- If create_booking or write_and_update_db fails, explain the error clearly and offer solutions
 
 **Tone and Style:**
 - Be warm, professional, and helpful
@@ -146,60 +126,145 @@ User provides info → Summary presented → User: "Actually, cancel that"
 - Thank users for choosing to visit the museum
 '''
 
+# Added to the prompt when the reply is a Booking object from the structured output pass
+sys_prompt_structured_reply = '''
+**Response Object Guidelines:**
+Return the reply as a {booked, answer} object:
+- Set `booked=True` ONLY when create_booking or create_bookings successfully creates the booking
+- Set `booked=False` for:
+  - Requesting missing information
+  - Presenting booking summary and asking for confirmation
+  - User declining the booking
+  - Any error or validation failure
+- The `answer` field should always contain a helpful, conversational message, the reply from the flows above
+'''
+
+# Added to the prompt when the last tool loop reply is shown to the user as is
+sys_prompt_plain_reply = '''
+**Replying:**
+Answer the user directly in plain text, do not return a {booked, answer} object.
+Whether the booking is complete is read from the create_booking result.
+'''
+
 class Booking(BaseModel):
     '''Booking tickets with user input for ticket details'''
     booked: bool = Field(..., description="True if tickets are successfully booked, False if still need info or awaiting confirmation")
     answer: str = Field(..., description="Response message to show to user (requests for info, booking confirmation, etc)")
 
-def book_ticket(state: MessagesState):
-    model_with_tools = google_model.bind_tools([read_db, write_and_update_db])
-    tool_registry = {
-        read_db.name: read_db,
-        write_and_update_db.name: write_and_update_db,
+tools = [lookup_museum, check_availability, read_db, create_booking, create_bookings, write_and_update_db]
+tool_registry = {tool.name: tool for tool in tools}
+
+def _booking_result(response: Booking, update, message_id=None):
+    # a reply that was already streamed keeps its id so it is not sent twice
+    if response.booked:
+        return Command(
+            update={
+                **update,
+                "messages": [AIMessage(content=response.answer, id=message_id)],
+                "awaiting_user_input": False
+            },
+            goto="end_node"
+        )
+
+    return Command(
+        update={
+            **update,
+            "messages": [AIMessage(content=response.answer, id=message_id)],
+            "awaiting_user_input": True
+        },
+        goto="human_node"
+    )
+
+def _tool_loop_model():
+    model_with_tools = model_for("book_ticket").bind_tools(tools)
+    if booking_structured_output:
+        # the reply shown to the user comes from the Booking call, the loop's own text must not stream
+        return model_with_tools.with_config(tags=[TAG_NOSTREAM])
+    return model_with_tools
+
+def _booking_prompt():
+    if booking_structured_output:
+        return sys_prompt_book_ticket + sys_prompt_structured_reply
+    return sys_prompt_book_ticket + sys_prompt_plain_reply
+
+def _created_booking(messages):
+    '''True when a create_booking or create_bookings call in messages succeeded'''
+    booking_calls = {
+        tool_call["id"]
+        for message in messages if isinstance(message, AIMessage)
+        for tool_call in message.tool_calls if tool_call["name"] in (create_booking.name, create_bookings.name)
     }
+    return any(
+        isinstance(message, ToolMessage)
+        and message.tool_call_id in booking_calls
+        and message.content.startswith((BOOKING_CREATED, BOOKINGS_CREATED))
+        for message in messages
+    )
+
+def _final_booking(response, loop_messages):
+    """
+    The Booking for the turn without another model call: the last reply is
+    the answer and booked comes from the create_booking result. None when the
+    reply has no text and the structured output pass is needed.
+    """
+    answer = str(response.text).strip()
+    if booking_structured_output or not answer:
+        return None
 
-    system_message = SystemMessage(content=sys_prompt_book_ticket)
-    conversation = state["messages"]
+    return Booking(booked=_created_booking(loop_messages), answer=answer)
 
-    current_messages = [system_message] + conversation
+def book_ticket(state: MessagesState):
+    model_with_tools = _tool_loop_model()
+
+    current_messages, update = build_messages("book_ticket", state, _booking_prompt())
+    first_loop_message = len(current_messages)
 
+    iterations = 0
     while True:
         resp_tool_call = model_with_tools.invoke(current_messages)
+        iterations += 1
 
         if not resp_tool_call.tool_calls:
             break
 
         current_messages.append(resp_tool_call)
+        current_messages.extend(run_tool_calls(resp_tool_call.tool_calls, tool_registry))
+        trim_tool_results(current_messages)
 
-        for tool_call in resp_tool_call.tool_calls:
-            tool = tool_registry.get(tool_call.get("name"))
-            if not tool:
-                continue
+    record_tool_loop("book_ticket", iterations)
+    response = _final_booking(resp_tool_call, current_messages[first_loop_message:])
+    if response is not None:
+        return _booking_result(response, update, resp_tool_call.id)
 
-            tool_result = tool.invoke(tool_call["args"])
-            current_messages.append(
-               ToolMessage(
-                  content=str(tool_result),
-                  tool_call_id=tool_call["id"]
-               )
-            )
-
-    model_with_structure = google_model.with_structured_output(Booking)
+    model_with_structure = model_for("book_ticket").with_structured_output(Booking).with_config(tags=[TAG_NOSTREAM])
     response = model_with_structure.invoke(current_messages)
 
-    if response.booked:
-        return Command(
-            update={
-                "messages": [AIMessage(content=response.answer)],
-                "awaiting_user_input": False
-            },
-            goto="end_node"
-        )
+    return _booking_result(response, update)
 
-    return Command(
-        update={
-            "messages": [AIMessage(content=response.answer)],
-            "awaiting_user_input": True
-        },
-        goto="human_node"
-    )
+async def abook_ticket(state: MessagesState):
+    model_with_tools = _tool_loop_model()
+
+    current_messages, update = await abuild_messages("book_ticket", state, _booking_prompt())
+    first_loop_message = len(current_messages)
+
+    iterations = 0
+    while True:
+        resp_tool_call = await model_with_tools.ainvoke(current_messages)
+        iterations += 1
+
+        if not resp_tool_call.tool_calls:
+            break
+
+        current_messages.append(resp_tool_call)
+        current_messages.extend(await arun_tool_calls(resp_tool_call.tool_calls, tool_registry))
+        trim_tool_results(current_messages)
+
+    record_tool_loop("book_ticket", iterations)
+    response = _final_booking(resp_tool_call, current_messages[first_loop_message:])
+    if response is not None:
+        return _booking_result(response, update, resp_tool_call.id)
+
+    model_with_structure = model_for("book_ticket").with_structured_output(Booking).with_config(tags=[TAG_NOSTREAM])
+    response = await model_with_structure.ainvoke(current_messages)
+
+    return _booking_result(response, update)
@@ -0,0 +1,322 @@
+import datetime
+import re
+from collections import defaultdict
+
+from sqlalchemy import insert, select, and_, func, tuple_
+
+from helpers.get_db import get_engine, get_async_engine
+from helpers.museum_catalog import museum_catalog
+from helpers.prepared_statements import statement
+from helpers.result_cache import result_cache
+from helpers.schema import tickets as tickets_table, museums, museum_daily_bookings
+from config.config import get_db_uri, get_async_db_uri
+
+# Largest booking one call may create
+MAX_TICKETS = 50
+
+# Most bookings one group booking may hold
+MAX_GROUP_BOOKINGS = 200
+
+# Start of the create_booking and create_bookings results when the bookings were written
+BOOKING_CREATED = "Booking created:"
+BOOKINGS_CREATED = "Bookings created:"
+
+# The columns a booking writes, for the batched insert of group bookings
+_BOOKING_COLUMNS = ("museum_id", "visitor_name", "visitor_email", "num_tickets", "visit_date")
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class BookingError(ValueError):
+    '''The booking details are invalid, the message lists every problem'''
+
+
+def _check_fields(visitor_name, visitor_email, num_tickets, visit_date, today=None):
+    errors = []
+    visitor_name = str(visitor_name or "").strip()
+    visitor_email = str(visitor_email or "").strip()
+
+    if not visitor_name:
+        errors.append("visitor_name is required")
+    elif len(visitor_name) > 100:
+        errors.append("visitor_name must be at most 100 characters")
+
+    if not _EMAIL.match(visitor_email) or len(visitor_email) > 100:
+        errors.append(f"visitor_email {visitor_email!r} is not a valid email address")
+
+    if not isinstance(num_tickets, int) or isinstance(num_tickets, bool) or not 0 < num_tickets <= MAX_TICKETS:
+        errors.append(f"num_tickets must be a whole number between 1 and {MAX_TICKETS}")
+
+    try:
+        visit_date = datetime.date.fromisoformat(str(visit_date))
+    except ValueError:
+        errors.append(f"visit_date {visit_date!r} must be in YYYY-MM-DD format")
+    else:
+        if visit_date < (today or datetime.date.today()):
+            errors.append(f"visit_date {visit_date} is in the past")
+
+    return errors, {
+        "visitor_name": visitor_name,
+        "visitor_email": visitor_email,
+        "num_tickets": num_tickets,
+        "visit_date": visit_date,
+    }
+
+
+def _validated(museum, museum_id, visitor_name, visitor_email, num_tickets, visit_date):
+    errors, booking = _check_fields(visitor_name, visitor_email, num_tickets, visit_date)
+    if museum is None:
+        errors.insert(0, f"there is no museum with museum_id {museum_id}")
+    if errors:
+        raise BookingError("; ".join(errors))
+    return {"museum_id": museum_id, **booking}
+
+
+def _check_capacity(connection, bookings):
+    """
+    Raise BookingError when the bookings just inserted took a museum day past
+    its capacity, the caller's transaction then rolls them back. The insert
+    trigger has already added them to museum_daily_bookings and holds that row
+    until the commit, so concurrent bookings of the same day are counted one
+    after the other and cannot overbook it together.
+    """
+    requested = defaultdict(int)
+    for booking in bookings:
+        requested[(booking["museum_id"], booking["visit_date"])] += booking["num_tickets"]
+
+    daily = museum_daily_bookings
+    rows = connection.execute(
+        select(museums.c.name, daily.c.museum_id, daily.c.visit_date, museums.c.capacity, daily.c.booked_tickets)
+        .join_from(daily, museums, daily.c.museum_id == museums.c.museum_id)
+        .where(
+            tuple_(daily.c.museum_id, daily.c.visit_date).in_(list(requested)),
+            museums.c.capacity.is_not(None),
+            daily.c.booked_tickets > museums.c.capacity,
+        )
+    ).all()
+    if rows:
+        raise BookingError("; ".join(
+            f"{name} (museum_id={museum_id}) has {max(capacity - booked + requested[(museum_id, visit_date)], 0)} "
+            f"of {capacity} tickets left on {visit_date}, {requested[(museum_id, visit_date)]} requested"
+            for name, museum_id, visit_date, capacity, booked in rows
+        ))
+
+
+def _insert(connection, booking):
+    result = connection.execute(statement("create_booking", connection.dialect), booking)
+    ticket_id = result.scalar_one()
+    _check_capacity(connection, [booking])
+    return ticket_id
+
+
+def insert_booking(museum_id, visitor_name, visitor_email, num_tickets, visit_date):
+    """
+    Validate the booking and insert it. Returns the booking with its
+    ticket_id, raises BookingError when a field is invalid or the museum has
+    fewer tickets left on the day.
+    """
+    museum = museum_catalog.get(museum_id)
+    if museum is None:
+        # the museum may have been added since the catalogue was loaded
+        museum_catalog.invalidate()
+        museum = museum_catalog.get(museum_id)
+    booking = _validated(museum, museum_id, visitor_name, visitor_email, num_tickets, visit_date)
+
+    with get_engine(get_db_uri()).begin() as connection:
+        ticket_id = _insert(connection, booking)
+
+    result_cache.invalidate_tables({"tickets"})
+    return {"ticket_id": ticket_id, "museum": museum["name"], **booking}
+
+
+async def ainsert_booking(museum_id, visitor_name, visitor_email, num_tickets, visit_date):
+    museum = await museum_catalog.aget(museum_id)
+    if museum is None:
+        museum_catalog.invalidate()
+        museum = await museum_catalog.aget(museum_id)
+    booking = _validated(museum, museum_id, visitor_name, visitor_email, num_tickets, visit_date)
+
+    async with get_async_engine(get_async_db_uri()).begin() as connection:
+        ticket_id = await connection.run_sync(_insert, booking)
+
+    result_cache.invalidate_tables({"tickets"})
+    return {"ticket_id": ticket_id, "museum": museum["name"], **booking}
+
+
+def _validated_group(bookings, museums):
+    if not bookings:
+        raise BookingError("bookings must hold at least one booking")
+    if len(bookings) > MAX_GROUP_BOOKINGS:
+        raise BookingError(f"at most {MAX_GROUP_BOOKINGS} bookings can be created at once, got {len(bookings)}")
+
+    validated, errors = [], []
+    for number, booking in enumerate(bookings, start=1):
+        try:
+            validated.append(_validated(
+                museums.get(booking.get("museum_id")),
+                booking.get("museum_id"),
+                booking.get("visitor_name"),
+                booking.get("visitor_email"),
+                booking.get("num_tickets"),
+                booking.get("visit_date"),
+            ))
+        except BookingError as exc:
+            errors.append(f"booking {number}: {exc}")
+    if errors:
+        raise BookingError("; ".join(errors))
+    return validated
+
+
+def _insert_many(connection, bookings):
+    """
+    One multi-row INSERT ... RETURNING for all bookings (SQLAlchemy batches
+    very large groups). The returned rows come back in no guaranteed order,
+    they are matched to the bookings by their columns.
+    """
+    columns = [tickets_table.c[name] for name in _BOOKING_COLUMNS]
+    result = connection.execute(
+        insert(tickets_table).returning(tickets_table.c.ticket_id, *columns),
+        [{**booking, "status": "BOOKED"} for booking in bookings],
+    )
+
+    rows = result.all()
+    _check_capacity(connection, bookings)
+    ticket_ids = defaultdict(list)
+    for row in rows:
+        ticket_ids[tuple(row[1:])].append(row[0])
+    try:
+        return [ticket_ids[tuple(booking[name] for name in _BOOKING_COLUMNS)].pop(0) for booking in bookings]
+    except IndexError:
+        # the database changed a value on the way in, fall back to the order of the rows
+        return [row[0] for row in rows]
+
+
+def _museum_ids(bookings):
+    return {booking.get("museum_id") for booking in bookings}
+
+
+def insert_bookings(bookings):
+    """
+    Validate every booking (dicts with the insert_booking fields) and insert
+    them in one transaction. Nothing is written when any booking is invalid or
+    a museum day would go past its capacity, the BookingError lists the
+    problems.
+    Returns the bookings with their ticket_ids, in the given order.
+    """
+    museums = {museum_id: museum_catalog.get(museum_id) for museum_id in _museum_ids(bookings)}
+    if None in museums.values():
+        museum_catalog.invalidate()
+        museums = {museum_id: museum_catalog.get(museum_id) for museum_id in museums}
+    validated = _validated_group(bookings, museums)
+
+    with get_engine(get_db_uri()).begin() as connection:
+        ticket_ids = _insert_many(connection, validated)
+
+    result_cache.invalidate_tables({"tickets"})
+    return [
+        {"ticket_id": ticket_id, "museum": museums[booking["museum_id"]]["name"], **booking}
+        for ticket_id, booking in zip(ticket_ids, validated)
+    ]
+
+
+async def ainsert_bookings(bookings):
+    museums = {museum_id: await museum_catalog.aget(museum_id) for museum_id in _museum_ids(bookings)}
+    if None in museums.values():
+        museum_catalog.invalidate()
+        museums = {museum_id: await museum_catalog.aget(museum_id) for museum_id in museums}
+    validated = _validated_group(bookings, museums)
+
+    async with get_async_engine(get_async_db_uri()).begin() as connection:
+        ticket_ids = await connection.run_sync(_insert_many, validated)
+
+    result_cache.invalidate_tables({"tickets"})
+    return [
+        {"ticket_id": ticket_id, "museum": museums[booking["museum_id"]]["name"], **booking}
+        for ticket_id, booking in zip(ticket_ids, validated)
+    ]
+
+
+def describe_booking(booking):
+    return (
+        f"{BOOKING_CREATED} ticket_id={booking['ticket_id']}, museum={booking['museum']} "
+        f"(museum_id={booking['museum_id']}), visitor_name={booking['visitor_name']}, "
+        f"visitor_email={booking['visitor_email']}, num_tickets={booking['num_tickets']}, "
+        f"visit_date={booking['visit_date']}"
+    )
+
+
+def describe_bookings(bookings):
+    tickets = sum(booking["num_tickets"] for booking in bookings)
+    lines = [
+        f"{BOOKINGS_CREATED} {len(bookings)} bookings, {tickets} tickets, "
+        f"ticket_ids={[booking['ticket_id'] for booking in bookings]}"
+    ]
+    lines.extend(
+        f"ticket_id={booking['ticket_id']}, museum_id={booking['museum_id']}, visitor_name={booking['visitor_name']}, "
+        f"num_tickets={booking['num_tickets']}, visit_date={booking['visit_date']}"
+        for booking in bookings
+    )
+    return "\n".join(lines)
+
+
+def _availability_query(museum_id, visit_date):
+    # both tables are read by their primary keys, however many tickets there are
+    daily = museum_daily_bookings
+    return (
+        select(museums.c.name, museums.c.capacity, func.coalesce(daily.c.booked_tickets, 0))
+        .select_from(museums.outerjoin(
+            daily, and_(daily.c.museum_id == museums.c.museum_id, daily.c.visit_date == visit_date)
+        ))
+        .where(museums.c.museum_id == museum_id)
+    )
+
+
+def _checked_date(visit_date):
+    try:
+        return datetime.date.fromisoformat(str(visit_date))
+    except ValueError:
+        raise BookingError(f"visit_date {visit_date!r} must be in YYYY-MM-DD format")
+
+
+def _availability(row, museum_id, visit_date):
+    if row is None:
+        raise BookingError(f"there is no museum with museum_id {museum_id}")
+    name, capacity, booked = row
+    left = None if capacity is None else max(capacity - booked, 0)
+    return {
+        "museum_id": museum_id,
+        "museum": name,
+        "visit_date": visit_date,
+        "capacity": capacity,
+        "booked_tickets": booked,
+        "tickets_left": left,
+    }
+
+
+def availability(museum_id, visit_date):
+    """
+    Tickets booked and left for the museum on the day, read from the
+    museum_daily_bookings counters. tickets_left is None for a museum
+    without a capacity.
+    """
+    visit_date = _checked_date(visit_date)
+    with get_engine(get_db_uri()).connect() as connection:
+        row = connection.execute(_availability_query(museum_id, visit_date)).first()
+    return _availability(row, museum_id, visit_date)
+
+
+async def aavailability(museum_id, visit_date):
+    visit_date = _checked_date(visit_date)
+    async with get_async_engine(get_async_db_uri()).connect() as connection:
+        row = (await connection.execute(_availability_query(museum_id, visit_date))).first()
+    return _availability(row, museum_id, visit_date)
+
+
+def describe_availability(availability):
+    text = (
+        f"museum={availability['museum']} (museum_id={availability['museum_id']}), "
+        f"visit_date={availability['visit_date']}, booked_tickets={availability['booked_tickets']}"
+    )
+    if availability["tickets_left"] is None:
+        return f"{text}, no capacity limit"
+    return f"{text}, capacity={availability['capacity']}, tickets_left={availability['tickets_left']}"
@@ -0,0 +1,294 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from config.config import (
+    checkpoint_backend,
+    checkpoint_sqlite_path,
+    get_checkpoint_postgres_uri,
+    checkpoint_keep_last,
+    checkpoint_thread_ttl,
+    checkpoint_compaction_interval,
+)
+
+# 100ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+# Tables written by each backend: checkpoints, pending writes and (Postgres only) channel blobs
+_TABLES = {
+    "sqlite": ("checkpoints", "writes", None),
+    "postgres": ("checkpoints", "checkpoint_writes", "checkpoint_blobs"),
+}
+
+_POSTGRES_KWARGS = {"autocommit": True, "prepare_threshold": 0}
+
+# Seconds since its last checkpoint before a thread is compacted
+_ACTIVE_GRACE = 60
+
+logger = logging.getLogger(__name__)
+
+
+class LockedMemorySaver(MemorySaver):
+    '''MemorySaver that touches its storage only under lock, so compaction can run on another thread'''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.RLock()
+
+    def get_tuple(self, config):
+        with self.lock:
+            return super().get_tuple(config)
+
+    def list(self, config, **kwargs):
+        # collected under the lock, a generator would hold it between items
+        with self.lock:
+            items = list(super().list(config, **kwargs))
+        yield from items
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self.lock:
+            return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self.lock:
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self.lock:
+            return super().delete_thread(thread_id)
+
+    def get_delta_channel_history(self, *, config, channels):
+        with self.lock:
+            return super().get_delta_channel_history(config=config, channels=channels)
+
+
+def _postgres_kwargs():
+    from psycopg.rows import dict_row
+
+    return {**_POSTGRES_KWARGS, "row_factory": dict_row}
+
+
+def build_checkpointer():
+    '''Checkpointer for the sync graph, picked by CHECKPOINT_BACKEND'''
+    if checkpoint_backend == "sqlite":
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        conn = sqlite3.connect(checkpoint_sqlite_path, check_same_thread=False)
+        saver = SqliteSaver(conn)
+        saver.setup()
+        return saver
+
+    if checkpoint_backend == "postgres":
+        from psycopg_pool import ConnectionPool
+        from langgraph.checkpoint.postgres import PostgresSaver
+
+        pool = ConnectionPool(conninfo=get_checkpoint_postgres_uri(), kwargs=_postgres_kwargs(), open=True)
+        saver = PostgresSaver(pool)
+        saver.setup()
+        return saver
+
+    return LockedMemorySaver()
+
+
+async def abuild_checkpointer():
+    '''Checkpointer for the async graph, it has to be created inside the running event loop'''
+    if checkpoint_backend == "sqlite":
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        conn = await aiosqlite.connect(checkpoint_sqlite_path)
+        saver = AsyncSqliteSaver(conn)
+        await saver.setup()
+        return saver
+
+    if checkpoint_backend == "postgres":
+        from psycopg_pool import AsyncConnectionPool
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+        pool = AsyncConnectionPool(conninfo=get_checkpoint_postgres_uri(), kwargs=_postgres_kwargs(), open=False)
+        await pool.open()
+        saver = AsyncPostgresSaver(pool)
+        await saver.setup()
+        return saver
+
+    return LockedMemorySaver()
+
+
+async def aclose_checkpointer(saver):
+    '''Close the connection or pool behind an async saver built by abuild_checkpointer'''
+    resource = getattr(saver, "conn", None)
+    if resource is not None:
+        await resource.close()
+
+
+def checkpoint_time(checkpoint_id):
+    '''Unix time a checkpoint was written, decoded from its uuid6 id'''
+    value = uuid.UUID(checkpoint_id).int
+    timestamp = ((value >> 80) << 12) | ((value >> 64) & 0x0FFF)
+    return (timestamp - _UUID_EPOCH_OFFSET) / 10_000_000
+
+
+def _connect():
+    if checkpoint_backend == "sqlite":
+        return sqlite3.connect(checkpoint_sqlite_path), "?"
+
+    import psycopg
+
+    return psycopg.connect(get_checkpoint_postgres_uri(), **_POSTGRES_KWARGS), "%s"
+
+
+def _classify(latest_ids, thread_ttl):
+    '''Split threads into (expired, compactable), threads written to recently are left alone'''
+    now = time.time()
+    expired, compactable = [], []
+    for thread_id, latest in latest_ids:
+        age = now - checkpoint_time(latest)
+        if thread_ttl and age > thread_ttl:
+            expired.append(thread_id)
+        elif age > _ACTIVE_GRACE:
+            compactable.append(thread_id)
+    return expired, compactable
+
+
+def _compact_memory(saver, keep_last, thread_ttl):
+    # a plain MemorySaver has no lock, only its own thread may compact it
+    with getattr(saver, "lock", None) or nullcontext():
+        return _compact_memory_storage(saver, keep_last, thread_ttl)
+
+
+def _compact_memory_storage(saver, keep_last, thread_ttl):
+    latest_ids = [
+        (thread_id, max(checkpoint_id for checkpoints in list(namespaces.values()) for checkpoint_id in list(checkpoints)))
+        for thread_id, namespaces in list(saver.storage.items())
+        if any(namespaces.values())
+    ]
+    expired, compactable = _classify(latest_ids, thread_ttl)
+    for thread_id in expired:
+        saver.delete_thread(thread_id)
+
+    deleted = 0
+    for thread_id in compactable if keep_last else []:
+        for checkpoint_ns, checkpoints in list(saver.storage[thread_id].items()):
+            for checkpoint_id in sorted(checkpoints, reverse=True)[keep_last:]:
+                del checkpoints[checkpoint_id]
+                deleted += 1
+
+            kept = {
+                (channel, version)
+                for serialized, _, _ in checkpoints.values()
+                for channel, version in saver.serde.loads_typed(serialized)["channel_versions"].items()
+            }
+            for key in list(saver.writes):
+                if key[:2] == (thread_id, checkpoint_ns) and key[2] not in checkpoints:
+                    del saver.writes[key]
+            for key in list(saver.blobs):
+                if key[:2] == (thread_id, checkpoint_ns) and key[2:] not in kept:
+                    del saver.blobs[key]
+
+    return {"deleted_checkpoints": deleted, "expired_threads": len(expired)}
+
+
+def _compact_sql(keep_last, thread_ttl):
+    checkpoints, writes, blobs = _TABLES[checkpoint_backend]
+    conn, mark = _connect()
+    deleted = 0
+
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT thread_id, MAX(checkpoint_id) FROM {checkpoints} GROUP BY thread_id")
+        expired, compactable = _classify(cur.fetchall(), thread_ttl)
+
+        for thread_id in expired:
+            for table in filter(None, (checkpoints, writes, blobs)):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = {mark}", (thread_id,))
+
+        for thread_id in compactable if keep_last else []:
+            cur.execute(
+                f"""
+                DELETE FROM {checkpoints} WHERE thread_id = {mark} AND (checkpoint_ns, checkpoint_id) IN (
+                    SELECT checkpoint_ns, checkpoint_id FROM (
+                        SELECT checkpoint_ns, checkpoint_id,
+                               ROW_NUMBER() OVER (
+                                   PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC
+                               ) AS position
+                        FROM {checkpoints} WHERE thread_id = {mark}
+                    ) ranked WHERE position > {mark}
+                )
+                """,
+                (thread_id, thread_id, keep_last),
+            )
+            deleted += max(cur.rowcount, 0)
+
+            cur.execute(
+                f"""
+                DELETE FROM {writes} WHERE thread_id = {mark} AND NOT EXISTS (
+                    SELECT 1 FROM {checkpoints} c
+                    WHERE c.thread_id = {writes}.thread_id
+                      AND c.checkpoint_ns = {writes}.checkpoint_ns
+                      AND c.checkpoint_id = {writes}.checkpoint_id
+                )
+                """,
+                (thread_id,),
+            )
+
+            if blobs:
+                # a blob is still needed while a remaining checkpoint points at its version
+                cur.execute(
+                    f"""
+                    DELETE FROM {blobs} b WHERE b.thread_id = {mark} AND NOT EXISTS (
+                        SELECT 1 FROM {checkpoints} c
+                        WHERE c.thread_id = b.thread_id
+                          AND c.checkpoint_ns = b.checkpoint_ns
+                          AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+                    )
+                    """,
+                    (thread_id,),
+                )
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {"deleted_checkpoints": deleted, "expired_threads": len(expired)}
+
+
+def compact_checkpoints(saver, keep_last=None, thread_ttl=None):
+    """
+    Keep only the latest keep_last checkpoints of every thread and delete
+    threads idle for longer than thread_ttl seconds. Returns what was removed.
+
+    Our channels are plain values and reducers, every checkpoint holds the
+    full state, so dropping older checkpoints never loses the current one.
+    Threads that wrote a checkpoint in the last minute are skipped.
+    """
+    keep_last = checkpoint_keep_last if keep_last is None else keep_last
+    thread_ttl = checkpoint_thread_ttl if thread_ttl is None else thread_ttl
+
+    if isinstance(saver, MemorySaver):
+        return _compact_memory(saver, keep_last, thread_ttl)
+    return _compact_sql(keep_last, thread_ttl)
+
+
+def start_compaction(saver, interval=None):
+    '''Run compact_checkpoints every interval seconds on a daemon thread'''
+    interval = checkpoint_compaction_interval if interval is None else interval
+    # a plain MemorySaver has no lock, compacting it from another thread would race the graph runs
+    if not interval or (isinstance(saver, MemorySaver) and not isinstance(saver, LockedMemorySaver)):
+        return None
+
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                compact_checkpoints(saver)
+            except Exception:
+                logger.exception("Checkpoint compaction failed")
+
+    threading.Thread(target=loop, name="checkpoint-compaction", daemon=True).start()
+    return stop
@@ -1,8 +1,11 @@
 from state import MessagesState
 from pydantic import BaseModel, Field
-from langchain.messages import SystemMessage, HumanMessage, AIMessage
+from langchain.messages import HumanMessage, AIMessage
+from langgraph.constants import TAG_NOSTREAM
 
-from config.config import google_model
+from helpers.llm_cache import model_for
+from helpers.history import build_messages, abuild_messages
+from helpers.intent_classifier import fast_intent, TICKET
 
 sys_prompt_detect_intent='''
 You are a helpful intent classification assistant for a museum ticketing system. Your role is to analyze user queries and categorize them into one of three types:
@@ -45,33 +48,66 @@ class DetectIntent(BaseModel):
     is_museum: bool = Field(..., description="Is the user asking for more details of the museum")
     irrevelant: str = Field(..., description="Is the user asking to book ticket")
 
-def detect_intent(state: MessagesState):
+def _intent_prefix(state: MessagesState):
     user_message = state.get("user_message")
 
-    messages = [
-        SystemMessage(
-            content=sys_prompt_detect_intent
-        ),
+    return [
         HumanMessage(
             content=user_message
         )
-    ] + state["messages"]
+    ]
+
+def _apply_intent(response: DetectIntent, update):
+    # return only the changed keys, messages is an accumulator
+    if response.is_ticket:
+        return {
+            **update,
+            "to_book_or_detail": True,
+            "irrevelant_question": ""
+        }
+
+    if response.is_museum:
+        return {
+            **update,
+            "to_book_or_detail": False,
+            "irrevelant_question": ""
+        }
+
+    return {
+        **update,
+        "irrevelant_question": response.irrevelant,
+        "messages": [AIMessage(content=response.irrevelant)]
+    }
+
+def _fast_path(state: MessagesState):
+    label = fast_intent(state.get("user_message"))
+    if label is None:
+        return None
+
+    return _apply_intent(DetectIntent(is_ticket=label == TICKET, is_museum=label != TICKET, irrevelant=""), {})
+
+def detect_intent(state: MessagesState):
+    # obvious queries are classified locally, the rest goes to the llm
+    fast = _fast_path(state)
+    if fast is not None:
+        return fast
+
+    messages, update = build_messages("detect_intent", state, sys_prompt_detect_intent, _intent_prefix(state))
 
     # call the llm
-    model_with_structure = google_model.with_structured_output(DetectIntent)
+    model_with_structure = model_for("detect_intent").with_structured_output(DetectIntent).with_config(tags=[TAG_NOSTREAM])
     response = model_with_structure.invoke(messages)
 
-    if response.is_ticket:
-        state["to_book_or_detail"] = True
-        state["irrevelant_question"] = ""
-        return state
+    return _apply_intent(response, update)
 
-    if response.is_museum:
-        state["to_book_or_detail"] = False
-        state["irrevelant_question"] = ""
-        return state
+async def adetect_intent(state: MessagesState):
+    fast = _fast_path(state)
+    if fast is not None:
+        return fast
+
+    messages, update = await abuild_messages("detect_intent", state, sys_prompt_detect_intent, _intent_prefix(state))
 
-    state["irrevelant_question"] = response.irrevelant
-    state["messages"] = state["messages"] + [AIMessage(content=response.irrevelant)]
+    model_with_structure = model_for("detect_intent").with_structured_output(DetectIntent).with_config(tags=[TAG_NOSTREAM])
+    response = await model_with_structure.ainvoke(messages)
 
-    return state
+    return _apply_intent(response, update)
@@ -3,6 +3,6 @@ from state import MessagesState
 def end_node(state: MessagesState):
     """Final node"""
 
-    print("Final Response: ", state["messages"][-1].content)
-    
-    return state
\ No newline at end of file
+    # the answer was already streamed to the caller. Nothing to update,
+    # returning the state would append the messages again
+    return {}
\ No newline at end of file
@@ -1,8 +1,223 @@
+import threading
+import time
+
 from langchain_community.utilities import SQLDatabase
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from helpers.prepared_statements import prepare_all, uses_prepared
+from helpers.metrics import listen_sql
+from helpers.result_format import ResultWriter, format_rows
+from config.config import (
+    db_pool_size,
+    db_max_overflow,
+    db_pool_timeout,
+    db_pool_recycle,
+    db_pool_pre_ping,
+    tool_result_fetch_size,
+)
+
+_lock = threading.Lock()
+_engines = {}
+_async_engines = {}
+_databases = {}
+
+
+class _TimedPool:
+    '''Records how long callers wait to check out a connection'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_options():
+    return {
+        "pool_size": db_pool_size,
+        "max_overflow": db_max_overflow,
+        "pool_timeout": db_pool_timeout,
+        "pool_recycle": db_pool_recycle,
+        "pool_pre_ping": db_pool_pre_ping,
+    }
+
+
+def _listen_prepare(engine):
+    # every new psycopg2 connection prepares the application's own statements
+    if uses_prepared(engine.dialect):
+        event.listen(engine, "connect", prepare_all)
+
+
+def get_engine(uri):
+    '''Process-wide engine for the uri, created on first use'''
+    engine = _engines.get(uri)
+    if engine is not None:
+        return engine
+
+    with _lock:
+        engine = _engines.get(uri)
+        if engine is None:
+            engine = create_engine(uri, poolclass=TimedQueuePool, **_pool_options())
+            _listen_prepare(engine)
+            listen_sql(engine)
+            _engines[uri] = engine
+
+    return engine
+
+
+def get_async_engine(uri):
+    '''Process-wide async engine (psycopg3 for Postgres) for the uri, created on first use'''
+    engine = _async_engines.get(uri)
+    if engine is not None:
+        return engine
+
+    # sqlalchemy.ext.asyncio pulls in the ORM, only async callers pay for it
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    with _lock:
+        engine = _async_engines.get(uri)
+        if engine is None:
+            engine = create_async_engine(uri, poolclass=TimedAsyncQueuePool, **_pool_options())
+            _listen_prepare(engine.sync_engine)
+            listen_sql(engine.sync_engine)
+            _async_engines[uri] = engine
+
+    return engine
+
+
+# statement_timeout for the rest of the transaction only, SET cannot take a bound parameter
+_STATEMENT_TIMEOUT = text("SELECT set_config('statement_timeout', :timeout, true)")
+# has to come before any other statement of the transaction
+_READ_ONLY = text("SET TRANSACTION READ ONLY")
+
+
+def transaction_settings(connection, timeout_ms=None, read_only=False):
+    """
+    (statement, parameters) pairs that set up a new transaction on Postgres:
+    read_only refuses any write, timeout_ms cancels statements running longer.
+    Other databases get none, SQLite never runs more than one statement per
+    call anyway.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    settings = []
+    if read_only:
+        settings.append((_READ_ONLY, {}))
+    if timeout_ms:
+        settings.append((_STATEMENT_TIMEOUT, {"timeout": str(int(timeout_ms))}))
+    return settings
+
+
+def run(uri, query, limits, stream=False, timeout_ms=None, read_only=False):
+    """
+    Run query in its own transaction and return its rows written with limits
+    (see helpers.result_format), "" for statements without rows. stream reads
+    SELECTs through a server-side cursor in batches of TOOL_RESULT_FETCH_SIZE
+    so rows past the caps are never held in memory. On Postgres timeout_ms
+    cancels the statement once it runs longer than that and read_only runs
+    it in a read-only transaction.
+    """
+    with get_engine(uri).begin() as connection:
+        for statement, parameters in transaction_settings(connection, timeout_ms, read_only):
+            connection.execute(statement, parameters)
+        if stream:
+            connection = connection.execution_options(yield_per=tool_result_fetch_size)
+        result = connection.execute(text(query))
+        try:
+            if not result.returns_rows:
+                return ""
+            return format_rows(result.keys(), result, limits)
+        finally:
+            result.close()
+
+
+async def arun(uri, query, limits, stream=False, timeout_ms=None, read_only=False):
+    '''Async run'''
+    async with get_async_engine(uri).begin() as connection:
+        for statement, parameters in transaction_settings(connection, timeout_ms, read_only):
+            await connection.execute(statement, parameters)
+        if not stream:
+            result = await connection.execute(text(query))
+            if not result.returns_rows:
+                return ""
+            return format_rows(result.keys(), result, limits)
+
+        result = await connection.stream(text(query), execution_options={"yield_per": tool_result_fetch_size})
+        try:
+            writer = ResultWriter(result.keys(), limits)
+            async for row in result:
+                if not writer.add(row):
+                    break
+            return writer.text()
+        finally:
+            await result.close()
+
 
 def get_db(uri):
-    db = SQLDatabase.from_uri(
-        uri
-    )
+    '''Shared SQLDatabase for the uri, the table reflection only happens once'''
+    db = _databases.get(uri)
+    if db is not None:
+        return db
+
+    engine = get_engine(uri)
+    with _lock:
+        db = _databases.get(uri)
+        if db is None:
+            db = SQLDatabase(engine)
+            _databases[uri] = db
+
+    return db
+
+
+def pool_stats(uri):
+    '''Snapshot of the pool usage and checkout wait times for the uri'''
+    engine = _engines.get(uri)
+    if engine is None and uri in _async_engines:
+        engine = _async_engines[uri].sync_engine
+    if engine is None:
+        return {}
+
+    pool = engine.pool
+    with pool._stats_lock:
+        checkouts = pool.checkouts
+        total_wait = pool.total_wait
+        max_wait = pool.max_wait
+        timeouts = pool.timeouts
 
-    return db
\ No newline at end of file
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checkouts": checkouts,
+        "timeouts": timeouts,
+        "avg_wait_ms": (total_wait / checkouts * 1000) if checkouts else 0.0,
+        "max_wait_ms": max_wait * 1000,
+    }
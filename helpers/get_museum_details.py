@@ -1,39 +1,20 @@
 from state import MessagesState
-from langchain.messages import SystemMessage, HumanMessage
-from langchain.messages import ToolMessage
+from langchain.messages import HumanMessage
 
-from config.config import google_model
+from helpers.llm_cache import model_for
 from tools.read_db import read_db
+from tools.lookup_museum import lookup_museum
+from helpers.tool_runner import run_tool_calls, arun_tool_calls
+from helpers.history import build_messages, abuild_messages, trim_tool_results
+from helpers.metrics import record_tool_loop
+from helpers.schema import prompt_schema
 
 sys_prompt_museum_details = '''
 You are a knowledgeable and helpful museum information assistant. Your goal is to provide accurate, engaging details about museums to help users plan their visits.
 
 **Database Schema:**
 
-CREATE TABLE museums (
-    museum_id SERIAL PRIMARY KEY,
-    name VARCHAR(100) NOT NULL,
-    location VARCHAR(150) NOT NULL,
-    city VARCHAR(100),
-    state VARCHAR(100),
-    description TEXT,
-    contact_email VARCHAR(100),
-    contact_number VARCHAR(20),
-    opening_time TIME,
-    closing_time TIME
-);
-
-CREATE TABLE tickets (
-    ticket_id SERIAL PRIMARY KEY,
-    museum_id INT REFERENCES museums(museum_id) ON DELETE CASCADE,
-    visitor_name VARCHAR(100) NOT NULL,
-    visitor_email VARCHAR(100),
-    num_tickets INT CHECK (num_tickets > 0),
-    total_price DECIMAL(10,2),
-    booking_date DATE DEFAULT CURRENT_DATE,
-    visit_date DATE NOT NULL,
-    status VARCHAR(20) DEFAULT 'BOOKED'
-);
+''' + prompt_schema() + '''
 
 **Your Capabilities:**
 You can provide information about:
@@ -44,6 +25,9 @@ You can provide information about:
 - Comparisons between museums
 - Recommendations based on location or interests
 
+**Using the lookup_museum Tool:**
+To find museums by name, city or state call "lookup_museum" first. It answers from memory, tolerates typos and partial names, and returns the museum_id, location, hours and contact details of the best matches.
+
 **Using the read_db Tool:**
 You have access to a read-only database tool called "read_db". Use it to fetch accurate, up-to-date museum information.
 
@@ -100,38 +84,61 @@ You have access to a read-only database tool called "read_db". Use it to fetch a
 - Always validate that your SQL queries are syntactically correct before calling read_db
 '''
 
+tool_registry = {
+   read_db.name: read_db,
+   lookup_museum.name: lookup_museum,
+}
+
+def _details_prefix(state: MessagesState):
+   return [
+      HumanMessage(
+         content=state["user_message"]
+      )
+   ]
+
 def get_museum_details(state: MessagesState):
       # call the llm with db instance to it
-      model_with_tools = google_model.bind_tools([read_db])
-
-      messages = [
-         SystemMessage(
-            content=sys_prompt_museum_details
-         ),
-         HumanMessage(
-            content=state["user_message"]
-         )
-      ]
+      model_with_tools = model_for("get_museum_details").bind_tools([lookup_museum, read_db])
 
-      current_messages = messages + state["messages"]
+      current_messages, update = build_messages("get_museum_details", state, sys_prompt_museum_details, _details_prefix(state))
 
+      iterations = 0
       while True:
          response = model_with_tools.invoke(current_messages)
+         iterations += 1
 
          if not response.tool_calls:
             break
 
          current_messages.append(response)
+         current_messages.extend(run_tool_calls(response.tool_calls, tool_registry))
+         trim_tool_results(current_messages)
+
+      record_tool_loop("get_museum_details", iterations)
+      return {
+         **update,
+         "messages": [response]
+      }
 
-         for tool_call in response.tool_calls:
-            tool_result = read_db.invoke(tool_call["args"])
-            current_messages.append(
-               ToolMessage(
-                  content=str(tool_result),
-                  tool_call_id=tool_call["id"]
-               )
-            )
+async def aget_museum_details(state: MessagesState):
+      model_with_tools = model_for("get_museum_details").bind_tools([lookup_museum, read_db])
+
+      current_messages, update = await abuild_messages("get_museum_details", state, sys_prompt_museum_details, _details_prefix(state))
+
+      iterations = 0
+      while True:
+         response = await model_with_tools.ainvoke(current_messages)
+         iterations += 1
+
+         if not response.tool_calls:
+            break
+
+         current_messages.append(response)
+         current_messages.extend(await arun_tool_calls(response.tool_calls, tool_registry))
+         trim_tool_results(current_messages)
 
+      record_tool_loop("get_museum_details", iterations)
       return {
+         **update,
          "messages": [response]
       }
@@ -0,0 +1,206 @@
+import threading
+
+from langchain.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.constants import TAG_NOSTREAM
+
+from helpers.llm_cache import model_for
+from config.config import (
+    history_keep_turns,
+    history_summary_enabled,
+    history_summary_every,
+    history_tool_result_chars,
+    history_token_budgets,
+    history_default_budget,
+)
+
+sys_prompt_summary = '''
+You maintain a running summary of a conversation between a user and a museum ticketing assistant.
+Update the existing summary with the new messages. Keep every fact that later turns may need:
+museums the user asked about, booking details they gave (names, dates, ticket counts, museum ids),
+bookings that were made and questions that are still open. Drop greetings and small talk.
+Reply with the updated summary only, in at most 150 words.
+'''
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def count_tokens(messages):
+    return count_tokens_approximately(messages)
+
+
+def _record(node, full, sent, summarized=False, dropped=0):
+    with _stats_lock:
+        stats = _stats.setdefault(node, {
+            "calls": 0,
+            "tokens_full": 0,
+            "tokens_sent": 0,
+            "summaries": 0,
+            "turns_dropped": 0,
+        })
+        stats["calls"] += 1
+        stats["tokens_full"] += full
+        stats["tokens_sent"] += sent
+        stats["summaries"] += int(summarized)
+        stats["turns_dropped"] += dropped
+
+
+def history_stats():
+    '''Per node totals of the tokens the full history would have cost and what was actually sent'''
+    with _stats_lock:
+        return {
+            node: {
+                **stats,
+                "tokens_saved": stats["tokens_full"] - stats["tokens_sent"],
+                "saved_ratio": 1 - stats["tokens_sent"] / stats["tokens_full"] if stats["tokens_full"] else 0.0,
+            }
+            for node, stats in _stats.items()
+        }
+
+
+def split_turns(messages):
+    '''Group messages into turns, every HumanMessage starts a new one'''
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _without_tool_traffic(turn):
+    # tool calls of a finished turn only matter through the answer that followed them
+    return [
+        message for message in turn
+        if not isinstance(message, ToolMessage)
+        and not (isinstance(message, AIMessage) and message.tool_calls)
+    ]
+
+
+def trim_tool_results(messages, max_chars=None):
+    """
+    Shorten the ToolMessages before the latest round of tool calls in place.
+    The model already acted on them, the head of each result is kept so ids
+    it looked up stay visible.
+    """
+    max_chars = history_tool_result_chars if max_chars is None else max_chars
+    last_call = max(
+        (index for index, message in enumerate(messages) if isinstance(message, AIMessage) and message.tool_calls),
+        default=-1,
+    )
+    for index, message in enumerate(messages[:last_call]):
+        if isinstance(message, ToolMessage) and len(message.content) > max_chars:
+            messages[index] = message.model_copy(update={
+                "content": message.content[:max_chars] + f" ... [{len(message.content) - max_chars} characters omitted]"
+            })
+    return messages
+
+
+def _summary_messages(summary, turns):
+    transcript = "\n".join(
+        f"{message.type}: {message.content}"
+        for turn in turns
+        for message in _without_tool_traffic(turn)
+        if message.content
+    )
+    return [
+        SystemMessage(content=sys_prompt_summary),
+        HumanMessage(content=f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}")
+    ]
+
+
+def _system_message(prompt, summary):
+    if summary:
+        prompt = f"{prompt}\n\nSummary of the earlier conversation:\n{summary}"
+    return SystemMessage(content=prompt)
+
+
+def _over_budget(node, prompt, prefix, summary, turns):
+    '''How many of the oldest turns do not fit the node's token budget, the latest turn always fits'''
+    budget = history_token_budgets.get(node, history_default_budget)
+    head = [_system_message(prompt, summary)] + list(prefix)
+
+    turns = [_without_tool_traffic(turn) for turn in turns[:-1]] + turns[-1:]
+    dropped = 0
+    while len(turns) - dropped > 1 and count_tokens(head + [m for turn in turns[dropped:] for m in turn]) > budget:
+        dropped += 1
+    return dropped
+
+
+def _plan(node, state, prompt, prefix):
+    """
+    Split the history into (turns to fold into the summary, turns sent
+    verbatim). Turns past HISTORY_KEEP_TURNS are folded once
+    HISTORY_SUMMARY_EVERY of them collected, turns that do not fit the node's
+    token budget are folded right away so they are not lost.
+    """
+    messages = state.get("messages", [])
+    summarized = state.get("summarized_messages", 0)
+    turns = split_turns(messages[summarized:])
+
+    if not history_summary_enabled:
+        return [], turns
+
+    older = turns[:-history_keep_turns] if history_keep_turns else turns
+    if len(older) < history_summary_every:
+        older = []
+    recent = turns[len(older):]
+
+    dropped = _over_budget(node, prompt, prefix, state.get("history_summary", ""), recent)
+    return older + recent[:dropped], recent[dropped:]
+
+
+def _assemble(node, state, prompt, prefix, summary, turns, summarized):
+    """
+    System prompt with the summary, then the prefix, then as many recent turns
+    as the node's token budget allows. The latest turn is always kept, turns
+    left out are counted as turns_dropped.
+    """
+    dropped = _over_budget(node, prompt, prefix, summary, turns)
+    turns = [_without_tool_traffic(turn) for turn in turns[:-1]] + turns[-1:]
+
+    messages = [_system_message(prompt, summary)] + list(prefix) + [message for turn in turns[dropped:] for message in turn]
+    full = [SystemMessage(content=prompt)] + list(prefix) + state.get("messages", [])
+    _record(node, count_tokens(full), count_tokens(messages), summarized, dropped)
+    return messages
+
+
+def _summary_update(state, folded, summary):
+    return {
+        "history_summary": summary,
+        "summarized_messages": state.get("summarized_messages", 0) + sum(len(turn) for turn in folded),
+    }
+
+
+def build_messages(node, state, prompt, prefix=()):
+    """
+    Messages to send for node: the system prompt, the rolling summary of older
+    turns and of turns past the node's token budget, the prefix and the last
+    HISTORY_KEEP_TURNS turns within that budget. Returns (messages, state update), the update carries the new
+    summary when older turns were folded into it and must be merged into the
+    node's own update.
+    """
+    folded, recent = _plan(node, state, prompt, prefix)
+    summary = state.get("history_summary", "")
+    update = {}
+
+    if folded:
+        response = model_for("history_summary").with_config(tags=[TAG_NOSTREAM]).invoke(_summary_messages(summary, folded))
+        summary = str(response.text)
+        update = _summary_update(state, folded, summary)
+
+    return _assemble(node, state, prompt, prefix, summary, recent, bool(folded)), update
+
+
+async def abuild_messages(node, state, prompt, prefix=()):
+    folded, recent = _plan(node, state, prompt, prefix)
+    summary = state.get("history_summary", "")
+    update = {}
+
+    if folded:
+        response = await model_for("history_summary").with_config(tags=[TAG_NOSTREAM]).ainvoke(_summary_messages(summary, folded))
+        summary = str(response.text)
+        update = _summary_update(state, folded, summary)
+
+    return _assemble(node, state, prompt, prefix, summary, recent, bool(folded)), update
@@ -0,0 +1,174 @@
+import json
+import math
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import NamedTuple
+
+from config.config import intent_fast_path, intent_confidence_threshold
+
+TICKET = "ticket"
+MUSEUM = "museum"
+OTHER = "other"
+
+CORPUS_PATH = Path(__file__).resolve().parent.parent / "data" / "intent_corpus.jsonl"
+
+# Confidence given to a query matched by exactly one rule
+RULE_CONFIDENCE = 0.97
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+# Things people book that are not museum visits, their queries go to the model
+_OUT_OF_SCOPE = re.compile(
+    r"\b(flights?|hotels?|trains?|taxi|cab|restaurants?|tables?|movies?|cinema|concerts?|"
+    r"football|match|games?|weather|pizza|recipe)\b"
+)
+
+_RULES = {
+    TICKET: re.compile(
+        r"\b(book|booking|reserve|reservation|buy|purchase|order)\b.*\b(tickets?|visit|entry|seats?|passes?|slot|museum)\b"
+        r"|\b(tickets?|visit|entry)\b.*\b(book|reserve|buy|purchase)\b"
+    ),
+    MUSEUM: re.compile(
+        r"\b(what|which|where|when|how|is|are|does|do|tell|show|list|describe|recommend)\b.*"
+        r"\b(museums?|exhibits?|exhibitions?|galler(y|ies)|hours|open|opening|close|address|located)\b"
+    ),
+}
+
+# The model only decides for queries that mention something of ours
+_DOMAIN = re.compile(
+    r"\b(museums?|galler(y|ies)|exhibits?|exhibitions?|tickets?|book|booking|reserve|reservation|visit|"
+    r"entry|tours?|hours|open|opening|close|adults?|kids|children|family)\b"
+)
+
+# Museum questions that talk about tickets without asking to buy them
+_PRICE_QUESTION = re.compile(r"\bhow much\b|\bprice\b|\bcost\b")
+
+
+class Prediction(NamedTuple):
+    label: str
+    confidence: float
+    source: str
+
+
+def tokenize(text):
+    words = _WORD.findall(text.lower())
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def load_corpus(path=CORPUS_PATH):
+    '''Labelled examples as (text, label) pairs, one JSON object per line'''
+    with open(path) as corpus:
+        return [
+            (example["text"], example.get("label"))
+            for example in map(json.loads, filter(str.strip, corpus))
+        ]
+
+
+class NaiveBayes:
+    '''Multinomial Naive Bayes over words and word pairs, small enough to train at startup'''
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.priors = {}
+        self.counts = {}
+        self.totals = {}
+        self.vocabulary = set()
+
+    def fit(self, examples):
+        labels = Counter(label for _, label in examples)
+        self.priors = {label: math.log(count / len(examples)) for label, count in labels.items()}
+        self.counts = {label: Counter() for label in labels}
+        for text, label in examples:
+            self.counts[label].update(tokenize(text))
+        self.totals = {label: sum(counts.values()) for label, counts in self.counts.items()}
+        self.vocabulary = set().union(*self.counts.values())
+        return self
+
+    def predict_proba(self, text):
+        '''Posterior per label, None when no word of the text was seen in training'''
+        tokens = [token for token in tokenize(text) if token in self.vocabulary]
+        if not tokens:
+            return None
+
+        scores = {}
+        for label, prior in self.priors.items():
+            denominator = self.totals[label] + self.alpha * len(self.vocabulary)
+            scores[label] = prior + sum(
+                math.log((self.counts[label][token] + self.alpha) / denominator)
+                for token in tokens
+            )
+
+        top = max(scores.values())
+        weights = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(weights.values())
+        return {label: weight / total for label, weight in weights.items()}
+
+
+def rule_label(text):
+    '''The label of the only rule that matches, other for non-museum bookings, None when no or several rules match'''
+    text = text.lower()
+    if _OUT_OF_SCOPE.search(text):
+        return OTHER
+
+    matched = [label for label, rule in _RULES.items() if rule.search(text)]
+    if matched == [TICKET, MUSEUM] and _PRICE_QUESTION.search(text):
+        return MUSEUM
+    return matched[0] if len(matched) == 1 else None
+
+
+class IntentClassifier:
+    """
+    First stage of detect_intent: keyword rules, then a Naive Bayes model
+    trained on the labelled corpus. Only answers ticket or museum, out of
+    scope queries need the model to write the redirect message.
+    """
+
+    def __init__(self, examples):
+        self.model = NaiveBayes().fit(examples)
+
+    def predict(self, text):
+        label = rule_label(text)
+        if label:
+            return Prediction(label, RULE_CONFIDENCE, "rule")
+
+        probabilities = self.model.predict_proba(text) if _DOMAIN.search(text.lower()) else None
+        if probabilities is None:
+            return Prediction(OTHER, 0.0, "model")
+        label = max(probabilities, key=probabilities.get)
+        return Prediction(label, probabilities[label], "model")
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {"fast": 0, "fallback": 0}
+
+
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = IntentClassifier(load_corpus())
+    return _classifier
+
+
+def fast_intent(text, threshold=None):
+    '''The ticket or museum label when the local classifier is confident enough, None to ask the model'''
+    threshold = intent_confidence_threshold if threshold is None else threshold
+    prediction = get_classifier().predict(text or "") if intent_fast_path else None
+    confident = prediction is not None and prediction.label != OTHER and prediction.confidence >= threshold
+
+    with _stats_lock:
+        _stats["fast" if confident else "fallback"] += 1
+
+    return prediction.label if confident else None
+
+
+def intent_stats():
+    with _stats_lock:
+        total = _stats["fast"] + _stats["fallback"]
+        return {**_stats, "fast_ratio": _stats["fast"] / total if total else 0.0}
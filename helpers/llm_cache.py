@@ -0,0 +1,266 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+from helpers.cache import LRUCache
+from helpers.metrics import record_llm_call, record_llm_error
+from helpers.llm_scheduler import scheduled
+from config.config import (
+    get_chat_model,
+    llm_cache_nodes,
+    llm_cache_path,
+    llm_cache_size,
+    llm_cache_max_bytes,
+    llm_cache_ttl,
+)
+
+# Persisted rows are trimmed every this many writes
+_PRUNE_EVERY = 100
+
+
+# Message fields that never reach the model, they differ between otherwise identical requests
+_VOLATILE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def _canonical_prompt(prompt):
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+
+    for message in messages:
+        kwargs = message.get("kwargs") if isinstance(message, dict) else None
+        if isinstance(kwargs, dict):
+            for field in _VOLATILE_FIELDS:
+                kwargs.pop(field, None)
+    return json.dumps(messages, sort_keys=True)
+
+
+def cache_key(prompt, llm_string):
+    '''prompt holds the system prompt and messages, llm_string the model, its settings and bound tool schemas'''
+    return hashlib.sha256(f"{llm_string}\x00{_canonical_prompt(prompt)}".encode()).hexdigest()
+
+
+def _dumps(generations):
+    # ids are dropped so every hit gets a fresh message id from its own run
+    return json.dumps([
+        message_to_dict(generation.message.model_copy(update={"id": None}))
+        for generation in generations
+    ])
+
+
+def _loads(payload):
+    # marked so the metrics tell cached answers from model calls
+    return [
+        ChatGeneration(message=message.model_copy(update={"response_metadata": {**message.response_metadata, "cached": True}}))
+        for message in messages_from_dict(json.loads(payload))
+    ]
+
+
+class LLMResponseStore:
+    """
+    Exact-match model responses, kept in memory and optionally in SQLite.
+    Both are bounded by max_entries and max_bytes, SQLite drops the least
+    recently used rows first.
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl, path=None):
+        self.memory = LRUCache(max_entries, ttl, max_bytes=max_bytes, sizeof=len)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self):
+        '''The SQLite connection, opened on first use, None without a path. Call with _lock held.'''
+        if self._conn is None and self.path:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        payload = self.memory.get(key)
+        if payload is not None or not self.path:
+            return payload
+
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT payload, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+
+        payload, created_at = row
+        remaining = self.ttl - (time.time() - created_at) if self.ttl else None
+        if remaining is not None and remaining <= 0:
+            return None
+
+        self.memory.set(key, payload, ttl=remaining)
+        return payload
+
+    def set(self, key, payload):
+        self.memory.set(key, payload)
+        if not self.path:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO responses (key, payload, created_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        if self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY used_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        if self.max_bytes:
+            # drop the least recently used rows until the payloads fit
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM ("
+                "SELECT key, SUM(LENGTH(payload)) OVER (ORDER BY used_at DESC) AS total FROM responses"
+                ") WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+    def clear(self):
+        self.memory.clear()
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def stats(self):
+        stats = self.memory.stats()
+        if self._conn is not None:
+            with self._lock:
+                stats["persisted"] = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return stats
+
+
+class NodeCache(BaseCache):
+    '''The LangChain cache given to the model of one node, counts that node's hits and misses'''
+
+    def __init__(self, node, store):
+        self.node = node
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, prompt, llm_string):
+        payload = self.store.get(cache_key(prompt, llm_string))
+        if payload is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return _loads(payload)
+
+    def update(self, prompt, llm_string, return_val):
+        self.store.set(cache_key(prompt, llm_string), _dumps(return_val))
+
+    def clear(self, **kwargs):
+        self.store.clear()
+
+
+class LLMMetrics(BaseCallbackHandler):
+    '''Callback attached to the model of one node, reports wall time, calls and tokens to helpers.metrics'''
+
+    def __init__(self, node):
+        self.node = node
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), messages[0] if messages else [])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        start, messages = started
+
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        record_llm_call(self.node, start, messages, getattr(generation, "message", None))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        record_llm_error(self.node)
+
+
+llm_response_store = LLMResponseStore(llm_cache_size, llm_cache_max_bytes, llm_cache_ttl, llm_cache_path)
+
+_node_caches = {}
+_models = {}
+# set by set_chat_model, otherwise the Gemini model from config is built on first use
+_chat_model = None
+_models_lock = threading.Lock()
+
+
+def model_for(node):
+    """
+    The chat model as used by node: a copy reporting its calls and tokens to
+    the metrics under node. Nodes listed in LLM_CACHE_NODES also answer
+    repeated identical requests from the response cache. Calls that miss the
+    cache go through the LLM scheduler.
+    """
+    model = _models.get(node)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        if node not in _models:
+            update = {"callbacks": [LLMMetrics(node)]}
+            if node in llm_cache_nodes:
+                _node_caches[node] = NodeCache(node, llm_response_store)
+                update["cache"] = _node_caches[node]
+            _models[node] = scheduled(_chat_model or get_chat_model(), node, cache_key, **update)
+        return _models[node]
+
+
+def set_chat_model(model):
+    '''Use model instead of the Gemini model from now on, the offline benchmarks plug their scripted model in here'''
+    global _chat_model
+    with _models_lock:
+        _chat_model = model
+        _models.clear()
+        _node_caches.clear()
+
+
+def llm_cache_stats():
+    '''Hits, misses and hit rate per cached node, plus the size of the store'''
+    nodes = {}
+    for node, cache in list(_node_caches.items()):
+        lookups = cache.hits + cache.misses
+        nodes[node] = {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "hit_rate": cache.hits / lookups if lookups else 0.0,
+        }
+    return {"nodes": nodes, "store": llm_response_store.stats()}
@@ -0,0 +1,476 @@
+"""
+Scheduling of the calls that reach the chat model.
+
+Every call first takes a slot of its node (when the node has a cap) and a
+slot of the process-wide cap, then a token from the rate limiter, and gives
+the slots back when the model answered. Calls that fail with a transient
+error (throttling, timeouts, 5xx) are retried with jittered exponential
+backoff. A call identical to one already in flight (same model settings,
+tools and messages) waits for that call and gets a copy of its answer,
+streamed calls excepted.
+
+Cache hits of the LLM response cache never get here, they cost no slot or
+token.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from copy import deepcopy
+from concurrent.futures import Future, CancelledError as FutureCancelledError
+from typing import Callable
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
+
+from helpers.metrics import (
+    record_llm_admitted,
+    record_llm_finished,
+    record_llm_retry,
+    record_llm_coalesced,
+)
+from config.config import (
+    llm_scheduler_enabled,
+    llm_max_concurrency,
+    llm_node_concurrency,
+    llm_rate_limit,
+    llm_rate_burst,
+    llm_max_retries,
+    llm_retry_base,
+    llm_retry_max,
+    llm_coalesce,
+)
+
+# HTTP statuses worth another try: timeout, throttling and server errors
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Transient errors of the provider SDKs and HTTP clients, by class name so none has to be imported
+TRANSIENT_ERRORS = {
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+    "TooManyRequests", "RateLimitError", "APITimeoutError", "APIConnectionError", "ServerError",
+    "ReadTimeout", "ConnectTimeout", "ConnectError", "RemoteProtocolError",
+}
+
+
+def is_transient(error):
+    '''True for errors that may well not happen again on the next try'''
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    for attribute in ("status_code", "code", "status"):
+        status = getattr(error, attribute, None)
+        if isinstance(status, int) and status in TRANSIENT_STATUSES:
+            return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+class Slots:
+    """
+    Counting semaphore shared by threads and event loops, waiters are served
+    first come first served. Threads block on acquire(), coroutines await
+    aacquire() without blocking their loop.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        '''None when a slot was taken, else the Future that resolves once one is handed over'''
+        with self._lock:
+            if self.used < self.size and not self._waiters:
+                self.used += 1
+                return None
+            waiter = Future()
+            self._waiters.append(waiter)
+            return waiter
+
+    def acquire(self):
+        waiter = self._try_acquire()
+        if waiter is not None:
+            waiter.result()
+
+    async def aacquire(self):
+        waiter = self._try_acquire()
+        if waiter is None:
+            return
+        try:
+            await asyncio.wrap_future(waiter)
+        except asyncio.CancelledError:
+            # the slot may have been handed over just as the task was cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                # the slot passes straight to the next waiter that is still waiting
+                if waiter.set_running_or_notify_cancel():
+                    waiter.set_result(None)
+                    return
+            self.used -= 1
+
+
+class TokenBucket:
+    '''rate calls per second on average, up to burst at once after a quiet period'''
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        '''Take a token, returns the seconds to wait before using it'''
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # a negative balance is the queue of reservations ahead of this one
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency, node_concurrency, rate, burst, max_retries, backoff_base, backoff_max, coalesce):
+        self.global_slots = Slots(max_concurrency) if max_concurrency > 0 else None
+        self.node_slots = {node: Slots(size) for node, size in node_concurrency.items() if size > 0}
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.coalesce = coalesce
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def _slots(self, node):
+        # the node's own slot first, so a node at its cap does not hold a global slot while it waits
+        return [slots for slots in (self.node_slots.get(node), self.global_slots) if slots is not None]
+
+    def _admit(self, node):
+        start = time.perf_counter()
+        acquired = []
+        try:
+            for slots in self._slots(node):
+                slots.acquire()
+                acquired.append(slots)
+            if self.bucket is not None:
+                time.sleep(self.bucket.reserve())
+        except BaseException:
+            self._release(node, acquired, admitted=False)
+            raise
+        record_llm_admitted(node, start)
+        return acquired
+
+    async def _aadmit(self, node):
+        start = time.perf_counter()
+        acquired = []
+        try:
+            for slots in self._slots(node):
+                await slots.aacquire()
+                acquired.append(slots)
+            if self.bucket is not None:
+                await asyncio.sleep(self.bucket.reserve())
+        except BaseException:
+            self._release(node, acquired, admitted=False)
+            raise
+        record_llm_admitted(node, start)
+        return acquired
+
+    def _release(self, node, acquired, admitted=True):
+        for slots in reversed(acquired):
+            slots.release()
+        if admitted:
+            record_llm_finished(node)
+
+    def _retry(self, node, attempt, error):
+        '''Seconds to wait before the next attempt, None when the error is final'''
+        if attempt >= self.max_retries or not is_transient(error):
+            return None
+        record_llm_retry(node)
+        # full jitter: anywhere up to the exponential backoff, so throttled callers spread out
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _attempts(self, node, call):
+        attempt = 0
+        while True:
+            acquired = self._admit(node)
+            try:
+                return call()
+            except Exception as error:
+                delay = self._retry(node, attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                self._release(node, acquired)
+            time.sleep(delay)
+            attempt += 1
+
+    async def _aattempts(self, node, acall):
+        attempt = 0
+        while True:
+            acquired = await self._aadmit(node)
+            try:
+                return await acall()
+            except Exception as error:
+                delay = self._retry(node, attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                self._release(node, acquired)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _stream_attempts(self, node, stream):
+        attempt = 0
+        while True:
+            acquired = self._admit(node)
+            started = False
+            try:
+                for chunk in stream():
+                    started = True
+                    yield chunk
+                return
+            except Exception as error:
+                # once chunks were passed on the call cannot be repeated
+                delay = None if started else self._retry(node, attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                self._release(node, acquired)
+            time.sleep(delay)
+            attempt += 1
+
+    async def _astream_attempts(self, node, astream):
+        attempt = 0
+        while True:
+            acquired = await self._aadmit(node)
+            started = False
+            try:
+                async for chunk in astream():
+                    started = True
+                    yield chunk
+                return
+            except Exception as error:
+                delay = None if started else self._retry(node, attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                self._release(node, acquired)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _join(self, node, key):
+        '''Returns (leader, flight): the leader makes the call, the others wait for its flight'''
+        if key is None or not self.coalesce:
+            return True, None
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                record_llm_coalesced(node)
+                return False, flight
+            # left pending so a cancelled leader can cancel it
+            flight = self._flights[key] = Future()
+            return True, flight
+
+    def _land(self, key, flight, result=None, error=None):
+        with self._flights_lock:
+            self._flights.pop(key, None)
+        if error is None:
+            flight.set_result(result)
+        elif isinstance(error, Exception):
+            flight.set_exception(error)
+        else:
+            # the leader was cancelled, its followers make the call themselves
+            flight.cancel()
+
+    def call(self, node, key, call, copy):
+        """
+        Run call() for node. copy(result) gives every caller that joined an
+        identical call in flight its own copy of the answer.
+        """
+        leader, flight = self._join(node, key)
+        if not leader:
+            try:
+                return copy(flight.result())
+            except FutureCancelledError:
+                # the leader was cancelled, one of its followers takes over
+                return self.call(node, key, call, copy)
+        if flight is None:
+            return self._attempts(node, call)
+
+        try:
+            result = self._attempts(node, call)
+        except BaseException as error:
+            self._land(key, flight, error=error)
+            raise
+        self._land(key, flight, copy(result))
+        return result
+
+    async def acall(self, node, key, acall, copy):
+        leader, flight = self._join(node, key)
+        if not leader:
+            try:
+                return copy(await asyncio.wrap_future(flight))
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                return await self.acall(node, key, acall, copy)
+        if flight is None:
+            return await self._aattempts(node, acall)
+
+        try:
+            result = await self._aattempts(node, acall)
+        except BaseException as error:
+            self._land(key, flight, error=error)
+            raise
+        self._land(key, flight, copy(result))
+        return result
+
+    def stream(self, node, stream):
+        """
+        Streaming call(). Streams are never coalesced: a caller joining one in
+        flight would see nothing until the whole answer is there.
+        """
+        return self._stream_attempts(node, stream)
+
+    def astream(self, node, astream):
+        return self._astream_attempts(node, astream)
+
+
+llm_scheduler = LLMScheduler(
+    llm_max_concurrency,
+    llm_node_concurrency,
+    llm_rate_limit,
+    llm_rate_burst,
+    llm_max_retries,
+    llm_retry_base,
+    llm_retry_max,
+    llm_coalesce,
+)
+
+
+def _shared_copy(result):
+    '''Copy of a ChatResult for another caller, without the message id so its run sets its own'''
+    result = deepcopy(result)
+    for generation in result.generations:
+        generation.message.id = None
+    return result
+
+
+def _rebind(runnable, model, scheduled_model):
+    """
+    runnable with every use of model replaced by scheduled_model. Used on the
+    runnables model.bind_tools() and model.with_structured_output() build, so
+    the provider formats the tools and schemas and the calls still go
+    through the scheduler.
+    """
+    if runnable is model:
+        return scheduled_model
+    if isinstance(runnable, (list, tuple)):
+        items = [_rebind(item, model, scheduled_model) for item in runnable]
+        return type(runnable)(items) if any(new is not old for new, old in zip(items, runnable)) else runnable
+    if isinstance(runnable, dict):
+        items = {key: _rebind(value, model, scheduled_model) for key, value in runnable.items()}
+        return items if any(items[key] is not value for key, value in runnable.items()) else runnable
+    if not isinstance(runnable, Runnable) or not isinstance(runnable, BaseModel) or isinstance(runnable, BaseChatModel):
+        return runnable
+
+    update = {}
+    for name in type(runnable).model_fields:
+        value = getattr(runnable, name)
+        rebound = _rebind(value, model, scheduled_model)
+        if rebound is not value:
+            update[name] = rebound
+    return runnable.model_copy(update=update) if update else runnable
+
+
+class ScheduledChatModel(BaseChatModel):
+    """
+    model with its calls scheduled as node. The response cache and callbacks
+    are set on this wrapper, so cache hits never take a slot and each call is
+    reported once. Everything that shapes a request (llm_string, tool and
+    schema formatting, streaming support) comes from model, so cache keys are
+    the same as without the scheduler.
+    """
+
+    model: BaseChatModel
+    node: str
+    # request_key(prompt, llm_string) identifies a request for coalescing, the LLM cache key
+    request_key: Callable[[str, str], str]
+
+    @property
+    def _llm_type(self):
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self):
+        return self.model._identifying_params
+
+    def _get_llm_string(self, stop=None, **kwargs):
+        return self.model._get_llm_string(stop=stop, **kwargs)
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        return self.model._get_ls_params(stop=stop, **kwargs)
+
+    def _combine_llm_outputs(self, llm_outputs):
+        return self.model._combine_llm_outputs(llm_outputs)
+
+    def _should_stream(self, *, async_api, run_manager=None, **kwargs):
+        return self.model._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    def _should_use_protocol_streaming(self, *, async_api, run_manager=None, **kwargs):
+        return self.model._should_use_protocol_streaming(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    def _key(self, messages, stop, kwargs):
+        return self.request_key(dumps(messages), self._get_llm_string(stop=stop, **kwargs))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return llm_scheduler.call(
+            self.node,
+            self._key(messages, stop, kwargs),
+            lambda: self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            _shared_copy,
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await llm_scheduler.acall(
+            self.node,
+            self._key(messages, stop, kwargs),
+            lambda: self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            _shared_copy,
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        return llm_scheduler.stream(
+            self.node, lambda: self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        return llm_scheduler.astream(
+            self.node, lambda: self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    def bind_tools(self, tools, **kwargs):
+        return _rebind(self.model.bind_tools(tools, **kwargs), self.model, self)
+
+    def with_structured_output(self, schema, **kwargs):
+        return _rebind(self.model.with_structured_output(schema, **kwargs), self.model, self)
+
+
+def scheduled(model, node, request_key, **fields):
+    """
+    model wrapped so its calls are scheduled as node, fields (callbacks,
+    cache) are set on the wrapper. Returns a copy of model with fields when
+    LLM_SCHEDULER is off.
+    """
+    if not llm_scheduler_enabled:
+        return model.model_copy(update=fields)
+    return ScheduledChatModel(model=model, node=node, request_key=request_key, name=model.get_name(), **fields)
@@ -0,0 +1,358 @@
+import functools
+import hashlib
+import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from helpers.sql_parser import fingerprint, SQLParseError
+from config.config import metrics_enabled, metrics_max_sql_fingerprints, otel_enabled
+
+# Seconds, from a cached lookup to a slow model call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self, **labels):
+        '''(count, sum) observed for the labels'''
+        counts, total = self._values.get(self._key(labels), ([0] * len(self.buckets), 0.0))
+        return counts[-1], total
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = [
+            f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {count}"
+            for bound, count in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    '''The process's metrics, rendered in the Prometheus text format'''
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+node_seconds = registry.add(Histogram(
+    "speaksql_node_duration_seconds", "Wall time of one graph node run", ["node", "status"]))
+tool_seconds = registry.add(Histogram(
+    "speaksql_tool_duration_seconds", "Wall time of one tool call", ["tool", "status"]))
+tool_loop_iterations = registry.add(Histogram(
+    "speaksql_tool_loop_iterations", "Model calls in one tool loop of a node", ["node"], ITERATION_BUCKETS))
+llm_seconds = registry.add(Histogram(
+    "speaksql_llm_duration_seconds", "Wall time of one model call", ["node"]))
+llm_calls = registry.add(Counter(
+    "speaksql_llm_calls_total", "Model calls, result is model or cache", ["node", "result"]))
+llm_tokens = registry.add(Counter(
+    "speaksql_llm_tokens_total", "Tokens sent to and received from the model", ["node", "direction"]))
+llm_queue_wait_seconds = registry.add(Histogram(
+    "speaksql_llm_queue_wait_seconds", "Time a model call waited for a concurrency slot and a rate limit token", ["node"]))
+llm_in_flight = registry.add(Gauge(
+    "speaksql_llm_in_flight", "Model calls running right now", ["node"]))
+llm_retries = registry.add(Counter(
+    "speaksql_llm_retries_total", "Model calls retried after a transient error", ["node"]))
+llm_coalesced = registry.add(Counter(
+    "speaksql_llm_coalesced_total", "Model calls answered by an identical call already in flight", ["node"]))
+query_check_seconds = registry.add(Histogram(
+    "speaksql_query_check_duration_seconds", "Wall time of one query safety check", ["mode", "source"]))
+query_guard_outcomes = registry.add(Counter(
+    "speaksql_query_guard_total", "read_db queries by guard outcome: passed, limited, rejected or cancelled", ["outcome"]))
+sql_seconds = registry.add(Histogram(
+    "speaksql_sql_duration_seconds", "Execution time of one SQL statement", ["fingerprint"]))
+sql_fingerprint_info = registry.add(Gauge(
+    "speaksql_sql_fingerprint_info", "Statement shape behind each fingerprint label", ["fingerprint", "statement"]))
+
+
+def render_metrics():
+    return registry.render()
+
+
+_tracer = None
+_tracer_loaded = False
+
+
+def _get_tracer():
+    # opentelemetry is only imported by the first span once tracing is enabled
+    global _tracer, _tracer_loaded
+    if not _tracer_loaded:
+        if otel_enabled:
+            try:
+                from opentelemetry import trace
+                _tracer = trace.get_tracer("speak-sql")
+            except ImportError:
+                _tracer = None
+        _tracer_loaded = True
+    return _tracer
+
+
+def span(name, **attributes):
+    '''An OpenTelemetry span when OTEL_ENABLED is set and opentelemetry is installed, otherwise a no-op'''
+    tracer = _get_tracer()
+    if tracer is None:
+        return nullcontext()
+    return tracer.start_as_current_span(name, attributes={key: str(value) for key, value in attributes.items()})
+
+
+@contextmanager
+def timed(histogram, span_name, **labels):
+    """
+    Observe the wall time of the block in histogram under labels and wrap it
+    in a span. A status label, when the histogram has one, is ok, error or
+    interrupted (a GraphInterrupt is how nodes wait for the user).
+    """
+    from langgraph.errors import GraphInterrupt
+
+    status = "ok"
+    start = time.perf_counter()
+    with span(span_name, **labels):
+        try:
+            yield
+        except GraphInterrupt:
+            status = "interrupted"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if metrics_enabled:
+                if "status" in histogram.labelnames:
+                    labels["status"] = status
+                histogram.observe(time.perf_counter() - start, **labels)
+
+
+def instrument_node(name, func):
+    '''Wrap a graph node function, sync or async, so every run is timed as name'''
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def anode(*args, **kwargs):
+            with timed(node_seconds, f"node {name}", node=name):
+                return await func(*args, **kwargs)
+        return anode
+
+    @functools.wraps(func)
+    def node(*args, **kwargs):
+        with timed(node_seconds, f"node {name}", node=name):
+            return func(*args, **kwargs)
+    return node
+
+
+def record_tool_loop(node, iterations):
+    if metrics_enabled:
+        tool_loop_iterations.observe(iterations, node=node)
+
+
+def record_query_check(mode, source, start):
+    '''source is where the verdict came from: cache, local or llm'''
+    if metrics_enabled:
+        query_check_seconds.observe(time.perf_counter() - start, mode=mode, source=source)
+
+
+def record_query_guard(outcome):
+    if metrics_enabled:
+        query_guard_outcomes.inc(outcome=outcome)
+
+
+def record_llm_admitted(node, start):
+    '''A model call of node got its slots and token after waiting since start'''
+    if metrics_enabled:
+        llm_queue_wait_seconds.observe(time.perf_counter() - start, node=node)
+        llm_in_flight.inc(node=node)
+
+
+def record_llm_finished(node):
+    if metrics_enabled:
+        llm_in_flight.inc(-1, node=node)
+
+
+def record_llm_retry(node):
+    if metrics_enabled:
+        llm_retries.inc(node=node)
+
+
+def record_llm_coalesced(node):
+    if metrics_enabled:
+        llm_coalesced.inc(node=node)
+
+
+def record_llm_call(node, start, messages, message):
+    """
+    A model call of node that started at start answered messages with
+    message. Tokens come from the provider's usage metadata, or are estimated
+    when a model does not report them. Cached responses count as calls only.
+    """
+    if not metrics_enabled:
+        return
+    if message is not None and message.response_metadata.get("cached"):
+        llm_calls.inc(node=node, result="cache")
+        return
+
+    from langchain_core.messages.utils import count_tokens_approximately
+
+    llm_seconds.observe(time.perf_counter() - start, node=node)
+    llm_calls.inc(node=node, result="model")
+
+    usage = getattr(message, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens") or count_tokens_approximately(messages)
+    output_tokens = usage.get("output_tokens")
+    if output_tokens is None:
+        output_tokens = count_tokens_approximately([message]) if message is not None else 0
+    llm_tokens.inc(input_tokens, node=node, direction="input")
+    llm_tokens.inc(output_tokens, node=node, direction="output")
+
+
+def record_llm_error(node):
+    if metrics_enabled:
+        llm_calls.inc(node=node, result="error")
+
+
+_WHITESPACE = re.compile(r"\s+")
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def sql_fingerprint(statement):
+    """
+    Short label for the shape of statement, literals replaced by placeholders.
+    After METRICS_MAX_SQL_FINGERPRINTS distinct shapes new ones share "other"
+    so the label set stays bounded.
+    """
+    try:
+        shape = fingerprint(statement)
+    except SQLParseError:
+        shape = _WHITESPACE.sub(" ", statement).strip()
+    label = hashlib.sha1(shape.encode()).hexdigest()[:12]
+
+    if label in _fingerprints:
+        return label
+    with _fingerprints_lock:
+        if label not in _fingerprints:
+            if len(_fingerprints) >= metrics_max_sql_fingerprints:
+                return "other"
+            _fingerprints[label] = shape
+            sql_fingerprint_info.set(1, fingerprint=label, statement=shape[:200])
+    return label
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if started:
+        sql_seconds.observe(time.perf_counter() - started.pop(), fingerprint=sql_fingerprint(statement))
+
+
+def _handle_error(context):
+    started = context.connection.info.get("metrics_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def listen_sql(engine):
+    '''Time every statement engine runs, grouped by fingerprint'''
+    if not metrics_enabled:
+        return
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
@@ -0,0 +1,179 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import text
+
+from helpers.get_db import get_engine, get_async_engine
+from config.config import get_db_uri, get_async_db_uri, museum_catalog_ttl, museum_catalog_min_score
+
+COLUMNS = (
+    "museum_id", "name", "location", "city", "state", "description",
+    "contact_email", "contact_number", "opening_time", "closing_time",
+)
+
+# Fields the fuzzy index covers
+INDEXED_FIELDS = ("name", "city", "state")
+
+_LOAD_QUERY = f"SELECT {', '.join(COLUMNS)} FROM museums"
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def trigrams(value):
+    '''Trigrams of every word, padded the way pg_trgm does it'''
+    grams = set()
+    for word in _WORD.findall(str(value or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+def _score(query_grams, index, trigram_counts):
+    if not query_grams:
+        return {}
+
+    best = {}
+    for field in INDEXED_FIELDS:
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(index[field].get(gram, ()))
+
+        for museum_id, count in shared.items():
+            # share of the query found in the field, with the pg_trgm
+            # similarity breaking ties in favour of the closer match
+            union = len(query_grams) + trigram_counts[field][museum_id] - count
+            score = 0.7 * count / len(query_grams) + 0.3 * count / union
+            best[museum_id] = max(best.get(museum_id, 0.0), score)
+    return best
+
+
+class MuseumCatalog:
+    """
+    The museums table held in memory with a trigram index on name, city and
+    state. It is reloaded after ttl seconds or as soon as a write touches the
+    museums table, the museum lookups then skip the database entirely.
+    """
+
+    def __init__(self, ttl, min_score):
+        self.ttl = ttl
+        self.min_score = min_score
+        self.museums = {}
+        self.index = {}
+        self.trigram_counts = {}
+        self.loaded_at = None
+        self.loads = 0
+        self.lookups = 0
+        # bumped by invalidate, a load that raced with a write is not kept
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def _install(self, rows, generation):
+        museums = {row["museum_id"]: row for row in rows}
+        index = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        trigram_counts = {field: {} for field in INDEXED_FIELDS}
+
+        for museum_id, row in museums.items():
+            for field in INDEXED_FIELDS:
+                grams = trigrams(row[field])
+                trigram_counts[field][museum_id] = len(grams)
+                for gram in grams:
+                    index[field][gram].add(museum_id)
+
+        with self._lock:
+            self.museums, self.index, self.trigram_counts = museums, index, trigram_counts
+            self.loads += 1
+            if generation == self._generation:
+                self.loaded_at = time.monotonic()
+
+    def refresh(self):
+        '''Reload the table now'''
+        generation = self._generation
+        with get_engine(get_db_uri()).connect() as connection:
+            rows = [dict(row._mapping) for row in connection.execute(text(_LOAD_QUERY))]
+        self._install(rows, generation)
+
+    async def arefresh(self):
+        generation = self._generation
+        async with get_async_engine(get_async_db_uri()).connect() as connection:
+            result = await connection.execute(text(_LOAD_QUERY))
+            rows = [dict(row._mapping) for row in result.fetchall()]
+        self._install(rows, generation)
+
+    def invalidate(self, tables=None):
+        '''Reload on next use when tables includes museums, None means unknown tables'''
+        if tables is None or "museums" in tables:
+            with self._lock:
+                self._generation += 1
+                self.loaded_at = None
+
+    def _search(self, query, limit):
+        # one consistent snapshot, a refresh may swap the tables while we score
+        with self._lock:
+            self.lookups += 1
+            museums, index, trigram_counts = self.museums, self.index, self.trigram_counts
+        scores = _score(trigrams(query), index, trigram_counts)
+        ranked = sorted(
+            (museum_id for museum_id, score in scores.items() if score >= self.min_score),
+            key=lambda museum_id: (-scores[museum_id], museum_id),
+        )
+        return [(museums[museum_id], round(scores[museum_id], 2)) for museum_id in ranked[:limit]]
+
+    def search(self, query, limit=3):
+        '''Best matching museums as (row, score) pairs, best first'''
+        if self._stale():
+            self.refresh()
+        return self._search(query, limit)
+
+    async def asearch(self, query, limit=3):
+        if self._stale():
+            await self.arefresh()
+        return self._search(query, limit)
+
+    def get(self, museum_id):
+        if self._stale():
+            self.refresh()
+        return self.museums.get(museum_id)
+
+    async def aget(self, museum_id):
+        if self._stale():
+            await self.arefresh()
+        return self.museums.get(museum_id)
+
+    def stats(self):
+        return {
+            "museums": len(self.museums),
+            "loads": self.loads,
+            "lookups": self.lookups,
+            "age": time.monotonic() - self.loaded_at if self.loaded_at is not None else None,
+        }
+
+
+def format_matches(matches):
+    '''One line per museum, the columns the booking and details flows need'''
+    if not matches:
+        return "No museum matches that name, city or state."
+
+    lines = []
+    for row, score in matches:
+        description = str(row["description"] or "")
+        if len(description) > 200:
+            description = description[:200] + "..."
+        lines.append(" | ".join([
+            f"museum_id={row['museum_id']}",
+            f"name={row['name']}",
+            f"location={row['location']}, {row['city']}, {row['state']}",
+            f"hours={row['opening_time']}-{row['closing_time']}",
+            f"email={row['contact_email']}",
+            f"phone={row['contact_number']}",
+            f"description={description}",
+            f"match={score}",
+        ]))
+    return "\n".join(lines)
+
+
+museum_catalog = MuseumCatalog(museum_catalog_ttl, museum_catalog_min_score)
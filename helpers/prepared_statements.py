@@ -0,0 +1,63 @@
+import re
+
+from sqlalchemy import text
+
+# Statements the application runs itself, written with named parameters. With
+# psycopg2 they are prepared once per connection and run with EXECUTE, so the
+# server skips parsing and planning. psycopg (3) binds parameters server side
+# and Postgres takes none in a utility statement like EXECUTE, so it and every
+# other driver run the statement as is; psycopg prepares it by itself after
+# prepare_threshold runs.
+PREPARED_STATEMENTS = {
+    "create_booking": {
+        "types": {
+            "museum_id": "int",
+            "visitor_name": "varchar",
+            "visitor_email": "varchar",
+            "num_tickets": "int",
+            "visit_date": "date",
+        },
+        "sql": (
+            "INSERT INTO tickets (museum_id, visitor_name, visitor_email, num_tickets, visit_date, status) "
+            "VALUES (:museum_id, :visitor_name, :visitor_email, :num_tickets, :visit_date, 'BOOKED') "
+            "RETURNING ticket_id"
+        ),
+    },
+}
+
+_PARAMETER = re.compile(r":(\w+)")
+
+# Drivers that interpolate parameters into the text before sending it
+_CLIENT_SIDE_BINDING = {"psycopg2"}
+
+
+def uses_prepared(dialect):
+    '''True when statements run through PREPARE/EXECUTE on connections of the dialect'''
+    return dialect.name == "postgresql" and dialect.driver in _CLIENT_SIDE_BINDING
+
+
+def prepare_sql(name):
+    '''PREPARE statement for Postgres, named parameters become $1, $2, ...'''
+    statement = PREPARED_STATEMENTS[name]
+    positions = {parameter: index for index, parameter in enumerate(statement["types"], start=1)}
+    body = _PARAMETER.sub(lambda match: f"${positions[match.group(1)]}", statement["sql"])
+    return f"PREPARE {name} ({', '.join(statement['types'].values())}) AS {body}"
+
+
+def statement(name, dialect):
+    '''The text() to run for name on a connection of the given dialect'''
+    parameters = PREPARED_STATEMENTS[name]["types"]
+    if uses_prepared(dialect):
+        return text(f"EXECUTE {name} ({', '.join(':' + parameter for parameter in parameters)})")
+    return text(PREPARED_STATEMENTS[name]["sql"])
+
+
+def prepare_all(dbapi_connection, connection_record=None):
+    '''Connect event listener, prepares every statement on a new psycopg2 connection'''
+    cursor = dbapi_connection.cursor()
+    try:
+        for name in PREPARED_STATEMENTS:
+            cursor.execute(prepare_sql(name))
+    finally:
+        cursor.close()
+    dbapi_connection.commit()
@@ -1,6 +1,14 @@
+import time
+
 from pydantic import BaseModel, Field
 from langchain.messages import SystemMessage, HumanMessage
-from config.config import google_model
+from langgraph.constants import TAG_NOSTREAM
+from config.config import query_check_mode
+from helpers.llm_cache import model_for
+from helpers.sql_validator import validate, SAFE, UNSURE, RULES_VERSION
+from helpers.sql_parser import fingerprint, normalize, SQLParseError
+from helpers.verdict_cache import verdict_cache
+from helpers.metrics import record_query_check, span
 
 sys_prompt_query_read = '''
 You are an expert SQL security validator. Your task is to determine if a given SQL query is safe for read-only operations.
@@ -9,7 +17,6 @@ You are an expert SQL security validator. Your task is to determine if a given S
 
 **SAFE (safe: true)** - Read-only operations that do not modify data or schema:
 - SELECT statements (with any clauses: WHERE, JOIN, GROUP BY, ORDER BY, LIMIT, etc.)
-- SHOW commands (SHOW TABLES, SHOW DATABASES, SHOW COLUMNS, etc.)
 - DESCRIBE or DESC commands
 - EXPLAIN or EXPLAIN ANALYZE
 - Database metadata queries
@@ -21,6 +28,7 @@ You are an expert SQL security validator. Your task is to determine if a given S
 - User/permission changes: GRANT, REVOKE, CREATE USER, DROP USER
 - Procedure calls: CALL, EXEC, EXECUTE (unless explicitly read-only)
 - Any query with functions that have side effects
+- SHOW commands, they reveal server settings
 - Comments attempting to inject code (e.g., "SELECT * FROM users; DROP TABLE users;--")
 
 **Security Considerations:**
@@ -33,7 +41,6 @@ You are an expert SQL security validator. Your task is to determine if a given S
 Valid read-only queries (safe: true):
 - SELECT * FROM museums LIMIT 10;
 - SELECT name, city FROM museums WHERE state = 'CA';
-- SHOW TABLES;
 - DESCRIBE museums;
 - EXPLAIN SELECT * FROM tickets WHERE museum_id = 5;
 - SELECT COUNT(*) FROM tickets;
@@ -122,8 +129,8 @@ class Safety(BaseModel):
     '''Safety of the query to read records'''
     safe: bool = Field(..., description="Is the query safe for reading records from the table")
 
-def check_query(query, mode):
-    messages = [
+def _llm_messages(query, mode):
+    return [
         SystemMessage(
             content=sys_prompt_query_read if mode=="read" else sys_prompt_query_write_and_update
         ),
@@ -132,7 +139,102 @@ def check_query(query, mode):
         )
     ]
 
-    model_with_structure = google_model.with_structured_output(Safety)
-    response = model_with_structure.invoke(messages)
+def check_query_llm(query, mode):
+    model_with_structure = model_for("query_check").with_structured_output(Safety).with_config(tags=[TAG_NOSTREAM])
+    response = model_with_structure.invoke(_llm_messages(query, mode))
 
     return response.safe
+
+async def acheck_query_llm(query, mode):
+    model_with_structure = model_for("query_check").with_structured_output(Safety).with_config(tags=[TAG_NOSTREAM])
+    response = await model_with_structure.ainvoke(_llm_messages(query, mode))
+
+    return response.safe
+
+def _cache_key(query, mode, check_mode, source):
+    # the validator only looks at the shape of a query, the model reads its literals too
+    try:
+        text = fingerprint(query) if source == "local" else normalize(query)
+    except SQLParseError:
+        return None
+    return f"{check_mode}:{mode}:{RULES_VERSION}:{source}:{text}"
+
+def _cached(key, mode, start):
+    if key is None:
+        return None
+    cached = verdict_cache.get(key)
+    if cached is not None:
+        record_query_check(mode, "cache", start)
+    return cached
+
+def _local_check(query, mode, check_mode, start):
+    '''The cached or local verdict, None when the model has to decide'''
+    if check_mode == "llm":
+        return None
+
+    key = _cache_key(query, mode, check_mode, "local")
+    cached = _cached(key, mode, start)
+    if cached is not None:
+        return cached
+
+    verdict = validate(query, mode)
+    if verdict.decision == UNSURE and check_mode == "hybrid":
+        return None
+
+    safe = verdict.decision == SAFE
+    if key is not None:
+        verdict_cache.set(key, safe)
+    record_query_check(mode, "local", start)
+    return safe
+
+def check_query(query, mode, check_mode=None):
+    """
+    Decide if the query is safe for the read or write tool.
+
+    local  - parser based validator only, ambiguous queries are rejected
+    llm    - always ask the model (the original behaviour)
+    hybrid - validator first, the model only decides the ambiguous queries
+
+    Local verdicts are cached per query fingerprint, so queries that only
+    differ in their literals are checked once. Model verdicts are cached per
+    query text, a literal can change what the model decides.
+    """
+    check_mode = check_mode or query_check_mode
+    start = time.perf_counter()
+
+    with span("check_query", mode=mode, check_mode=check_mode):
+        safe = _local_check(query, mode, check_mode, start)
+        if safe is not None:
+            return safe
+
+        key = _cache_key(query, mode, check_mode, "llm")
+        cached = _cached(key, mode, start)
+        if cached is not None:
+            return cached
+        safe = check_query_llm(query, mode)
+
+    if key is not None:
+        verdict_cache.set(key, safe)
+    record_query_check(mode, "llm", start)
+    return safe
+
+async def acheck_query(query, mode, check_mode=None):
+    """Async check_query, only the model call is awaited"""
+    check_mode = check_mode or query_check_mode
+    start = time.perf_counter()
+
+    with span("check_query", mode=mode, check_mode=check_mode):
+        safe = _local_check(query, mode, check_mode, start)
+        if safe is not None:
+            return safe
+
+        key = _cache_key(query, mode, check_mode, "llm")
+        cached = _cached(key, mode, start)
+        if cached is not None:
+            return cached
+        safe = await acheck_query_llm(query, mode)
+
+    if key is not None:
+        verdict_cache.set(key, safe)
+    record_query_check(mode, "llm", start)
+    return safe
@@ -0,0 +1,250 @@
+import json
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from helpers.cache import LRUCache
+from helpers.get_db import get_engine, get_async_engine, transaction_settings
+from helpers.metrics import record_query_guard
+from helpers.sql_parser import (
+    SQLParseError,
+    tokenize,
+    split_statements,
+    strip_tail,
+    top_level_words,
+    word,
+    fingerprint,
+)
+from config.config import (
+    query_guard_enabled,
+    query_guard_limit,
+    query_guard_max_cost,
+    query_guard_max_rows,
+    query_guard_timeout_ms,
+    query_guard_cache_size,
+    query_guard_cache_ttl,
+)
+
+# SQLSTATE of a statement cancelled by statement_timeout
+_QUERY_CANCELED = "57014"
+
+cancelled_message = (
+    f"The query was cancelled after {query_guard_timeout_ms} ms. Narrow it down with a more selective "
+    "WHERE clause (museum_id, ticket_id or visit_date), or aggregate instead of listing rows, and try again."
+)
+
+
+multiple_statements_message = "The query was not run: read_db runs exactly one SQL statement, send them one at a time."
+
+
+class Estimate(NamedTuple):
+    '''Planner estimate: total cost of the plan and the most rows any step of it handles'''
+    cost: float
+    rows: float
+
+
+class GuardedQuery(NamedTuple):
+    query: str
+    # LIMIT added to the query, None when it had one or is not a SELECT
+    row_limit: Optional[int]
+    timeout_ms: Optional[int]
+    # message for the model when the query must not run
+    rejection: Optional[str]
+
+
+def limit_query(query, limit):
+    """
+    Returns (query, row_limit): a single SELECT without a top-level LIMIT or
+    FETCH gets "LIMIT limit" appended, anything else comes back unchanged with
+    row_limit None.
+    """
+    try:
+        statements = split_statements(tokenize(query))
+    except SQLParseError:
+        return query, None
+    if len(statements) != 1 or word(statements[0][0]) not in ("SELECT", "WITH"):
+        return query, None
+
+    if {"LIMIT", "FETCH", "INTO", "FOR"} & set(top_level_words(statements[0])):
+        return query, None
+
+    # cut after the last token so a trailing semicolon or comment cannot swallow the LIMIT
+    return f"{strip_tail(query)} LIMIT {limit}", limit
+
+
+def _plan_rows(plan):
+    rows = plan.get("Plan Rows", 0)
+    # the steps under a Limit stop early, what they would still have to read is in the cost
+    if plan.get("Node Type") == "Limit":
+        return rows
+    for child in plan.get("Plans", ()):
+        rows = max(rows, _plan_rows(child))
+    return rows
+
+
+def estimate_from_plan(explained):
+    '''Estimate from the output of EXPLAIN (FORMAT JSON)'''
+    if isinstance(explained, str):
+        explained = json.loads(explained)
+    plan = explained[0]["Plan"]
+    return Estimate(float(plan.get("Total Cost", 0)), float(_plan_rows(plan)))
+
+
+def _statement_count(query):
+    '''Statements in query, None when it cannot be tokenized'''
+    try:
+        return len(split_statements(tokenize(query)))
+    except SQLParseError:
+        return None
+
+
+def _explain_statement(dialect, query):
+    # only Postgres gives a cost estimate, elsewhere the LIMIT and the result caps have to do
+    if dialect != "postgresql" or _statement_count(query) != 1:
+        return None
+    # EXPLAIN takes one statement, nothing after it may slip into the cost check
+    return text("EXPLAIN (FORMAT JSON) " + strip_tail(query))
+
+
+def is_cancelled(error):
+    '''True when the DBAPI error is a statement cancelled by statement_timeout'''
+    orig = getattr(error, "orig", None)
+    return (getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)) == _QUERY_CANCELED
+
+
+def rejection_message(estimate, max_cost, max_rows):
+    return (
+        f"The query was not run: the database estimates it handles about {estimate.rows:,.0f} rows "
+        f"(cost {estimate.cost:,.0f}), the limits are {max_rows:,.0f} rows and cost {max_cost:,.0f}. "
+        "Narrow it down: filter on museum_id, ticket_id or visit_date, join on those columns, "
+        "select only the columns needed, or use COUNT/GROUP BY instead of listing rows."
+    )
+
+
+def _row_bounds(query):
+    '''Values of every LIMIT, OFFSET and FETCH in the query, the fingerprint replaces them with ?'''
+    tokens = tokenize(query)
+    return tuple(
+        token.value
+        for previous, token in zip(tokens, tokens[1:])
+        if word(previous) in ("LIMIT", "OFFSET", "FIRST", "NEXT") and token.kind in ("number", "param")
+    )
+
+
+class QueryGuard:
+    """
+    Checks read_db queries before they run.
+
+    A query with more than one statement is rejected and an unbounded SELECT
+    gets a LIMIT. On Postgres the (limited) query is EXPLAINed in a read-only
+    transaction, and one whose estimated cost or row count is over the limits
+    is rejected with a message telling the model how to narrow it. Estimates
+    are cached per query fingerprint and LIMIT, OFFSET and FETCH values, so
+    queries that only differ in their other literals are planned once per
+    TTL while LIMIT 1 and LIMIT 1000000 are planned apart.
+    """
+
+    def __init__(self, enabled, limit, max_cost, max_rows, timeout_ms, cache_size, cache_ttl):
+        self.enabled = enabled
+        self.limit = limit
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.timeout_ms = timeout_ms
+        self.estimates = LRUCache(cache_size, cache_ttl)
+
+    def _prepare(self, uri, dialect, query):
+        '''Returns (query, row_limit, cache key, EXPLAIN statement or None)'''
+        query, row_limit = limit_query(query, self.limit) if self.limit else (query, None)
+        statement = _explain_statement(dialect, query)
+        if statement is None:
+            return query, row_limit, None, None
+        try:
+            key = (uri, fingerprint(query), _row_bounds(query))
+        except SQLParseError:
+            return query, row_limit, None, None
+        return query, row_limit, key, statement
+
+    def _multiple_statements(self, query):
+        '''Rejection of a query holding more than one statement, None for anything else'''
+        count = _statement_count(query)
+        if count is None or count <= 1:
+            return None
+        record_query_guard("rejected")
+        return GuardedQuery(query, None, self.timeout_ms, multiple_statements_message)
+
+    def _verdict(self, query, row_limit, estimate):
+        if estimate is not None and (estimate.cost > self.max_cost or estimate.rows > self.max_rows):
+            record_query_guard("rejected")
+            return GuardedQuery(query, row_limit, self.timeout_ms, rejection_message(estimate, self.max_cost, self.max_rows))
+
+        record_query_guard("limited" if row_limit is not None else "passed")
+        return GuardedQuery(query, row_limit, self.timeout_ms, None)
+
+    def check(self, uri, query):
+        if not self.enabled:
+            return GuardedQuery(query, None, None, None)
+
+        rejected = self._multiple_statements(query)
+        if rejected:
+            return rejected
+
+        engine = get_engine(uri)
+        query, row_limit, key, statement = self._prepare(uri, engine.dialect.name, query)
+        estimate = None
+        if statement is not None:
+            estimate = self.estimates.get(key)
+            if estimate is None:
+                try:
+                    with engine.begin() as connection:
+                        for setting, parameters in transaction_settings(connection, self.timeout_ms, read_only=True):
+                            connection.execute(setting, parameters)
+                        estimate = estimate_from_plan(connection.execute(statement).scalar())
+                except DBAPIError:
+                    # a query the planner rejects fails the same way when it runs
+                    estimate = None
+                else:
+                    self.estimates.set(key, estimate)
+
+        return self._verdict(query, row_limit, estimate)
+
+    async def acheck(self, uri, query):
+        '''Async check'''
+        if not self.enabled:
+            return GuardedQuery(query, None, None, None)
+
+        rejected = self._multiple_statements(query)
+        if rejected:
+            return rejected
+
+        engine = get_async_engine(uri)
+        query, row_limit, key, statement = self._prepare(uri, engine.dialect.name, query)
+        estimate = None
+        if statement is not None:
+            estimate = self.estimates.get(key)
+            if estimate is None:
+                try:
+                    async with engine.begin() as connection:
+                        for setting, parameters in transaction_settings(connection, self.timeout_ms, read_only=True):
+                            await connection.execute(setting, parameters)
+                        estimate = estimate_from_plan((await connection.execute(statement)).scalar())
+                except DBAPIError:
+                    estimate = None
+                else:
+                    self.estimates.set(key, estimate)
+
+        return self._verdict(query, row_limit, estimate)
+
+    def stats(self):
+        return self.estimates.stats()
+
+
+query_guard = QueryGuard(
+    query_guard_enabled,
+    query_guard_limit,
+    query_guard_max_cost,
+    query_guard_max_rows,
+    query_guard_timeout_ms,
+    query_guard_cache_size,
+    query_guard_cache_ttl,
+)
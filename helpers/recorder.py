@@ -0,0 +1,60 @@
+import time
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.errors import GraphInterrupt
+
+
+def _node_stats():
+    return {"calls": 0, "seconds": 0.0, "llm_calls": 0}
+
+
+class RunRecorder(BaseCallbackHandler):
+    """
+    Callback for one conversation, passed in the run config: the nodes in the
+    order they ran, and wall time and LLM calls per node. A node that waits
+    for the user runs again on resume, both runs count as one call.
+    """
+
+    # called in the run's own thread or task, never from a worker thread
+    run_inline = True
+
+    def __init__(self):
+        self.path = []
+        self.nodes = defaultdict(_node_stats)
+        self._started = {}
+        # the node that raised an interrupt, its resumed run is not a new call
+        self._interrupted = None
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # the node's own runnable is named after it too, only the outer run is timed
+        if node and kwargs.get("name") == node and parent_run_id not in self._started:
+            self._started[run_id] = (node, time.perf_counter())
+            if node == self._interrupted:
+                self._interrupted = None
+            else:
+                self.path.append(node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, interrupted=isinstance(error, GraphInterrupt))
+
+    def _finish(self, run_id, interrupted=False):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            self.nodes[node]["seconds"] += time.perf_counter() - start
+            if interrupted:
+                self._interrupted = node
+            else:
+                self.nodes[node]["calls"] += 1
+
+    def on_chat_model_start(self, serialized, messages, *, metadata=None, **kwargs):
+        self.nodes[(metadata or {}).get("langgraph_node", "other")]["llm_calls"] += 1
+
+    @property
+    def llm_calls(self):
+        return sum(stats["llm_calls"] for stats in self.nodes.values())
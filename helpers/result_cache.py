@@ -0,0 +1,140 @@
+import threading
+from collections import defaultdict
+
+from helpers.cache import LRUCache
+from helpers.schema import DERIVED_TABLES
+from helpers.sql_parser import SQLParseError, tokenize, split_statements, table_references, write_targets, normalize
+from config.config import (
+    result_cache_size,
+    result_cache_max_bytes,
+    result_cache_default_ttl,
+    result_cache_table_ttls,
+)
+
+
+class ResultCache:
+    '''
+    Read-through cache of query results keyed by the normalized SQL.
+
+    Every entry remembers the tables it read, its TTL is the shortest TTL of
+    those tables, and a write to a table drops every entry that read it.
+    '''
+
+    def __init__(self, max_entries, max_bytes, default_ttl, table_ttls):
+        self.entries = LRUCache(
+            max_entries,
+            max_bytes=max_bytes,
+            sizeof=lambda entry: len(entry[1]),
+        )
+        self.default_ttl = default_ttl
+        self.table_ttls = table_ttls
+        self.invalidations = 0
+        # bumped on every write, a read that raced with a write is not stored
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _ttl(self, tables):
+        return min(self.table_ttls.get(table, self.default_ttl) for table in tables)
+
+    def _generation(self, tables):
+        with self._lock:
+            return tuple(self._generations[table] for table in sorted(tables))
+
+    def _lookup(self, query):
+        '''Returns (key, tables, cached result), key is None when the query is not cacheable'''
+        try:
+            key = normalize(query)
+            tables = frozenset(name for name, _ in table_references(tokenize(query)))
+        except SQLParseError:
+            return None, None, None
+
+        if not tables or self._ttl(tables) <= 0:
+            return None, None, None
+
+        cached = self.entries.get(key)
+        return key, tables, cached[1] if cached is not None else None
+
+    def _store(self, key, tables, generation, result):
+        if isinstance(result, str) and generation == self._generation(tables):
+            self.entries.set(key, (tables, result), ttl=self._ttl(tables))
+
+    def read_through(self, query, load):
+        '''Return the cached result of the query, or load it and cache it'''
+        key, tables, cached = self._lookup(query)
+        if key is None:
+            return load()
+        if cached is not None:
+            return cached
+
+        generation = self._generation(tables)
+        result = load()
+        self._store(key, tables, generation, result)
+
+        return result
+
+    async def aread_through(self, query, aload):
+        '''Async read_through, aload is a coroutine function'''
+        key, tables, cached = self._lookup(query)
+        if key is None:
+            return await aload()
+        if cached is not None:
+            return cached
+
+        generation = self._generation(tables)
+        result = await aload()
+        self._store(key, tables, generation, result)
+
+        return result
+
+    def invalidate_tables(self, tables):
+        '''Drop every cached result that read one of the tables, None drops everything'''
+        if tables is None:
+            dropped = len(self.entries)
+            with self._lock:
+                for table in list(self._generations):
+                    self._generations[table] += 1
+            self.entries.clear()
+            self.invalidations += dropped
+            return dropped
+
+        tables = set(tables)
+        if not tables:
+            return 0
+        # tables the database updates along with them, like the daily booking counters
+        for table in list(tables):
+            tables |= DERIVED_TABLES.get(table, set())
+
+        with self._lock:
+            for table in tables:
+                self._generations[table] += 1
+
+        dropped = self.entries.delete_where(lambda entry: not entry[0].isdisjoint(tables))
+        self.invalidations += dropped
+        return dropped
+
+    def stats(self):
+        stats = self.entries.stats()
+        stats["invalidations"] = self.invalidations
+        return stats
+
+
+def written_tables(query):
+    '''Every table a write statement modifies, None when they cannot be told from the text'''
+    try:
+        statements = split_statements(tokenize(query))
+    except SQLParseError:
+        return None
+
+    tables = set()
+    for tokens in statements:
+        tables |= write_targets(tokens)
+
+    return tables or None
+
+
+result_cache = ResultCache(
+    result_cache_size,
+    result_cache_max_bytes,
+    result_cache_default_ttl,
+    result_cache_table_ttls,
+)
@@ -0,0 +1,125 @@
+import json
+
+from config.config import (
+    tool_result_formats,
+    tool_result_max_rows,
+    tool_result_max_bytes,
+    tool_result_value_chars,
+    tool_result_count_limit,
+)
+
+FORMATS = ("tsv", "jsonl", "repr")
+
+# What the model sees for a query that matched nothing
+NO_ROWS = "(no rows)"
+
+
+class ResultLimits:
+    '''How one tool's query results are written out for the model'''
+
+    def __init__(self, fmt, max_rows, max_bytes, value_chars, count_limit, row_limit=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown result format {fmt!r}, expected one of {', '.join(FORMATS)}")
+        self.format = fmt
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.value_chars = value_chars
+        self.count_limit = count_limit
+        # LIMIT the query was run with, reaching it means there may be more rows
+        self.row_limit = row_limit
+
+
+def limits_for(tool, row_limit=None):
+    return ResultLimits(
+        tool_result_formats.get(tool, "tsv"),
+        tool_result_max_rows.get(tool, 50),
+        tool_result_max_bytes.get(tool, 8000),
+        tool_result_value_chars,
+        tool_result_count_limit,
+        row_limit,
+    )
+
+
+def _shorten(value, limit):
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + "..."
+    return value
+
+
+def _tsv_value(value):
+    if value is None:
+        return "NULL"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _line(fmt, values):
+    if fmt == "tsv":
+        return "\t".join(_tsv_value(value) for value in values)
+    return json.dumps([_json_value(value) for value in values], ensure_ascii=False)
+
+
+class ResultWriter:
+    """
+    Writes the rows of a result for the model as they are read.
+
+    tsv and jsonl put the column names on the first line and one row per line
+    after it. Long values are cut to value_chars. Output stops at max_rows or
+    max_bytes, whichever comes first, and ends with a line saying how many
+    rows were left out; those are only counted, up to count_limit.
+    """
+
+    def __init__(self, columns, limits):
+        self.columns = list(columns)
+        self.limits = limits
+        self.lines = []
+        self.size = 0
+        self.left_out = 0
+
+    def add(self, row):
+        '''Take the next row, False once no further rows are needed'''
+        if self.left_out:
+            self.left_out += 1
+            return self.left_out < self.limits.count_limit
+
+        values = [_shorten(value, self.limits.value_chars) for value in row]
+        line = repr(tuple(values)) if self.limits.format == "repr" else _line(self.limits.format, values)
+
+        self.size += len(line.encode()) + 1
+        if len(self.lines) >= self.limits.max_rows or (self.lines and self.size > self.limits.max_bytes):
+            self.left_out = 1
+            return self.left_out < self.limits.count_limit
+
+        self.lines.append(line)
+        return True
+
+    def text(self):
+        if not self.lines:
+            return NO_ROWS
+
+        if self.limits.format == "repr":
+            text = "[" + ", ".join(self.lines) + "]"
+        else:
+            text = "\n".join([_line(self.limits.format, self.columns)] + self.lines)
+
+        if self.left_out:
+            capped = self.left_out >= self.limits.count_limit or (
+                self.limits.row_limit is not None and len(self.lines) + self.left_out >= self.limits.row_limit
+            )
+            more = f"at least {self.left_out}" if capped else self.left_out
+            text += f"\n... truncated, {more} more rows"
+        return text
+
+
+def format_rows(columns, rows, limits):
+    '''Write rows (any iterable) with a ResultWriter, reading no more of them than needed'''
+    writer = ResultWriter(columns, limits)
+    for row in rows:
+        if not writer.add(row):
+            break
+    return writer.text()
@@ -0,0 +1,343 @@
+"""
+The application tables, defined once.
+
+The same definition renders the schema text in the system prompts and
+creates the tables through versioned migrations. A database records the
+migrations applied to it in schema_migrations, migrate() applies the rest
+in order, each in its own transaction.
+"""
+import re
+from typing import Callable, NamedTuple
+
+from sqlalchemy import (
+    MetaData,
+    Table,
+    Column,
+    Integer,
+    String,
+    Text,
+    Time,
+    Date,
+    DateTime,
+    Numeric,
+    CheckConstraint,
+    ForeignKey,
+    Index,
+    func,
+    inspect,
+    select,
+    insert,
+    delete,
+    text,
+)
+from sqlalchemy.schema import CreateTable, CreateIndex, CreateColumn
+
+metadata = MetaData()
+
+museums = Table(
+    "museums",
+    metadata,
+    Column("museum_id", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("location", String(150), nullable=False),
+    Column("city", String(100)),
+    Column("state", String(100)),
+    Column("description", Text),
+    Column("contact_email", String(100)),
+    Column("contact_number", String(20)),
+    Column("opening_time", Time),
+    Column("closing_time", Time),
+    # tickets the museum sells per day, NULL for no limit
+    Column("capacity", Integer, CheckConstraint("capacity >= 0")),
+)
+
+tickets = Table(
+    "tickets",
+    metadata,
+    Column("ticket_id", Integer, primary_key=True),
+    Column("museum_id", Integer, ForeignKey("museums.museum_id", ondelete="CASCADE")),
+    Column("visitor_name", String(100), nullable=False),
+    Column("visitor_email", String(100)),
+    Column("num_tickets", Integer, CheckConstraint("num_tickets > 0")),
+    Column("total_price", Numeric(10, 2)),
+    Column("booking_date", Date, server_default=text("CURRENT_DATE")),
+    Column("visit_date", Date, nullable=False),
+    Column("status", String(20), server_default="BOOKED"),
+)
+
+# Status of the tickets that count against a museum's capacity
+BOOKED = "BOOKED"
+
+# Tickets booked per museum and day, kept up to date by triggers on tickets
+museum_daily_bookings = Table(
+    "museum_daily_bookings",
+    metadata,
+    Column("museum_id", Integer, ForeignKey("museums.museum_id", ondelete="CASCADE"), primary_key=True),
+    Column("visit_date", Date, primary_key=True),
+    Column("booked_tickets", Integer, nullable=False, server_default="0"),
+)
+
+# Tables the database writes itself when one of the keys is written
+DERIVED_TABLES = {"tickets": {"museum_daily_bookings"}}
+
+# Bookings of a museum on a day, the lookup behind availability and booking checks
+tickets_museum_visit_date = Index("tickets_museum_visit_date", tickets.c.museum_id, tickets.c.visit_date)
+
+# Trigram indexes behind the "name ILIKE '%...%'" searches, Postgres with pg_trgm only
+TRIGRAM_INDEXES = [
+    Index(
+        f"museums_{column}_trgm",
+        museums.c[column],
+        postgresql_using="gin",
+        postgresql_ops={column: "gin_trgm_ops"},
+    )
+    for column in ("name", "city", "state")
+]
+
+APP_TABLES = [museums, tickets, museum_daily_bookings]
+
+# Every insert, delete and update of a booked ticket moves its tickets in and out of
+# museum_daily_bookings in the same transaction
+_DAILY_BOOKINGS_TRIGGERS = {
+    "postgresql": [
+        """
+        CREATE OR REPLACE FUNCTION museum_daily_bookings_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                IF OLD.status = 'BOOKED' THEN
+                    UPDATE museum_daily_bookings
+                    SET booked_tickets = booked_tickets - COALESCE(OLD.num_tickets, 0)
+                    WHERE museum_id = OLD.museum_id AND visit_date = OLD.visit_date;
+                END IF;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                IF NEW.status = 'BOOKED' AND NEW.museum_id IS NOT NULL THEN
+                    INSERT INTO museum_daily_bookings (museum_id, visit_date, booked_tickets)
+                    VALUES (NEW.museum_id, NEW.visit_date, COALESCE(NEW.num_tickets, 0))
+                    ON CONFLICT (museum_id, visit_date)
+                    DO UPDATE SET booked_tickets = museum_daily_bookings.booked_tickets + EXCLUDED.booked_tickets;
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS tickets_museum_daily_bookings ON tickets",
+        """
+        CREATE TRIGGER tickets_museum_daily_bookings
+        AFTER INSERT OR DELETE OR UPDATE OF museum_id, visit_date, num_tickets, status ON tickets
+        FOR EACH ROW EXECUTE FUNCTION museum_daily_bookings_apply()
+        """,
+    ],
+    "sqlite": [
+        "DROP TRIGGER IF EXISTS tickets_daily_bookings_insert",
+        "DROP TRIGGER IF EXISTS tickets_daily_bookings_delete",
+        "DROP TRIGGER IF EXISTS tickets_daily_bookings_update",
+        """
+        CREATE TRIGGER tickets_daily_bookings_insert AFTER INSERT ON tickets
+        WHEN NEW.status = 'BOOKED' AND NEW.museum_id IS NOT NULL
+        BEGIN
+            INSERT INTO museum_daily_bookings (museum_id, visit_date, booked_tickets)
+            VALUES (NEW.museum_id, NEW.visit_date, COALESCE(NEW.num_tickets, 0))
+            ON CONFLICT (museum_id, visit_date) DO UPDATE SET booked_tickets = booked_tickets + excluded.booked_tickets;
+        END
+        """,
+        """
+        CREATE TRIGGER tickets_daily_bookings_delete AFTER DELETE ON tickets
+        WHEN OLD.status = 'BOOKED'
+        BEGIN
+            UPDATE museum_daily_bookings SET booked_tickets = booked_tickets - COALESCE(OLD.num_tickets, 0)
+            WHERE museum_id = OLD.museum_id AND visit_date = OLD.visit_date;
+        END
+        """,
+        """
+        CREATE TRIGGER tickets_daily_bookings_update AFTER UPDATE OF museum_id, visit_date, num_tickets, status ON tickets
+        BEGIN
+            UPDATE museum_daily_bookings SET booked_tickets = booked_tickets - COALESCE(OLD.num_tickets, 0)
+            WHERE OLD.status = 'BOOKED' AND museum_id = OLD.museum_id AND visit_date = OLD.visit_date;
+            INSERT INTO museum_daily_bookings (museum_id, visit_date, booked_tickets)
+            SELECT NEW.museum_id, NEW.visit_date, COALESCE(NEW.num_tickets, 0)
+            WHERE NEW.status = 'BOOKED' AND NEW.museum_id IS NOT NULL
+            ON CONFLICT (museum_id, visit_date) DO UPDATE SET booked_tickets = booked_tickets + excluded.booked_tickets;
+        END
+        """,
+    ],
+}
+
+# Bookkeeping of the applied migrations, not part of the prompt schema
+_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, server_default=text("CURRENT_TIMESTAMP")),
+)
+
+# Taken while migrating so two processes starting at once do not both apply a migration
+_ADVISORY_LOCK_ID = 7_413_021
+
+
+def _ddl(element, dialect):
+    '''DDL text of a CreateTable or CreateIndex, indented with spaces and ending in ";"'''
+    ddl = str(element.compile(dialect=dialect)).strip().replace("\t", "    ")
+    return re.sub(r"[ ]+\n", "\n", ddl) + ";"
+
+
+def prompt_schema():
+    '''CREATE statements of the application tables and indexes for the system prompts'''
+    from sqlalchemy.dialects import postgresql
+
+    dialect = postgresql.dialect()
+    statements = [_ddl(CreateTable(table), dialect) for table in APP_TABLES]
+    for table in APP_TABLES:
+        statements += [_ddl(CreateIndex(index), dialect) for index in sorted(table.indexes, key=lambda index: index.name)]
+    return "\n\n".join(statements)
+
+
+# The tables and indexes as migrations 1 to 3 create them. A released migration keeps creating
+# exactly what it created then, the definitions above can only move on through new migrations.
+_released = MetaData()
+
+_v1_museums = Table(
+    "museums",
+    _released,
+    Column("museum_id", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("location", String(150), nullable=False),
+    Column("city", String(100)),
+    Column("state", String(100)),
+    Column("description", Text),
+    Column("contact_email", String(100)),
+    Column("contact_number", String(20)),
+    Column("opening_time", Time),
+    Column("closing_time", Time),
+)
+
+_v1_tickets = Table(
+    "tickets",
+    _released,
+    Column("ticket_id", Integer, primary_key=True),
+    Column("museum_id", Integer, ForeignKey("museums.museum_id", ondelete="CASCADE")),
+    Column("visitor_name", String(100), nullable=False),
+    Column("visitor_email", String(100)),
+    Column("num_tickets", Integer, CheckConstraint("num_tickets > 0")),
+    Column("total_price", Numeric(10, 2)),
+    Column("booking_date", Date, server_default=text("CURRENT_DATE")),
+    Column("visit_date", Date, nullable=False),
+    Column("status", String(20), server_default="BOOKED"),
+)
+
+_v2_tickets_museum_visit_date = Index("tickets_museum_visit_date", _v1_tickets.c.museum_id, _v1_tickets.c.visit_date)
+
+_v2_trigram_indexes = [
+    Index(
+        f"museums_{column}_trgm",
+        _v1_museums.c[column],
+        postgresql_using="gin",
+        postgresql_ops={column: "gin_trgm_ops"},
+    )
+    for column in ("name", "city", "state")
+]
+
+_v3_museum_capacity = Column("capacity", Integer, CheckConstraint("capacity >= 0"))
+
+_v3_museum_daily_bookings = Table(
+    "museum_daily_bookings",
+    _released,
+    Column("museum_id", Integer, ForeignKey("museums.museum_id", ondelete="CASCADE"), primary_key=True),
+    Column("visit_date", Date, primary_key=True),
+    Column("booked_tickets", Integer, nullable=False, server_default="0"),
+)
+
+
+def _create_tables(connection):
+    for table in (_v1_museums, _v1_tickets):
+        connection.execute(CreateTable(table, if_not_exists=True))
+
+
+def _lookup_indexes(connection):
+    indexes = [_v2_tickets_museum_visit_date]
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        indexes += _v2_trigram_indexes
+    for index in indexes:
+        connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _add_column(connection, table_name, column):
+    # databases created before the migrations may already have it
+    if column.name in {existing["name"] for existing in inspect(connection).get_columns(table_name)}:
+        return
+    definition = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {definition}")
+
+
+def rebuild_daily_bookings(connection):
+    '''Recount museum_daily_bookings from the booked tickets, returns the museum days written'''
+    if connection.dialect.name == "postgresql":
+        # bookings written during the recount would be counted twice or not at all
+        connection.execute(text("LOCK TABLE tickets IN SHARE MODE"))
+
+    connection.execute(delete(museum_daily_bookings))
+    booked = (
+        select(tickets.c.museum_id, tickets.c.visit_date, func.coalesce(func.sum(tickets.c.num_tickets), 0))
+        .where(tickets.c.status == BOOKED, tickets.c.museum_id.is_not(None))
+        .group_by(tickets.c.museum_id, tickets.c.visit_date)
+    )
+    result = connection.execute(
+        insert(museum_daily_bookings).from_select(["museum_id", "visit_date", "booked_tickets"], booked)
+    )
+    return result.rowcount
+
+
+def _daily_bookings(connection):
+    _add_column(connection, "museums", _v3_museum_capacity)
+    connection.execute(CreateTable(_v3_museum_daily_bookings, if_not_exists=True))
+    for statement in _DAILY_BOOKINGS_TRIGGERS.get(connection.dialect.name, ()):
+        connection.exec_driver_sql(statement)
+    rebuild_daily_bookings(connection)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+# Append only: a migration that has been released is never changed
+MIGRATIONS = [
+    Migration(1, "create museums and tickets", _create_tables),
+    Migration(2, "lookup indexes", _lookup_indexes),
+    Migration(3, "museum capacity and daily booking counters", _daily_bookings),
+]
+
+
+def _applied_versions(connection):
+    _migrations.create(connection, checkfirst=True)
+    return set(connection.execute(select(_migrations.c.version)).scalars())
+
+
+def current_version(engine):
+    '''Latest migration applied to the database, 0 for none'''
+    with engine.begin() as connection:
+        return max(_applied_versions(connection), default=0)
+
+
+def migrate(engine, target=None):
+    '''Apply the pending migrations up to target (the latest by default), returns the versions applied'''
+    applied = []
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+
+        with engine.begin() as connection:
+            if connection.dialect.name == "postgresql":
+                connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _ADVISORY_LOCK_ID})
+            if migration.version in _applied_versions(connection):
+                continue
+
+            migration.apply(connection)
+            connection.execute(insert(_migrations).values(version=migration.version, name=migration.name))
+        applied.append(migration.version)
+
+    return applied
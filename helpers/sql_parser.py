@@ -0,0 +1,383 @@
+import re
+from typing import NamedTuple
+
+
+class SQLParseError(ValueError):
+    '''Raised when the SQL text cannot be tokenized'''
+
+
+class Token(NamedTuple):
+    # word, quoted, string, number, param, op or punct
+    kind: str
+    value: str
+
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ws>\s+)
+    | (?P<line_comment>--[^\n]*)
+    | (?P<block_comment>/\*)
+    | (?P<string>[Ee]'(?:[^'\\]|\\.|'')*'|[BbXxNn]?'(?:[^']|'')*')
+    | (?P<dollar>\$(?P<tag>[A-Za-z_]*)\$.*?\$(?P=tag)\$)
+    | (?P<quoted>"(?:[^"]|"")*")
+    | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<op>::|<>|!=|<=|>=|\|\||[-+*/%<>=~!@#^&|])
+    | (?P<param>\$\d+|%\(\w+\)s|%s|:\w+|\?)
+    | (?P<punct>[(),;.\[\]])
+    """,
+    re.S | re.X,
+)
+
+_SKIPPED = {"ws", "line_comment", "block_comment"}
+
+# Words that can never be an alias, they start the next clause instead
+CLAUSE_WORDS = {
+    "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL",
+    "OUTER", "ON", "USING", "GROUP", "ORDER", "LIMIT", "OFFSET", "FETCH",
+    "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW", "FOR", "SET",
+    "VALUES", "RETURNING", "SELECT", "DEFAULT", "LATERAL", "TABLESAMPLE",
+    "AND", "OR", "NOT", "AS", "FROM", "INTO", "WITH", "DO",
+}
+
+# Functions whose argument list uses FROM as a keyword (EXTRACT(YEAR FROM ...))
+_FROM_FUNCTIONS = {"EXTRACT", "SUBSTRING", "TRIM", "OVERLAY", "POSITION"}
+
+# Words followed by "(" that are syntax rather than function calls
+_PAREN_KEYWORDS = {
+    "IN", "VALUES", "EXISTS", "AS", "ANY", "ALL", "SOME", "ON", "USING",
+    "OVER", "FILTER", "WITHIN", "AND", "OR", "NOT", "FROM", "WHERE",
+    "SELECT", "INTO", "RETURNING", "JOIN", "SET", "THEN", "ELSE", "WHEN",
+    "CASE", "IS", "BY", "LATERAL", "CONFLICT", "TABLE", "WITH", "EXPLAIN",
+    "MATERIALIZED", "ROW", "ARRAY", "UNION", "EXCEPT", "INTERSECT",
+}
+
+
+def _block_comment_end(sql, pos):
+    '''End of the block comment opening at pos, Postgres block comments nest'''
+    depth = 0
+    while pos < len(sql):
+        if sql.startswith("/*", pos):
+            depth += 1
+            pos += 2
+        elif sql.startswith("*/", pos):
+            depth -= 1
+            pos += 2
+            if depth == 0:
+                return pos
+        else:
+            pos += 1
+    raise SQLParseError("Unterminated block comment")
+
+
+def _scan(sql):
+    '''(kind, start, end) of every token of sql, whitespace and comments included'''
+    pos = 0
+    while pos < len(sql):
+        match = _TOKEN_RE.match(sql, pos)
+        if not match:
+            raise SQLParseError(f"Unexpected character {sql[pos]!r} at position {pos}")
+
+        kind = match.lastgroup
+        end = match.end()
+        if kind == "block_comment":
+            end = _block_comment_end(sql, pos)
+        elif kind in ("tag", "dollar"):
+            kind = "string"
+        yield kind, pos, end
+        pos = end
+
+
+def tokenize(sql):
+    '''Split SQL text into tokens, dropping whitespace and comments'''
+    return [Token(kind, sql[start:end]) for kind, start, end in _scan(sql) if kind not in _SKIPPED]
+
+
+def strip_tail(sql):
+    '''The SQL text up to its last token, without trailing semicolons, comments or whitespace'''
+    last = 0
+    for kind, start, end in _scan(sql):
+        if kind not in _SKIPPED and sql[start:end] != ";":
+            last = end
+
+    return sql[:last]
+
+
+def split_statements(tokens):
+    '''Group tokens into statements separated by semicolons'''
+    statements = [[]]
+    for token in tokens:
+        if token.kind == "punct" and token.value == ";":
+            statements.append([])
+        else:
+            statements[-1].append(token)
+
+    return [statement for statement in statements if statement]
+
+
+def word(token):
+    '''Upper-cased keyword value of a word token, None for anything else'''
+    return token.value.upper() if token.kind == "word" else None
+
+
+def is_punct(token, value):
+    return token.kind == "punct" and token.value == value
+
+
+def identifier(token):
+    '''Normalized identifier name of a word or quoted token'''
+    if token.kind == "quoted":
+        return token.value[1:-1].replace('""', '"')
+    return token.value.lower()
+
+
+def cte_names(tokens):
+    '''Names defined in WITH clauses: "name AS (" or "name (cols) AS ("'''
+    names = set()
+    for i, token in enumerate(tokens):
+        if token.kind not in ("word", "quoted") or i == 0:
+            continue
+        previous = tokens[i - 1]
+        if not (word(previous) in ("WITH", "RECURSIVE") or is_punct(previous, ",")):
+            continue
+
+        j = i + 1
+        if j < len(tokens) and is_punct(tokens[j], "("):
+            depth = 0
+            while j < len(tokens):
+                if is_punct(tokens[j], "("):
+                    depth += 1
+                elif is_punct(tokens[j], ")"):
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            j += 1
+
+        if j + 1 < len(tokens) and word(tokens[j]) == "AS":
+            k = j + 1
+            while k < len(tokens) and word(tokens[k]) in ("NOT", "MATERIALIZED"):
+                k += 1
+            if k < len(tokens) and is_punct(tokens[k], "("):
+                names.add(identifier(token))
+
+    return names
+
+
+def _read_table_name(tokens, j):
+    '''Read a possibly schema qualified name starting at j, returns (name, next index)'''
+    parts = [identifier(tokens[j])]
+    j += 1
+    while j + 1 < len(tokens) and is_punct(tokens[j], ".") and tokens[j + 1].kind in ("word", "quoted"):
+        parts.append(identifier(tokens[j + 1]))
+        j += 2
+
+    if len(parts) > 1 and parts[0] == "public":
+        parts = parts[1:]
+    return ".".join(parts), j
+
+
+# Words that end a FROM list, the commas after them separate something else
+_FROM_LIST_END = {
+    "WHERE", "GROUP", "ORDER", "LIMIT", "OFFSET", "FETCH", "HAVING", "UNION",
+    "EXCEPT", "INTERSECT", "WINDOW", "FOR", "SET", "VALUES", "RETURNING", "SELECT",
+}
+
+# Words that open a subquery when they follow "(" in place of a relation
+_SUBQUERY_WORDS = {"SELECT", "WITH", "VALUES", "TABLE"}
+
+
+def _read_relation(tokens, j, ctes, references):
+    '''Record the relation named at j and skip its alias, returns the next index'''
+    start = j
+    name, j = _read_table_name(tokens, j)
+    if name not in ctes:
+        references.append((name, start))
+
+    if j < len(tokens) and word(tokens[j]) == "AS":
+        j += 2
+    elif j < len(tokens) and tokens[j].kind in ("word", "quoted") and word(tokens[j]) not in CLAUSE_WORDS:
+        j += 1
+    return j
+
+
+def table_references(tokens):
+    """
+    List of (table name, token index) for every relation read or written.
+
+    Every parenthesis level keeps track of whether it is inside a FROM list,
+    so relations after a comma are found after JOIN ... ON/USING too, and a
+    parenthesized relation (not a subquery) is read like an unwrapped one.
+    """
+    references = []
+    ctes = cte_names(tokens)
+    # one (word before the parenthesis, inside a FROM list) pair per level
+    levels = [[None, False]]
+    expect = False
+
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+
+        if expect:
+            expect = False
+            while i < len(tokens) and word(tokens[i]) in ("ONLY", "LATERAL"):
+                i += 1
+            if i >= len(tokens):
+                break
+            token = tokens[i]
+            if is_punct(token, "(") and not (i + 1 < len(tokens) and word(tokens[i + 1]) in _SUBQUERY_WORDS):
+                levels.append([None, True])
+                expect = True
+                i += 1
+                continue
+            if token.kind == "quoted" or (token.kind == "word" and word(token) not in CLAUSE_WORDS):
+                i = _read_relation(tokens, i, ctes, references)
+                continue
+
+        if is_punct(token, "("):
+            levels.append([word(tokens[i - 1]) if i else None, False])
+        elif is_punct(token, ")"):
+            if len(levels) > 1:
+                levels.pop()
+        elif is_punct(token, ","):
+            expect = levels[-1][1]
+
+        keyword = word(token)
+        if keyword == "FROM":
+            # EXTRACT(YEAR FROM ...) and IS DISTINCT FROM are not relation lists
+            if levels[-1][0] not in _FROM_FUNCTIONS and not (i and word(tokens[i - 1]) == "DISTINCT"):
+                levels[-1][1] = True
+                expect = True
+        elif keyword in ("JOIN", "INTO", "UPDATE", "TABLE"):
+            expect = True
+        elif keyword == "USING" and not (i + 1 < len(tokens) and is_punct(tokens[i + 1], "(")):
+            # DELETE ... USING and MERGE ... USING name more relations, JOIN ... USING a column list
+            levels[-1][1] = True
+            expect = True
+        elif keyword in _FROM_LIST_END:
+            levels[-1][1] = False
+        i += 1
+
+    return references
+
+
+def referenced_tables(tokens):
+    return {name for name, _ in table_references(tokens)}
+
+
+def write_targets(tokens):
+    '''Tables written by INSERT, UPDATE, DELETE or MERGE, writable CTEs included'''
+    targets = set()
+    for name, index in table_references(tokens):
+        j = index - 1
+        while j >= 0 and word(tokens[j]) == "ONLY":
+            j -= 1
+        before = word(tokens[j]) if j >= 0 else None
+        earlier = word(tokens[j - 1]) if j >= 1 else None
+        # SELECT ... FOR [NO KEY] UPDATE locks rows, it does not write them
+        if before == "UPDATE" and earlier not in ("FOR", "KEY"):
+            targets.add(name)
+        elif (before, earlier) in (("INTO", "INSERT"), ("INTO", "MERGE"), ("FROM", "DELETE")):
+            targets.add(name)
+    return targets
+
+
+def function_calls(tokens):
+    '''Lower-cased names of every function called in the statement'''
+    table_positions = {index for _, index in table_references(tokens)}
+    ctes = cte_names(tokens)
+    calls = set()
+
+    for i, token in enumerate(tokens[:-1]):
+        # "pg_sleep"(10) calls pg_sleep as surely as pg_sleep(10)
+        if token.kind not in ("word", "quoted") or not is_punct(tokens[i + 1], "("):
+            continue
+        if word(token) in _PAREN_KEYWORDS or i in table_positions:
+            continue
+        name = identifier(token).lower()
+        if name in ctes:
+            continue
+        # column list after a schema qualified table: INSERT INTO public.tickets (...)
+        if i >= 2 and is_punct(tokens[i - 1], ".") and i - 2 in table_positions:
+            continue
+        calls.add(name)
+
+    return calls
+
+
+def top_level_words(tokens):
+    '''Upper-cased keywords that appear outside any parentheses'''
+    depth = 0
+    words = []
+    for token in tokens:
+        if is_punct(token, "("):
+            depth += 1
+        elif is_punct(token, ")"):
+            depth -= 1
+        elif depth == 0 and token.kind == "word":
+            words.append(token.value.upper())
+
+    return words
+
+
+def clause_tokens(tokens, start_word, end_words):
+    '''Tokens of the top-level clause that starts at start_word'''
+    depth = 0
+    collecting = False
+    collected = []
+    for token in tokens:
+        if is_punct(token, "("):
+            depth += 1
+        elif is_punct(token, ")"):
+            depth -= 1
+
+        keyword = word(token)
+        if depth == 0 and keyword == start_word and not collecting:
+            collecting = True
+            continue
+        if collecting and depth == 0 and keyword in end_words:
+            break
+        if collecting:
+            collected.append(token)
+
+    return collected
+
+
+def _significant_tokens(sql):
+    tokens = tokenize(sql)
+    while tokens and is_punct(tokens[-1], ";"):
+        tokens.pop()
+    return tokens
+
+
+def normalize(sql):
+    '''Canonical text of the query: one space between tokens, keywords lower-cased, literals kept'''
+    return " ".join(
+        token.value.lower() if token.kind == "word" else token.value
+        for token in _significant_tokens(sql)
+    )
+
+
+def fingerprint(sql):
+    '''Shape of the query with every literal replaced by a placeholder'''
+    parts = []
+    for token in _significant_tokens(sql):
+        if token.kind in ("string", "number", "param"):
+            # a sign in front of a number belongs to the literal
+            if parts and parts[-1] == "-" and (len(parts) == 1 or parts[-2] in _SIGN_CONTEXT):
+                parts.pop()
+            # IN (?, ?, ?) and lists of any length share one fingerprint
+            if parts[-2:] == ["?", ","]:
+                parts.pop()
+                continue
+            parts.append("?")
+        elif token.kind == "word":
+            parts.append(token.value.lower())
+        else:
+            parts.append(token.value)
+
+    return " ".join(parts)
+
+
+_SIGN_CONTEXT = {"(", ",", "=", "<", ">", "<=", ">=", "<>", "!=", "+", "-", "*", "/"}
@@ -0,0 +1,336 @@
+from typing import NamedTuple
+
+from helpers.sql_parser import (
+    SQLParseError,
+    tokenize,
+    split_statements,
+    word,
+    is_punct,
+    table_references,
+    referenced_tables,
+    function_calls,
+    top_level_words,
+    clause_tokens,
+    identifier,
+    CLAUSE_WORDS,
+)
+
+# Bump when the rules change so persisted verdicts are not reused
+RULES_VERSION = 4
+
+SAFE = "safe"
+UNSAFE = "unsafe"
+UNSURE = "unsure"
+
+READ_TABLES = {"museums", "tickets", "museum_daily_bookings"}
+WRITE_TABLES = {"museums", "tickets"}
+# Deleting a museum cascades to its bookings, only tickets may be deleted
+DELETE_TABLES = {"tickets"}
+
+# System catalogs are not ours, but metadata reads are not obviously harmful either
+CATALOG_PREFIXES = ("information_schema.", "pg_catalog.")
+
+# DDL, permissions, transaction control and other side effects
+FORBIDDEN_WORDS = {
+    "DROP", "ALTER", "CREATE", "TRUNCATE", "RENAME", "GRANT", "REVOKE",
+    "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "BEGIN", "TRANSACTION",
+    "CALL", "EXEC", "EXECUTE", "PREPARE", "DEALLOCATE", "COPY", "VACUUM",
+    "LOCK", "LISTEN", "NOTIFY", "UNLISTEN", "REINDEX", "CLUSTER", "DISCARD",
+    "REFRESH", "SECURITY", "OWNER", "IMPORT", "LOAD", "REASSIGN", "CHECKPOINT",
+}
+FORBIDDEN_LEADING_WORDS = {"SET", "RESET", "DO", "START", "END", "ABORT", "COMMENT"}
+
+WRITE_WORDS = {"INSERT", "UPDATE", "DELETE", "MERGE"}
+
+SAFE_FUNCTIONS = {
+    "count", "sum", "avg", "min", "max", "coalesce", "nullif", "greatest",
+    "least", "lower", "upper", "initcap", "length", "char_length", "trim",
+    "ltrim", "rtrim", "btrim", "substring", "substr", "replace", "concat",
+    "concat_ws", "position", "strpos", "left", "right", "split_part",
+    "round", "floor", "ceil", "ceiling", "abs", "mod", "cast", "extract",
+    "date_part", "date_trunc", "to_char", "to_date", "to_timestamp",
+    "to_number", "now", "age", "make_date", "make_time", "string_agg",
+    "array_agg", "json_agg", "jsonb_agg", "row_number", "rank",
+    "dense_rank", "bool_and", "bool_or", "similarity", "unaccent",
+    "varchar", "char", "decimal", "numeric", "interval", "date", "time",
+    "timestamp", "int", "integer",
+}
+
+UNSAFE_FUNCTIONS = {
+    "pg_sleep", "pg_sleep_for", "pg_sleep_until", "pg_terminate_backend",
+    "pg_cancel_backend", "pg_reload_conf", "pg_read_file",
+    "pg_read_binary_file", "pg_ls_dir", "pg_stat_file", "lo_import",
+    "lo_export", "lo_unlink", "dblink", "dblink_exec", "set_config",
+    "nextval", "setval", "pg_advisory_lock", "pg_advisory_xact_lock",
+    "pg_try_advisory_lock", "pg_logical_emit_message", "query_to_xml",
+    "current_setting", "version", "inet_server_addr",
+}
+
+
+class Verdict(NamedTuple):
+    decision: str
+    reason: str
+
+
+def _check_functions(tokens):
+    calls = function_calls(tokens)
+    unsafe = calls & UNSAFE_FUNCTIONS
+    if unsafe:
+        return Verdict(UNSAFE, f"calls side-effecting function {sorted(unsafe)[0]}")
+
+    unknown = calls - SAFE_FUNCTIONS
+    if unknown:
+        return Verdict(UNSURE, f"calls unknown function {sorted(unknown)[0]}")
+
+    return None
+
+
+def _check_tables(tables, allowed):
+    outside = {table for table in tables if table not in allowed}
+    if not outside:
+        return None
+    if all(table.startswith(CATALOG_PREFIXES) for table in outside):
+        return Verdict(UNSURE, "reads system catalogs")
+    return Verdict(UNSAFE, f"touches table {sorted(outside)[0]} outside {sorted(allowed)}")
+
+
+def _strip_explain(tokens):
+    '''Drop EXPLAIN and its options so the explained statement can be checked'''
+    i = 1
+    if i < len(tokens) and is_punct(tokens[i], "("):
+        depth = 0
+        while i < len(tokens):
+            if is_punct(tokens[i], "("):
+                depth += 1
+            elif is_punct(tokens[i], ")"):
+                depth -= 1
+                if depth == 0:
+                    break
+            i += 1
+        i += 1
+    while i < len(tokens) and word(tokens[i]) in ("ANALYZE", "ANALYSE", "VERBOSE"):
+        i += 1
+
+    return tokens[i:]
+
+
+def _has_column_reference(tokens):
+    '''True when the WHERE clause compares against at least one column'''
+    for token in tokens:
+        if token.kind == "quoted":
+            return True
+        keyword = word(token)
+        if keyword and keyword not in CLAUSE_WORDS and keyword not in ("TRUE", "FALSE", "NULL", "IS", "IN", "LIKE", "ILIKE", "BETWEEN"):
+            return True
+    return False
+
+
+# Words a literal value may contain: typed literals (DATE '2025-01-01') and booleans
+_VALUE_WORDS = {"DATE", "TIME", "TIMESTAMP", "INTERVAL", "TRUE", "FALSE"}
+
+
+def _unwrap(tokens):
+    '''tokens without parentheses around all of them'''
+    while len(tokens) > 2 and is_punct(tokens[0], "(") and is_punct(tokens[-1], ")"):
+        depth = 0
+        for index, token in enumerate(tokens):
+            if is_punct(token, "("):
+                depth += 1
+            elif is_punct(token, ")"):
+                depth -= 1
+                if depth == 0 and index < len(tokens) - 1:
+                    return tokens
+        tokens = tokens[1:-1]
+    return tokens
+
+
+def _conjuncts(tokens):
+    '''Terms joined by top-level AND, the AND of a BETWEEN belongs to its term'''
+    terms = [[]]
+    depth = 0
+    between = False
+    for token in _unwrap(tokens):
+        if is_punct(token, "("):
+            depth += 1
+        elif is_punct(token, ")"):
+            depth -= 1
+        keyword = word(token) if depth == 0 else None
+        if keyword == "BETWEEN":
+            between = True
+        elif keyword == "AND":
+            if not between:
+                terms.append([])
+                continue
+            between = False
+        terms[-1].append(token)
+
+    conjuncts = []
+    for term in terms:
+        inner = _unwrap(term)
+        conjuncts.extend(_conjuncts(inner) if inner is not term else [term])
+    return [term for term in conjuncts if term]
+
+
+def _column(tokens):
+    '''Normalized name of a (qualified) column reference, None for anything else'''
+    if not tokens or len(tokens) % 2 == 0:
+        return None
+    for index, token in enumerate(tokens):
+        if index % 2:
+            if not is_punct(token, "."):
+                return None
+        elif token.kind not in ("word", "quoted") or word(token) in CLAUSE_WORDS | _VALUE_WORDS | {"NULL"}:
+            return None
+    return ".".join(identifier(token) for token in tokens[::2])
+
+
+def _is_value(tokens):
+    '''True for a literal or bound parameter, possibly cast or passed through a function'''
+    if not any(token.kind in ("string", "number", "param") for token in tokens):
+        return False
+    for index, token in enumerate(tokens):
+        if token.kind == "quoted" or (token.kind == "punct" and token.value not in "(),"):
+            return False
+        if token.kind == "word":
+            after_cast = index and tokens[index - 1].value == "::"
+            is_call = index + 1 < len(tokens) and is_punct(tokens[index + 1], "(")
+            if not (after_cast or is_call or word(token) in _VALUE_WORDS) or word(token) == "SELECT":
+                return False
+        if token.kind == "op" and token.value not in ("-", "+", "::", "||"):
+            return False
+    return True
+
+
+def _split_at(tokens, keyword=None, op=None):
+    '''(left, right) around the first top-level keyword or operator, None when it is missing'''
+    depth = 0
+    for index, token in enumerate(tokens):
+        if is_punct(token, "("):
+            depth += 1
+        elif is_punct(token, ")"):
+            depth -= 1
+        elif depth == 0 and ((keyword and word(token) == keyword) or (op and token.kind == "op" and token.value == op)):
+            return tokens[:index], tokens[index + 1:]
+    return None
+
+
+def _self_comparison(term):
+    '''Column compared to itself (status = status), true for every row with a value'''
+    for op in ("=", ">=", "<=", "<>", "!=", ">", "<"):
+        sides = _split_at(term, op=op)
+        if sides:
+            left, right = sides
+            return _column(left) is not None and _column(left) == _column(right)
+    return False
+
+
+def _pins_rows(term):
+    '''True for column = value, column IN (values) and column BETWEEN value AND value'''
+    sides = _split_at(term, op="=")
+    if sides:
+        left, right = sides
+        return (_column(left) is not None and _is_value(right)) or (_column(right) is not None and _is_value(left))
+
+    for keyword in ("IN", "BETWEEN"):
+        sides = _split_at(term, keyword=keyword)
+        if sides:
+            left, right = sides
+            if keyword == "IN" and not (right and is_punct(right[0], "(") and is_punct(right[-1], ")")):
+                return False
+            bounds = _split_at(right, keyword="AND") if keyword == "BETWEEN" else (right,)
+            return _column(left) is not None and bool(bounds) and all(_is_value(bound) for bound in bounds)
+
+    return False
+
+
+def _validate_read(tokens):
+    leading = word(tokens[0])
+    if leading == "EXPLAIN":
+        tokens = _strip_explain(tokens)
+        if not tokens:
+            return Verdict(UNSAFE, "EXPLAIN without a statement")
+        leading = word(tokens[0])
+
+    # SHOW ALL lists every server setting, the same reason current_setting is unsafe
+    if leading == "SHOW":
+        return Verdict(UNSAFE, "SHOW reveals server settings")
+    if leading in WRITE_WORDS:
+        return Verdict(UNSAFE, f"{leading} is not a read-only statement")
+    if leading not in ("SELECT", "WITH", "VALUES", "TABLE") and not is_punct(tokens[0], "("):
+        return Verdict(UNSURE, f"unrecognised statement {tokens[0].value}")
+
+    words = {word(token) for token in tokens if token.kind == "word"}
+    writes = words & WRITE_WORDS
+    if "UPDATE" in writes and "FOR" in words:
+        return Verdict(UNSAFE, "SELECT ... FOR UPDATE takes row locks")
+    if writes:
+        return Verdict(UNSAFE, f"contains {sorted(writes)[0]}")
+    if "INTO" in words:
+        return Verdict(UNSAFE, "SELECT INTO creates a table")
+
+    return _check_tables(referenced_tables(tokens), READ_TABLES) or _check_functions(tokens) or Verdict(SAFE, "read-only SELECT")
+
+
+def _validate_write(tokens):
+    leading = word(tokens[0])
+    if leading in ("SELECT", "SHOW", "EXPLAIN", "VALUES", "TABLE", "DESCRIBE", "DESC"):
+        return Verdict(UNSAFE, "read-only statement, use read_db instead")
+    if leading not in ("INSERT", "UPDATE", "DELETE"):
+        return Verdict(UNSURE, f"unrecognised statement {tokens[0].value}")
+
+    references = table_references(tokens)
+    if not references:
+        return Verdict(UNSURE, "could not find the target table")
+
+    target = references[0][0]
+    if leading == "DELETE" and target not in DELETE_TABLES:
+        return Verdict(UNSAFE, f"DELETE is not allowed on {target}")
+
+    verdict = _check_tables({name for name, _ in references}, WRITE_TABLES)
+    if verdict:
+        return verdict if verdict.decision == UNSAFE else Verdict(UNSAFE, "writes must only touch museums and tickets")
+
+    if leading in ("UPDATE", "DELETE"):
+        if "WHERE" not in top_level_words(tokens):
+            return Verdict(UNSAFE, f"{leading} without a WHERE clause")
+
+        where = clause_tokens(tokens, "WHERE", {"RETURNING"})
+        if not _has_column_reference(where):
+            return Verdict(UNSAFE, f"{leading} with a WHERE clause that matches every row")
+        if "OR" in top_level_words(where):
+            return Verdict(UNSURE, f"{leading} with OR in the WHERE clause")
+
+        conjuncts = _conjuncts(where)
+        if any(_self_comparison(term) for term in conjuncts):
+            return Verdict(UNSURE, f"{leading} with a column compared to itself")
+        # open-ended ranges (ticket_id > 0) can match every row as surely as no WHERE at all
+        if not any(_pins_rows(term) for term in conjuncts):
+            return Verdict(UNSURE, f"{leading} with a WHERE clause that does not pin down rows")
+
+    return _check_functions(tokens) or Verdict(SAFE, f"{leading} on {target}")
+
+
+def validate(query, mode):
+    '''Decide locally whether the query is safe for the read or write tool'''
+    try:
+        statements = split_statements(tokenize(query))
+    except SQLParseError as exc:
+        return Verdict(UNSURE, str(exc))
+
+    if not statements:
+        return Verdict(UNSAFE, "empty query")
+    if len(statements) > 1:
+        return Verdict(UNSAFE, "multiple statements")
+
+    tokens = statements[0]
+    leading = word(tokens[0])
+    if leading in FORBIDDEN_LEADING_WORDS:
+        return Verdict(UNSAFE, f"{leading} statements are not allowed")
+
+    forbidden = {word(token) for token in tokens} & FORBIDDEN_WORDS
+    if forbidden:
+        return Verdict(UNSAFE, f"contains {sorted(forbidden)[0]}")
+
+    if mode == "read":
+        return _validate_read(tokens)
+    return _validate_write(tokens)
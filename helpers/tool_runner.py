@@ -0,0 +1,104 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.messages import ToolMessage
+
+from helpers.metrics import timed, tool_seconds
+from config.config import tool_call_concurrency
+
+# Tools without side effects, these can run at the same time
+READ_ONLY_TOOLS = {"read_db", "lookup_museum", "check_availability"}
+
+_executor = ThreadPoolExecutor(max_workers=tool_call_concurrency, thread_name_prefix="tool-call")
+
+
+def _invoke(tool_registry, tool_call):
+    tool = tool_registry.get(tool_call.get("name"))
+    if not tool:
+        return None
+
+    with timed(tool_seconds, f"tool {tool.name}", tool=tool.name):
+        tool_result = tool.invoke(tool_call["args"])
+    return ToolMessage(
+        content=str(tool_result),
+        tool_call_id=tool_call["id"]
+    )
+
+
+async def _ainvoke(tool_registry, tool_call):
+    tool = tool_registry.get(tool_call.get("name"))
+    if not tool:
+        return None
+
+    with timed(tool_seconds, f"tool {tool.name}", tool=tool.name):
+        tool_result = await tool.ainvoke(tool_call["args"])
+    return ToolMessage(
+        content=str(tool_result),
+        tool_call_id=tool_call["id"]
+    )
+
+
+def run_tool_calls(tool_calls, tool_registry):
+    """
+    Run the tool calls of one model turn and return their ToolMessages in call order.
+
+    Consecutive read-only calls run concurrently on a bounded thread pool. A
+    write waits for the reads before it and runs alone, so later reads in the
+    same turn still see its effect.
+    """
+    results = [None] * len(tool_calls)
+    pending = []
+
+    def flush():
+        if len(pending) == 1:
+            index = pending[0]
+            results[index] = _invoke(tool_registry, tool_calls[index])
+        elif pending:
+            # every call gets its own copy of the context so callbacks keep their parent run
+            futures = [
+                (index, _executor.submit(contextvars.copy_context().run, _invoke, tool_registry, tool_calls[index]))
+                for index in pending
+            ]
+            for index, future in futures:
+                results[index] = future.result()
+        pending.clear()
+
+    for index, tool_call in enumerate(tool_calls):
+        if tool_call.get("name") in READ_ONLY_TOOLS:
+            pending.append(index)
+            continue
+
+        flush()
+        results[index] = _invoke(tool_registry, tool_call)
+
+    flush()
+
+    return [message for message in results if message is not None]
+
+
+async def arun_tool_calls(tool_calls, tool_registry):
+    """Async run_tool_calls, concurrent reads are awaited together on the event loop"""
+    results = [None] * len(tool_calls)
+    pending = []
+    semaphore = asyncio.Semaphore(tool_call_concurrency)
+
+    async def bounded(index):
+        async with semaphore:
+            results[index] = await _ainvoke(tool_registry, tool_calls[index])
+
+    async def flush():
+        await asyncio.gather(*(bounded(index) for index in pending))
+        pending.clear()
+
+    for index, tool_call in enumerate(tool_calls):
+        if tool_call.get("name") in READ_ONLY_TOOLS:
+            pending.append(index)
+            continue
+
+        await flush()
+        results[index] = await _ainvoke(tool_registry, tool_call)
+
+    await flush()
+
+    return [message for message in results if message is not None]
@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+import time
+
+from helpers.cache import LRUCache
+from config.config import verdict_cache_size, verdict_cache_ttl, verdict_cache_path
+
+# Persisted rows are trimmed every this many writes
+_PRUNE_EVERY = 100
+
+
+class VerdictCache:
+    '''Safety verdicts per query fingerprint, kept in memory and optionally in SQLite'''
+
+    def __init__(self, max_entries, ttl, path=None):
+        self.memory = LRUCache(max_entries, ttl)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persisted_hits = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "key TEXT PRIMARY KEY, safe INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        safe = self.memory.get(key)
+        if safe is not None or self._conn is None:
+            return safe
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT safe, created_at FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        safe, created_at = bool(row[0]), row[1]
+        remaining = self.ttl - (time.time() - created_at) if self.ttl else None
+        if remaining is not None and remaining <= 0:
+            return None
+
+        self.persisted_hits += 1
+        self.memory.set(key, safe, ttl=remaining)
+        return safe
+
+    def set(self, key, safe):
+        self.memory.set(key, safe)
+        if self._conn is None:
+            return
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, safe, created_at) VALUES (?, ?, ?)",
+                (key, int(safe), time.time()),
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        if self.ttl:
+            self._conn.execute("DELETE FROM verdicts WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM verdicts WHERE key NOT IN "
+            "(SELECT key FROM verdicts ORDER BY created_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        self.memory.clear()
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM verdicts")
+                self._conn.commit()
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["persisted_hits"] = self.persisted_hits
+        # a memory miss answered from SQLite is still a hit for the caller
+        stats["misses"] -= self.persisted_hits
+        stats["hits"] += self.persisted_hits
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+verdict_cache = VerdictCache(verdict_cache_size, verdict_cache_ttl, verdict_cache_path)
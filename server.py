@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from aiohttp import web, WSMsgType
+
+from helpers.metrics import render_metrics
+from conversation import new_thread_config, astream_turn
+from config.config import (
+    server_max_active_turns,
+    server_session_concurrency,
+    server_session_ttl,
+    server_turn_queue_timeout,
+)
+
+
+class Session:
+    '''One conversation, mapped to its own LangGraph thread'''
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.config = new_thread_config(session_id)
+        self.slots = asyncio.Semaphore(server_session_concurrency)
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    def __init__(self):
+        self.sessions = {}
+
+    def create(self):
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = Session(session_id)
+        return self.sessions[session_id]
+
+    def get(self, session_id):
+        # the thread lives in the checkpointer, so an unknown id (another
+        # replica, a restart) picks the conversation up where it was
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(session_id)
+        session.last_used = time.monotonic()
+        return session
+
+    def delete(self, session_id):
+        return self.sessions.pop(session_id, None) is not None
+
+    def expire(self, ttl):
+        cutoff = time.monotonic() - ttl
+        for session_id in [key for key, session in self.sessions.items() if session.last_used < cutoff]:
+            del self.sessions[session_id]
+
+
+class TurnRejected(Exception):
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+async def run_turn(request, session, user_input):
+    '''Yield the events of one turn while holding a session slot and a global slot'''
+    if session.slots.locked():
+        raise TurnRejected(429, "This session already has a turn in progress")
+
+    async with session.slots:
+        active_turns = request.app["active_turns"]
+        try:
+            await asyncio.wait_for(active_turns.acquire(), timeout=server_turn_queue_timeout)
+        except asyncio.TimeoutError:
+            raise TurnRejected(503, "Server is busy, try again shortly")
+
+        try:
+            async for event in astream_turn(request.app["graph"], session.config, user_input):
+                yield event
+        finally:
+            active_turns.release()
+            session.last_used = time.monotonic()
+
+
+async def create_session(request):
+    session = request.app["sessions"].create()
+    return web.json_response({"session_id": session.session_id}, status=201)
+
+
+async def delete_session(request):
+    deleted = request.app["sessions"].delete(request.match_info["session_id"])
+    return web.json_response({"deleted": deleted})
+
+
+async def post_message(request):
+    '''Stream the events of one turn as newline delimited JSON'''
+    session = request.app["sessions"].get(request.match_info["session_id"])
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    user_input = str(body.get("message", "")).strip() if isinstance(body, dict) else ""
+    if not user_input:
+        return web.json_response({"error": "message is required"}, status=400)
+
+    response = None
+    try:
+        async for event in run_turn(request, session, user_input):
+            if response is None:
+                response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+                await response.prepare(request)
+            await response.write((json.dumps(event) + "\n").encode())
+    except TurnRejected as exc:
+        if response is None:
+            return web.json_response({"error": exc.reason}, status=exc.status)
+        raise
+
+    if response is None:
+        return web.json_response({"type": "end"})
+
+    await response.write_eof()
+    return response
+
+
+async def session_socket(request):
+    '''WebSocket: every text frame {"message": ...} is one turn, events are sent back as they happen'''
+    session = request.app["sessions"].get(request.match_info["session_id"])
+    socket = web.WebSocketResponse()
+    await socket.prepare(request)
+
+    async for frame in socket:
+        if frame.type != WSMsgType.TEXT:
+            continue
+
+        try:
+            user_input = str(json.loads(frame.data).get("message", "")).strip()
+        except (ValueError, AttributeError):
+            user_input = ""
+        if not user_input:
+            await socket.send_json({"type": "error", "error": "message is required"})
+            continue
+
+        try:
+            async for event in run_turn(request, session, user_input):
+                await socket.send_json(event)
+        except TurnRejected as exc:
+            await socket.send_json({"type": "error", "error": exc.reason})
+
+    return socket
+
+
+async def health(request):
+    return web.json_response({
+        "status": "ok",
+        "sessions": len(request.app["sessions"].sessions),
+    })
+
+
+async def metrics(request):
+    '''Prometheus text exposition of the node, tool, model and SQL metrics'''
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+async def expire_sessions(app):
+    while True:
+        await asyncio.sleep(min(server_session_ttl, 60))
+        app["sessions"].expire(server_session_ttl)
+
+
+async def start_background_tasks(app):
+    if app["graph"] is None:
+        # building the graph imports the whole model stack, --help does not need it
+        from graph import aget_app, aclose_app
+
+        app["graph"] = await aget_app()
+        app["close_graph"] = aclose_app
+    app["expiry_task"] = asyncio.create_task(expire_sessions(app))
+
+
+async def stop_background_tasks(app):
+    app["expiry_task"].cancel()
+    if app["close_graph"] is not None:
+        await app["close_graph"]()
+
+
+def create_app(graph=None):
+    app = web.Application()
+    app["graph"] = graph
+    app["close_graph"] = None
+    app["sessions"] = SessionStore()
+    app["active_turns"] = asyncio.Semaphore(server_max_active_turns)
+
+    app.router.add_post("/sessions", create_session)
+    app.router.add_delete("/sessions/{session_id}", delete_session)
+    app.router.add_post("/sessions/{session_id}/messages", post_message)
+    app.router.add_get("/sessions/{session_id}/ws", session_socket)
+    app.router.add_get("/healthz", health)
+    app.router.add_get("/metrics", metrics)
+
+    app.on_startup.append(start_background_tasks)
+    app.on_cleanup.append(stop_background_tasks)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the museum assistant over HTTP and WebSocket")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,3 +10,6 @@ class MessagesState(TypedDict):
     irrevelant_question: str
     user_details: Annotated[list[AnyMessage], operator.add]
     awaiting_user_input: bool
+    # rolling summary of the turns no longer sent verbatim, and how many messages it covers
+    history_summary: str
+    summarized_messages: int
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fixtures import seed
+from helpers.bookings import BookingError, availability, insert_booking, insert_bookings, ainsert_booking
+from helpers.get_db import get_async_engine
+from helpers.museum_catalog import museum_catalog
+from config.config import get_async_db_uri
+
+VISIT_DATE = "2040-01-01"
+
+
+class BookingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.database = os.path.join(cls.workdir.name, "museums.sqlite")
+        seed(cls.database)
+        cls.environment = mock.patch.dict(os.environ, {"DATABASE_URI": f"sqlite:///{cls.database}"})
+        cls.environment.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.environment.stop()
+        cls.workdir.cleanup()
+
+    def setUp(self):
+        with sqlite3.connect(self.database) as connection:
+            connection.execute("DELETE FROM tickets WHERE visit_date >= ?", (VISIT_DATE,))
+            connection.execute("UPDATE museums SET capacity = 5 WHERE museum_id = 1")
+        museum_catalog.invalidate()
+
+    def tickets(self, museum_id=1, visit_date=VISIT_DATE):
+        with sqlite3.connect(self.database) as connection:
+            return connection.execute(
+                "SELECT COALESCE(SUM(num_tickets), 0) FROM tickets WHERE museum_id = ? AND visit_date = ?",
+                (museum_id, visit_date),
+            ).fetchone()[0]
+
+    def book(self, num_tickets, museum_id=1, visit_date=VISIT_DATE, email="jo@example.com"):
+        return insert_booking(museum_id, "Jo Doe", email, num_tickets, visit_date)
+
+    def test_invalid_fields_are_listed_and_nothing_is_written(self):
+        with self.assertRaises(BookingError) as raised:
+            insert_booking(1, " ", "not-an-email", 0, "2000-01-01")
+        message = str(raised.exception)
+        for problem in ("visitor_name is required", "not a valid email", "num_tickets", "in the past"):
+            self.assertIn(problem, message)
+        self.assertEqual(self.tickets(), 0)
+
+    def test_unknown_museum(self):
+        with self.assertRaisesRegex(BookingError, "no museum with museum_id 9999"):
+            self.book(1, museum_id=9999)
+
+    def test_booking_within_capacity(self):
+        booking = self.book(3)
+        self.assertIsInstance(booking["ticket_id"], int)
+        self.assertEqual(availability(1, VISIT_DATE)["tickets_left"], 2)
+
+    def test_booking_past_capacity_is_rolled_back(self):
+        self.book(3)
+        with self.assertRaisesRegex(BookingError, "2 of 5 tickets left on 2040-01-01, 3 requested"):
+            self.book(3)
+        self.assertEqual(self.tickets(), 3)
+        self.assertEqual(availability(1, VISIT_DATE)["booked_tickets"], 3)
+
+    def test_capacity_is_per_day(self):
+        self.book(5)
+        self.book(5, visit_date="2040-01-02")
+        self.assertEqual(self.tickets(visit_date="2040-01-02"), 5)
+
+    def test_group_past_capacity_writes_nothing(self):
+        bookings = [
+            {"museum_id": 1, "visitor_name": "Jo Doe", "visitor_email": "jo@example.com", "num_tickets": 3, "visit_date": VISIT_DATE},
+            {"museum_id": 2, "visitor_name": "Jo Doe", "visitor_email": "jo@example.com", "num_tickets": 3, "visit_date": VISIT_DATE},
+            {"museum_id": 1, "visitor_name": "Al Roe", "visitor_email": "al@example.com", "num_tickets": 3, "visit_date": VISIT_DATE},
+        ]
+        with self.assertRaisesRegex(BookingError, "museum_id=1"):
+            insert_bookings(bookings)
+        self.assertEqual(self.tickets(museum_id=1), 0)
+        self.assertEqual(self.tickets(museum_id=2), 0)
+
+    def test_async_booking_past_capacity_is_rolled_back(self):
+        async def book_twice():
+            try:
+                await ainsert_booking(1, "Jo Doe", "jo@example.com", 4, VISIT_DATE)
+                with self.assertRaisesRegex(BookingError, "1 of 5 tickets left"):
+                    await ainsert_booking(1, "Jo Doe", "jo@example.com", 2, VISIT_DATE)
+            finally:
+                # pooled connections belong to this event loop
+                await get_async_engine(get_async_db_uri()).dispose()
+
+        asyncio.run(book_twice())
+        self.assertEqual(self.tickets(), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
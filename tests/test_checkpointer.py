@@ -0,0 +1,82 @@
+import threading
+import unittest
+from typing import TypedDict
+from unittest import mock
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END
+
+from helpers import checkpointer
+from helpers.checkpointer import LockedMemorySaver, compact_checkpoints, start_compaction
+
+
+class CounterState(TypedDict):
+    count: int
+
+
+def _graph(saver):
+    builder = StateGraph(CounterState)
+    builder.add_node("step", lambda state: {"count": state["count"] + 1})
+    builder.add_edge(START, "step")
+    builder.add_edge("step", END)
+    return builder.compile(checkpointer=saver)
+
+
+class MemoryCompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.saver = LockedMemorySaver()
+        self.graph = _graph(self.saver)
+
+    def run_turns(self, thread_id, turns):
+        config = {"configurable": {"thread_id": thread_id}}
+        for count in range(turns):
+            self.graph.invoke({"count": count}, config)
+        return config
+
+    def test_keeps_the_latest_checkpoints(self):
+        config = self.run_turns("a", 6)
+        # every thread counts as idle
+        with mock.patch.object(checkpointer, "_ACTIVE_GRACE", -1):
+            removed = compact_checkpoints(self.saver, keep_last=2, thread_ttl=0)
+
+        self.assertGreater(removed["deleted_checkpoints"], 0)
+        self.assertEqual(len(list(self.saver.list(config))), 2)
+        self.assertEqual(self.graph.get_state(config).values, {"count": 6})
+
+    def test_recent_threads_are_left_alone(self):
+        config = self.run_turns("a", 3)
+        before = len(list(self.saver.list(config)))
+        compact_checkpoints(self.saver, keep_last=1, thread_ttl=0)
+        self.assertEqual(len(list(self.saver.list(config))), before)
+
+    def test_compaction_alongside_graph_runs(self):
+        errors = []
+
+        def turns(thread_id):
+            try:
+                self.run_turns(thread_id, 30)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=turns, args=(f"t{index}",)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        with mock.patch.object(checkpointer, "_ACTIVE_GRACE", -1):
+            while any(thread.is_alive() for thread in threads):
+                compact_checkpoints(self.saver, keep_last=1, thread_ttl=0)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for index in range(4):
+            self.assertEqual(self.graph.get_state({"configurable": {"thread_id": f"t{index}"}}).values, {"count": 30})
+
+    def test_background_compaction(self):
+        stop = start_compaction(self.saver, interval=60)
+        self.assertIsNotNone(stop)
+        stop.set()
+        self.assertIsNone(start_compaction(MemorySaver(), interval=60))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+from langchain.messages import HumanMessage, AIMessage
+
+from helpers import history
+
+
+def conversation(turns, words=200):
+    messages = []
+    for index in range(turns):
+        messages.append(HumanMessage(content=f"question {index} " + "word " * words))
+        messages.append(AIMessage(content=f"answer {index} " + "word " * words))
+    messages.append(HumanMessage(content="latest question"))
+    return messages
+
+
+class BuildMessagesTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(history, "model_for")
+        self.model = patcher.start().return_value.with_config.return_value
+        self.model.invoke.return_value = mock.Mock(text="new summary")
+        self.addCleanup(patcher.stop)
+
+    def build(self, messages, budget):
+        state = {"messages": messages, "history_summary": "old summary", "summarized_messages": 0}
+        with mock.patch.dict(history.history_token_budgets, {"test": budget}):
+            return history.build_messages("test", state, "prompt")
+
+    def test_turns_within_budget_are_sent(self):
+        messages, update = self.build(conversation(2), budget=100000)
+        self.assertEqual(update, {})
+        self.assertEqual(len(messages), 1 + 5)
+        self.model.invoke.assert_not_called()
+
+    def test_turns_past_the_budget_are_folded_into_the_summary(self):
+        messages, update = self.build(conversation(2), budget=800)
+        self.assertEqual(update, {"history_summary": "new summary", "summarized_messages": 2})
+        transcript = self.model.invoke.call_args.args[0][-1].content
+        self.assertIn("question 0", transcript)
+        self.assertNotIn("question 1", transcript)
+        self.assertIn("new summary", messages[0].content)
+        self.assertEqual([message.content[:10] for message in messages[1:]], ["question 1", "answer 1 w", "latest que"])
+
+    def test_latest_turn_is_always_sent(self):
+        messages, update = self.build(conversation(2), budget=1)
+        self.assertEqual(update["summarized_messages"], 4)
+        self.assertEqual([message.content for message in messages[1:]], ["latest question"])
+
+    def test_dropped_turns_are_counted_without_summaries(self):
+        with mock.patch.object(history, "history_summary_enabled", False):
+            messages, update = self.build(conversation(2), budget=1)
+        self.assertEqual(update, {})
+        self.assertEqual(len(messages), 2)
+        self.assertGreaterEqual(history.history_stats()["test"]["turns_dropped"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
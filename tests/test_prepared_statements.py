@@ -0,0 +1,28 @@
+import unittest
+
+from sqlalchemy.dialects.postgresql import psycopg, psycopg2
+from sqlalchemy.dialects.sqlite import pysqlite
+
+from helpers.prepared_statements import PREPARED_STATEMENTS, prepare_sql, statement
+
+
+class StatementTest(unittest.TestCase):
+    def test_psycopg2_executes_the_prepared_statement(self):
+        self.assertTrue(str(statement("create_booking", psycopg2.dialect())).startswith("EXECUTE create_booking (:museum_id"))
+
+    def test_server_side_binding_runs_the_plain_insert(self):
+        # Postgres rejects $1 parameters in EXECUTE, psycopg 3 would send them
+        for dialect in (psycopg.dialect(), psycopg.dialect_async()):
+            self.assertEqual(str(statement("create_booking", dialect)), PREPARED_STATEMENTS["create_booking"]["sql"])
+
+    def test_other_databases_run_the_plain_insert(self):
+        self.assertEqual(str(statement("create_booking", pysqlite.dialect())), PREPARED_STATEMENTS["create_booking"]["sql"])
+
+    def test_prepare_uses_positional_parameters(self):
+        sql = prepare_sql("create_booking")
+        self.assertTrue(sql.startswith("PREPARE create_booking (int, varchar, varchar, int, date) AS INSERT"))
+        self.assertIn("VALUES ($1, $2, $3, $4, $5, 'BOOKED')", sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
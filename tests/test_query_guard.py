@@ -0,0 +1,100 @@
+import unittest
+
+from helpers.query_guard import Estimate, QueryGuard, estimate_from_plan, limit_query, multiple_statements_message
+
+
+class EstimateKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.guard = QueryGuard(True, 100, 1000.0, 10000.0, 5000, 16, 60)
+
+    def key(self, query):
+        return self.guard._prepare("postgresql://db", "postgresql", query)[2]
+
+    def test_other_literals_share_an_estimate(self):
+        self.assertEqual(
+            self.key("SELECT name FROM museums WHERE city = 'Chicago'"),
+            self.key("SELECT name FROM museums WHERE city = 'Boston'"),
+        )
+
+    def test_limit_and_offset_values_are_kept(self):
+        cheap = self.key("SELECT * FROM tickets LIMIT 1")
+        self.assertNotEqual(cheap, self.key("SELECT * FROM tickets LIMIT 1000000"))
+        self.assertNotEqual(cheap, self.key("SELECT * FROM tickets LIMIT 1 OFFSET 1000000"))
+        self.assertNotEqual(
+            self.key("SELECT * FROM tickets FETCH FIRST 1 ROWS ONLY"),
+            self.key("SELECT * FROM tickets FETCH FIRST 1000000 ROWS ONLY"),
+        )
+
+    def test_cached_cheap_plan_does_not_pass_a_large_limit(self):
+        self.guard.estimates.set(self.key("SELECT * FROM tickets LIMIT 1"), Estimate(1.0, 1.0))
+        self.assertIsNone(self.guard.estimates.get(self.key("SELECT * FROM tickets LIMIT 1000000")))
+
+    def test_no_estimate_outside_postgres(self):
+        self.assertIsNone(self.guard._prepare("sqlite://", "sqlite", "SELECT * FROM tickets")[2])
+
+
+class LimitQueryTest(unittest.TestCase):
+    def test_unbounded_select_gets_a_limit(self):
+        self.assertEqual(limit_query("SELECT * FROM tickets", 100), ("SELECT * FROM tickets LIMIT 100", 100))
+        self.assertEqual(
+            limit_query("WITH t AS (SELECT * FROM tickets) SELECT * FROM t", 100)[0],
+            "WITH t AS (SELECT * FROM tickets) SELECT * FROM t LIMIT 100",
+        )
+
+    def test_trailing_semicolon_and_comment_do_not_swallow_the_limit(self):
+        self.assertEqual(limit_query("SELECT * FROM tickets; -- all of them", 100)[0], "SELECT * FROM tickets LIMIT 100")
+
+    def test_bounded_or_other_queries_are_unchanged(self):
+        for query in (
+            "SELECT * FROM tickets LIMIT 5",
+            "SELECT * FROM tickets FETCH FIRST 5 ROWS ONLY",
+            "SELECT * INTO copy FROM tickets",
+            "SELECT * FROM tickets FOR UPDATE",
+            "UPDATE tickets SET num_tickets = 1",
+            "SELECT 1; SELECT 2",
+            "SELECT 'unterminated",
+        ):
+            self.assertEqual(limit_query(query, 100), (query, None), query)
+
+    def test_limit_inside_a_subquery_does_not_bound_the_outer_select(self):
+        self.assertEqual(limit_query("SELECT * FROM (SELECT * FROM tickets LIMIT 5) t", 100)[1], 100)
+
+
+class GuardTest(unittest.TestCase):
+    def setUp(self):
+        self.guard = QueryGuard(True, 100, 1000.0, 10000.0, 5000, 16, 60)
+
+    def test_multiple_statements_are_rejected(self):
+        guarded = self.guard.check("sqlite://", "SELECT 1; DELETE FROM tickets")
+        self.assertEqual(guarded.rejection, multiple_statements_message)
+
+    def test_single_select_is_limited(self):
+        guarded = self.guard.check("sqlite://", "SELECT 1")
+        self.assertIsNone(guarded.rejection)
+        self.assertEqual((guarded.query, guarded.row_limit), ("SELECT 1 LIMIT 100", 100))
+
+    def test_estimate_over_the_limits_is_rejected(self):
+        for estimate in (Estimate(1000.5, 1.0), Estimate(1.0, 10001.0)):
+            guarded = self.guard._verdict("SELECT * FROM tickets LIMIT 100", 100, estimate)
+            self.assertIn("The query was not run", guarded.rejection)
+
+    def test_estimate_within_the_limits_passes(self):
+        self.assertIsNone(self.guard._verdict("SELECT 1", None, Estimate(1000.0, 10000.0)).rejection)
+        self.assertIsNone(self.guard._verdict("SELECT 1", None, None).rejection)
+
+    def test_rows_under_a_limit_node_are_not_counted(self):
+        plan = [{"Plan": {"Node Type": "Limit", "Total Cost": 50.0, "Plan Rows": 100,
+                          "Plans": [{"Node Type": "Seq Scan", "Plan Rows": 1000000}]}}]
+        self.assertEqual(estimate_from_plan(plan), Estimate(50.0, 100.0))
+
+    def test_largest_step_counts(self):
+        plan = '[{"Plan": {"Node Type": "Hash Join", "Total Cost": 10, "Plan Rows": 5, "Plans": [{"Node Type": "Seq Scan", "Plan Rows": 20000}]}}]'
+        self.assertEqual(estimate_from_plan(plan), Estimate(10.0, 20000.0))
+
+    def test_disabled_guard_passes_everything(self):
+        guard = QueryGuard(False, 100, 1000.0, 10000.0, 5000, 16, 60)
+        self.assertEqual(guard.check("sqlite://", "SELECT 1; SELECT 2"), ("SELECT 1; SELECT 2", None, None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
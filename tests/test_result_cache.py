@@ -0,0 +1,74 @@
+import unittest
+
+from helpers.result_cache import ResultCache, written_tables
+
+
+class WrittenTablesTest(unittest.TestCase):
+    def test_single_target(self):
+        self.assertEqual(written_tables("UPDATE tickets SET status = 'X' FROM museums WHERE ticket_id = 1"), {"tickets"})
+        self.assertEqual(written_tables("INSERT INTO tickets (museum_id) SELECT museum_id FROM museums"), {"tickets"})
+
+    def test_every_target_of_a_multi_table_write(self):
+        query = (
+            "WITH moved AS (DELETE FROM tickets WHERE ticket_id = 1 RETURNING museum_id) "
+            "UPDATE museums SET capacity = capacity + 1 WHERE museum_id IN (SELECT museum_id FROM moved)"
+        )
+        self.assertEqual(written_tables(query), {"tickets", "museums"})
+
+    def test_every_statement_counts(self):
+        query = "UPDATE museums SET city = 'X' WHERE museum_id = 1; DELETE FROM tickets WHERE ticket_id = 2"
+        self.assertEqual(written_tables(query), {"museums", "tickets"})
+
+    def test_row_locks_are_not_writes(self):
+        self.assertIsNone(written_tables("SELECT * FROM tickets FOR UPDATE"))
+
+    def test_unparsable_write_drops_everything(self):
+        self.assertIsNone(written_tables("UPDATE tickets SET name = 'it''s"))
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResultCache(16, 1024 * 1024, 60, {})
+        self.loads = 0
+
+    def read(self, query):
+        def load():
+            self.loads += 1
+            return f"result {self.loads}"
+        return self.cache.read_through(query, load)
+
+    def assertInvalidatedBy(self, read, write):
+        first = self.read(read)
+        self.assertEqual(self.read(read), first)
+        self.cache.invalidate_tables(written_tables(write))
+        self.assertNotEqual(self.read(read), first, read)
+
+    def test_write_invalidates_relation_after_join_and_comma(self):
+        self.assertInvalidatedBy(
+            "SELECT * FROM museums m JOIN museum_daily_bookings d ON m.museum_id = d.museum_id, tickets t",
+            "DELETE FROM tickets WHERE ticket_id = 1",
+        )
+
+    def test_write_invalidates_parenthesized_relation(self):
+        self.assertInvalidatedBy("SELECT * FROM museums, (tickets)", "UPDATE tickets SET status = 'X' WHERE ticket_id = 1")
+
+    def test_multi_table_write_invalidates_every_target(self):
+        write = (
+            "WITH moved AS (DELETE FROM tickets WHERE ticket_id = 1 RETURNING museum_id) "
+            "UPDATE museums SET capacity = 1 WHERE museum_id IN (SELECT museum_id FROM moved)"
+        )
+        self.assertInvalidatedBy("SELECT name FROM museums", write)
+        self.assertInvalidatedBy("SELECT count(*) FROM tickets", write)
+
+    def test_unrelated_write_keeps_the_entry(self):
+        first = self.read("SELECT name FROM museums")
+        self.cache.invalidate_tables(written_tables("DELETE FROM tickets WHERE ticket_id = 1"))
+        self.assertEqual(self.read("SELECT name FROM museums"), first)
+
+    def test_ttl_is_the_shortest_of_every_table_read(self):
+        cache = ResultCache(16, 1024 * 1024, 60, {"tickets": 0})
+        self.assertEqual(cache._lookup("SELECT * FROM museums m JOIN museum_daily_bookings d USING (museum_id), tickets"), (None, None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+from server import create_app
+
+
+class PostMessageTest(AioHTTPTestCase):
+    async def get_application(self):
+        # the turns are never run, so no graph is built
+        return create_app(graph=object())
+
+    async def assertRejected(self, data):
+        response = await self.client.post("/sessions/abc/messages", data=data, headers={"Content-Type": "application/json"})
+        self.assertEqual(response.status, 400, data)
+        self.assertEqual(await response.json(), {"error": "message is required"})
+
+    async def test_invalid_json(self):
+        await self.assertRejected("{not json")
+
+    async def test_body_that_is_not_an_object(self):
+        for data in ('["hello"]', '"hello"', "null", "3"):
+            await self.assertRejected(data)
+
+    async def test_missing_message(self):
+        await self.assertRejected('{"message": "   "}')
+
+
+if __name__ == "__main__":
+    unittest.main()
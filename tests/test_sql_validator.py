@@ -0,0 +1,115 @@
+import unittest
+
+from helpers.sql_parser import SQLParseError, tokenize, split_statements, strip_tail, referenced_tables
+from helpers.sql_validator import SAFE, UNSAFE, UNSURE, validate
+
+
+class TableReferencesTest(unittest.TestCase):
+    def tables(self, query):
+        return sorted(referenced_tables(tokenize(query)))
+
+    def test_from_list_continues_after_join(self):
+        query = "SELECT * FROM museums m JOIN tickets t ON m.museum_id = t.museum_id, pg_shadow s WHERE s.usename = 'x'"
+        self.assertEqual(self.tables(query), ["museums", "pg_shadow", "tickets"])
+
+    def test_commas_outside_the_from_list_are_not_relations(self):
+        query = "SELECT name, city FROM museums WHERE museum_id IN (1, 2) ORDER BY name, city"
+        self.assertEqual(self.tables(query), ["museums"])
+
+    def test_parenthesized_relation(self):
+        self.assertEqual(self.tables("SELECT * FROM museums, ((pg_shadow))"), ["museums", "pg_shadow"])
+
+
+class TokenizerTest(unittest.TestCase):
+    def test_escaped_quote_in_e_string(self):
+        tokens = tokenize(r"SELECT E'it\'s' FROM museums")
+        self.assertIn(("string", r"E'it\'s'"), tokens)
+
+    def test_nested_block_comment(self):
+        tokens = tokenize("SELECT 1 /* outer /* inner */ still ' a comment */ FROM museums")
+        self.assertEqual([token.value for token in tokens], ["SELECT", "1", "FROM", "museums"])
+
+    def test_unterminated_block_comment(self):
+        with self.assertRaises(SQLParseError):
+            tokenize("SELECT 1 /* /* */")
+
+    def test_statements_hidden_behind_escapes_are_split(self):
+        statements = split_statements(tokenize(r"SELECT E'\'' ; DROP TABLE tickets; --'"))
+        self.assertEqual(len(statements), 2)
+
+    def test_strip_tail_keeps_nested_comment_inside(self):
+        self.assertEqual(strip_tail("SELECT 1 /* a /* b */ c */ ; -- x"), "SELECT 1")
+
+
+class ValidatorTest(unittest.TestCase):
+    def test_stacked_statement_after_e_string(self):
+        self.assertEqual(validate(r"SELECT E'\'' ; DROP TABLE tickets; --'", "read").decision, UNSAFE)
+
+    def test_stacked_statement_after_nested_comment(self):
+        self.assertEqual(validate("SELECT 1 /* /* */ ' */ ; DROP TABLE tickets; -- '", "read").decision, UNSAFE)
+
+    def test_stacked_statement_after_e_string_in_write(self):
+        query = r"DELETE FROM tickets WHERE visitor_email = E'\'' ; DROP TABLE museums; --'"
+        self.assertEqual(validate(query, "write").decision, UNSAFE)
+
+    def test_unterminated_comment_is_unsure(self):
+        self.assertEqual(validate("SELECT 1 /* open", "read").decision, UNSURE)
+
+    def test_plain_reads_stay_safe(self):
+        self.assertEqual(validate("SELECT name FROM museums /* a /* b */ c */ WHERE city = E'O\\'Hare'", "read").decision, SAFE)
+
+    def test_quoted_function_name_is_a_call(self):
+        self.assertEqual(validate('SELECT "pg_sleep"(10)', "read").decision, UNSAFE)
+        self.assertEqual(validate('SELECT "PG_SLEEP"(10) FROM museums', "read").decision, UNSAFE)
+        self.assertEqual(validate('SELECT "my_func"(name) FROM museums', "read").decision, UNSURE)
+
+    def test_relation_after_join_and_comma_is_checked(self):
+        for query in (
+            "SELECT * FROM museums m JOIN tickets t ON m.museum_id = t.museum_id, pg_shadow s",
+            "SELECT * FROM museums JOIN tickets USING (museum_id), pg_authid",
+            "SELECT * FROM museums, (pg_shadow)",
+            "SELECT * FROM (museums m JOIN pg_shadow s ON true)",
+            "SELECT * FROM (SELECT name FROM museums) m, pg_shadow",
+        ):
+            self.assertEqual(validate(query, "read").decision, UNSAFE, query)
+
+    def test_show_is_unsafe_like_current_setting(self):
+        self.assertEqual(validate("SHOW ALL", "read").decision, UNSAFE)
+        self.assertEqual(validate("SHOW timezone", "read").decision, UNSAFE)
+        self.assertEqual(validate("SELECT current_setting('timezone')", "read").decision, UNSAFE)
+
+    def test_relation_in_delete_using_is_checked(self):
+        self.assertEqual(validate("DELETE FROM tickets USING pg_shadow WHERE ticket_id = 1", "write").decision, UNSAFE)
+
+    def test_joined_reads_stay_safe(self):
+        for query in (
+            "SELECT m.name, t.num_tickets FROM museums m JOIN tickets t ON m.museum_id = t.museum_id, museum_daily_bookings d",
+            "SELECT * FROM (museums m JOIN tickets t USING (museum_id))",
+            "SELECT extract(year FROM visit_date), name IS DISTINCT FROM city FROM museums, tickets",
+        ):
+            self.assertEqual(validate(query, "read").decision, SAFE, query)
+
+    def test_column_compared_to_itself_is_unsure(self):
+        self.assertEqual(validate("UPDATE tickets SET status = 'X' WHERE ticket_id = ticket_id", "write").decision, UNSURE)
+        self.assertEqual(validate("UPDATE tickets SET status = 'X' WHERE status = status", "write").decision, UNSURE)
+
+    def test_open_ended_range_is_unsure(self):
+        self.assertEqual(validate("DELETE FROM tickets WHERE ticket_id > 0", "write").decision, UNSURE)
+        self.assertEqual(validate("DELETE FROM tickets WHERE visit_date < '2024-01-01'", "write").decision, UNSURE)
+
+    def test_literal_tautology_is_unsafe(self):
+        self.assertEqual(validate("DELETE FROM tickets WHERE 1=1", "write").decision, UNSAFE)
+
+    def test_targeted_writes_stay_safe(self):
+        for query in (
+            "UPDATE tickets SET status = 'CANCELLED' WHERE ticket_id = 123",
+            "DELETE FROM tickets WHERE ticket_id = 789 AND status = 'BOOKED'",
+            "DELETE FROM tickets WHERE ticket_id IN (1, 2, 3)",
+            "DELETE FROM tickets WHERE ticket_id BETWEEN 1 AND 5",
+            "UPDATE tickets SET num_tickets = 2 WHERE visit_date = DATE '2025-01-01' AND visitor_email = :email",
+        ):
+            self.assertEqual(validate(query, "write").decision, SAFE, query)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from unittest import mock
+
+from tools import write_db
+
+
+class TicketInsertTest(unittest.TestCase):
+    def test_ticket_inserts_are_refused(self):
+        for query in (
+            "INSERT INTO tickets (museum_id, num_tickets) VALUES (1, 2)",
+            "insert into \"tickets\" select * from tickets where ticket_id = 1",
+            "UPDATE museums SET city = 'X' WHERE museum_id = 1; INSERT INTO tickets (museum_id) VALUES (1)",
+            "MERGE INTO tickets t USING museums m ON t.museum_id = m.museum_id WHEN NOT MATCHED THEN INSERT (museum_id) VALUES (m.museum_id)",
+        ):
+            self.assertTrue(write_db._inserts_tickets(query), query)
+
+    def test_other_writes_pass(self):
+        for query in (
+            "UPDATE tickets SET num_tickets = 3 WHERE ticket_id = 1",
+            "INSERT INTO museums (name) SELECT visitor_name FROM tickets",
+            "DELETE FROM tickets WHERE ticket_id = 1",
+        ):
+            self.assertFalse(write_db._inserts_tickets(query), query)
+
+    def test_tool_does_not_run_a_ticket_insert(self):
+        with mock.patch.object(write_db, "check_query") as check_query, mock.patch.object(write_db, "run") as run:
+            answer = write_db._write_and_update_db("INSERT INTO tickets (museum_id) VALUES (1)")
+        self.assertEqual(answer, write_db.booking_message)
+        check_query.assert_not_called()
+        run.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
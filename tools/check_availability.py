@@ -0,0 +1,33 @@
+from langchain_core.tools import StructuredTool
+
+from helpers.bookings import availability, aavailability, describe_availability, BookingError
+
+def _check_availability(museum_id: int, visit_date: str) -> str:
+    '''
+        Check how many tickets are still available for a museum on a day.
+        Use it before offering a booking instead of counting tickets with read_db.
+
+        Args:
+            museum_id: int - id of the museum, get it with lookup_museum
+            visit_date: string - day of the visit in YYYY-MM-DD format
+
+        Returns the tickets already booked that day, the museum's daily capacity and the tickets left,
+        or "no capacity limit" when the museum has none
+    '''
+
+    try:
+        return describe_availability(availability(museum_id, visit_date))
+    except BookingError as exc:
+        return f"Availability not checked: {exc}"
+
+async def _acheck_availability(museum_id: int, visit_date: str) -> str:
+    try:
+        return describe_availability(await aavailability(museum_id, visit_date))
+    except BookingError as exc:
+        return f"Availability not checked: {exc}"
+
+check_availability = StructuredTool.from_function(
+    func=_check_availability,
+    coroutine=_acheck_availability,
+    name="check_availability",
+)
@@ -0,0 +1,36 @@
+from langchain_core.tools import StructuredTool
+
+from helpers.bookings import insert_booking, ainsert_booking, describe_booking, BookingError
+
+def _create_booking(museum_id: int, visitor_name: str, visitor_email: str, num_tickets: int, visit_date: str) -> str:
+    '''
+        Create a ticket booking, only call it after the user confirmed the booking summary.
+        The fields are validated before anything is written, invalid fields are reported back
+        so you can ask the user to correct them.
+
+        Args:
+            museum_id: int - id of the museum, get it with lookup_museum
+            visitor_name: string - full name of the visitor
+            visitor_email: string - contact email
+            num_tickets: int - number of tickets, at least 1
+            visit_date: string - day of the visit in YYYY-MM-DD format, today or later
+
+        Returns the created booking with its ticket_id, or the reason it was not created
+    '''
+
+    try:
+        booking = insert_booking(museum_id, visitor_name, visitor_email, num_tickets, visit_date)
+    except BookingError as exc:
+        return f"Booking not created: {exc}"
+
+    return describe_booking(booking)
+
+async def _acreate_booking(museum_id: int, visitor_name: str, visitor_email: str, num_tickets: int, visit_date: str) -> str:
+    try:
+        booking = await ainsert_booking(museum_id, visitor_name, visitor_email, num_tickets, visit_date)
+    except BookingError as exc:
+        return f"Booking not created: {exc}"
+
+    return describe_booking(booking)
+
+create_booking = StructuredTool.from_function(func=_create_booking, coroutine=_acreate_booking, name="create_booking")
@@ -0,0 +1,46 @@
+from pydantic import BaseModel, Field
+from langchain_core.tools import StructuredTool
+
+from helpers.bookings import insert_bookings, ainsert_bookings, describe_bookings, BookingError
+
+class BookingDetails(BaseModel):
+    '''One booking of a group'''
+    museum_id: int = Field(..., description="id of the museum, get it with lookup_museum")
+    visitor_name: str = Field(..., description="full name of the visitor")
+    visitor_email: str = Field(..., description="contact email")
+    num_tickets: int = Field(..., description="number of tickets, at least 1")
+    visit_date: str = Field(..., description="day of the visit in YYYY-MM-DD format, today or later")
+
+def _as_dicts(bookings):
+    return [booking.model_dump() if isinstance(booking, BaseModel) else dict(booking) for booking in bookings]
+
+def _create_bookings(bookings: list[BookingDetails]) -> str:
+    '''
+        Create several ticket bookings at once, for group or school visits where every visitor
+        or sub-group needs its own booking. Only call it after the user confirmed the summary.
+        All bookings are written together or none is: invalid fields are reported per booking
+        so you can ask the user to correct them.
+
+        Args:
+            bookings: list of bookings, each with museum_id, visitor_name, visitor_email,
+                      num_tickets and visit_date as for create_booking
+
+        Returns every created booking with its ticket_id, or the reasons nothing was created
+    '''
+
+    try:
+        created = insert_bookings(_as_dicts(bookings))
+    except BookingError as exc:
+        return f"Bookings not created: {exc}"
+
+    return describe_bookings(created)
+
+async def _acreate_bookings(bookings: list[BookingDetails]) -> str:
+    try:
+        created = await ainsert_bookings(_as_dicts(bookings))
+    except BookingError as exc:
+        return f"Bookings not created: {exc}"
+
+    return describe_bookings(created)
+
+create_bookings = StructuredTool.from_function(func=_create_bookings, coroutine=_acreate_bookings, name="create_bookings")
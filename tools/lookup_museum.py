@@ -0,0 +1,24 @@
+from langchain_core.tools import StructuredTool
+
+from helpers.museum_catalog import museum_catalog, format_matches
+
+def _lookup_museum(query: str, limit: int = 3) -> str:
+    '''
+        Find museums by name, city or state, spelling mistakes and partial names are fine.
+        Use it instead of read_db to resolve a museum name to its museum_id,
+        or to list the museums of a city or state.
+        For example: "museum of art", "chicago", "natural histry"
+
+        Args:
+            query: string - museum name, city or state to search for
+            limit: int - how many museums to return, best match first
+
+        Returns one line per museum with museum_id, name, location, opening hours and contact details
+    '''
+
+    return format_matches(museum_catalog.search(query, limit))
+
+async def _alookup_museum(query: str, limit: int = 3) -> str:
+    return format_matches(await museum_catalog.asearch(query, limit))
+
+lookup_museum = StructuredTool.from_function(func=_lookup_museum, coroutine=_alookup_museum, name="lookup_museum")
@@ -1,11 +1,17 @@
-from langchain.tools import tool
+from langchain_core.tools import StructuredTool
+from sqlalchemy.exc import DBAPIError
 
-from helpers.query_checker import check_query
-from helpers.get_db import get_db
-from config.config import db_uri
+from helpers.query_checker import check_query, acheck_query
+from helpers.query_guard import query_guard, is_cancelled, cancelled_message
+from helpers.metrics import record_query_guard
+from helpers.get_db import run, arun
+from helpers.result_format import limits_for
+from helpers.result_cache import result_cache
+from config.config import get_db_uri, get_async_db_uri
 
-@tool
-def read_db(query: str) -> str:
+unsafe_message = "The query given by you is not safe to read the records. Try again with some other query"
+
+def _read_db(query: str) -> str:
     '''
         This is the tool to call the db and read the values from it,
         we will be having only 2 table which includes ticket booking and museum details
@@ -23,10 +29,52 @@ def read_db(query: str) -> str:
     isSafe = check_query(query, "read")
 
     if not isSafe:
-        return "The query given by you is not safe to read the records. Try again with some other query"
+        return unsafe_message
     
-    # send the uri
-    db = get_db(db_uri)
-    query_ans = db.run(query)
+    # unbounded SELECTs get a LIMIT, queries the planner expects to be too expensive are sent back
+    uri = get_db_uri()
+    guarded = query_guard.check(uri, query)
+    if guarded.rejection:
+        return guarded.rejection
+
+    # repeated lookups are answered from the result cache, rows are streamed and capped
+    limits = limits_for("read_db", guarded.row_limit)
+    try:
+        query_ans = result_cache.read_through(
+            guarded.query,
+            lambda: run(uri, guarded.query, limits, stream=True, timeout_ms=guarded.timeout_ms, read_only=True),
+        )
+    except DBAPIError as error:
+        if not is_cancelled(error):
+            raise
+        record_query_guard("cancelled")
+        return cancelled_message
+
+    return query_ans
+
+async def _aread_db(query: str) -> str:
+    isSafe = await acheck_query(query, "read")
+
+    if not isSafe:
+        return unsafe_message
+
+    uri = get_async_db_uri()
+    guarded = await query_guard.acheck(uri, query)
+    if guarded.rejection:
+        return guarded.rejection
+
+    limits = limits_for("read_db", guarded.row_limit)
+    try:
+        query_ans = await result_cache.aread_through(
+            guarded.query,
+            lambda: arun(uri, guarded.query, limits, stream=True, timeout_ms=guarded.timeout_ms, read_only=True),
+        )
+    except DBAPIError as error:
+        if not is_cancelled(error):
+            raise
+        record_query_guard("cancelled")
+        return cancelled_message
+
+    return query_ans
 
-    return query_ans
\ No newline at end of file
+read_db = StructuredTool.from_function(func=_read_db, coroutine=_aread_db, name="read_db")
@@ -1,16 +1,36 @@
-from langchain.tools import tool
+from langchain_core.tools import StructuredTool
 
-from helpers.query_checker import check_query
-from helpers.get_db import get_db
-from config.config import db_uri
+from helpers.query_checker import check_query, acheck_query
+from helpers.get_db import run, arun
+from helpers.result_format import limits_for
+from helpers.result_cache import result_cache, written_tables
+from helpers.museum_catalog import museum_catalog
+from helpers.sql_parser import SQLParseError, tokenize, split_statements, word, write_targets
+from config.config import get_db_uri, get_async_db_uri
 
-@tool
-def write_and_update_db(query: str) -> str:
+unsafe_message = "The query given by you is not safe to write or update the records. Try again with some other query"
+booking_message = "New tickets are not inserted with write_and_update_db. Use create_booking, or create_bookings for a group, to book them"
+
+
+def _inserts_tickets(query):
+    '''True when a statement of query inserts into tickets, bookings go through create_booking so capacity is checked'''
+    try:
+        statements = split_statements(tokenize(query))
+    except SQLParseError:
+        return False
+
+    for tokens in statements:
+        if "tickets" in write_targets(tokens) and any(word(token) == "INSERT" for token in tokens):
+            return True
+    return False
+
+
+def _write_and_update_db(query: str) -> str:
     """
     Write and update database queries for the allowed application tables.
     Description:
         Constructs or modifies SQL queries intended for safe execution against the
-        application's permitted tables (e.g., ticket_booking and museum_details).
+        application's permitted tables (tickets and museums).
         The function validates the provided SQL with a safety check before attempting
         execution and only executes queries that pass the validation.
     Parameters:
@@ -23,7 +43,8 @@ def write_and_update_db(query: str) -> str:
              when the query is rejected for safety reasons.
     Allowed operations:
         - Safe reads: SELECT queries that do not leak sensitive data.
-        - Inserts: INSERT statements to add new records to the allowed tables.
+        - Inserts: INSERT statements to add new records to the allowed tables. New ticket
+                   bookings are refused here, they are made with create_booking or create_bookings.
         - Updates: UPDATE statements that modify records in the allowed tables,
                    preferably with well-scoped WHERE clauses.
     Disallowed or restricted operations:
@@ -44,19 +65,19 @@ def write_and_update_db(query: str) -> str:
         - The tool will never autonomously execute commands that modify schema or perform
           irreversible data loss without affirmative user confirmation.
     Usage guidance / examples:
-        - Build an INSERT to add a new ticket booking record.
         - Edit an UPDATE to narrow a WHERE clause to a single record.
         - Compose a SELECT to read museum details while respecting privacy constraints.
     Implementation notes:
         - Validation is performed prior to database access (e.g., check_query(query, "write")).
-        - Database execution is performed via the configured DB client (e.g., get_db(db_uri).run(query)).
+        - Database execution is performed by helpers.get_db.run on the pooled engine of the configured
+          DATABASE_URI, in its own transaction, with the row and size limits of write_and_update_db.
         - If the safety check fails, the function returns a clear error/guidance message and does not run the query.
     """
     '''
         This tool helps write and edit the prompt (SQL query) before it's validated and executed.
-        Use it to construct or modify queries for the two tables: ticket booking and museum details.
+        Use it to construct or modify queries for the two tables: tickets and museums.
         Examples:
-            - Build an INSERT or UPDATE to add or change records.
+            - Build an UPDATE to change records.
             - Edit a WHERE clause to refine which records are read or updated.
         Args:
             query: str - the SQL query or prompt to write/edit.
@@ -65,14 +86,44 @@ def write_and_update_db(query: str) -> str:
             - Only generate safe read/insert/update queries for the allowed tables.
     '''
 
+    if _inserts_tickets(query):
+        return booking_message
+
     # check with llm for the rightfulness of the query
     isSafe = check_query(query, "write")
 
     if not isSafe:
-        return "The query given by you is not safe to write or update the records. Try again with some other query"
+        return unsafe_message
     
-    # send the uri
-    db = get_db(db_uri)
-    query_ans = db.run(query)
+    # writes are not streamed, a server-side cursor only works for SELECT
+    query_ans = run(get_db_uri(), query, limits_for("write_and_update_db"))
+
+    # cached reads of the modified tables are stale now
+    tables = written_tables(query)
+    result_cache.invalidate_tables(tables)
+    museum_catalog.invalidate(tables)
+
+    return query_ans
+
+async def _awrite_and_update_db(query: str) -> str:
+    if _inserts_tickets(query):
+        return booking_message
+
+    isSafe = await acheck_query(query, "write")
+
+    if not isSafe:
+        return unsafe_message
+
+    query_ans = await arun(get_async_db_uri(), query, limits_for("write_and_update_db"))
+
+    tables = written_tables(query)
+    result_cache.invalidate_tables(tables)
+    museum_catalog.invalidate(tables)
+
+    return query_ans
 
-    return query_ans
\ No newline at end of file
+write_and_update_db = StructuredTool.from_function(
+    func=_write_and_update_db,
+    coroutine=_awrite_and_update_db,
+    name="write_and_update_db",
+)